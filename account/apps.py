@@ -7,3 +7,7 @@ class AccountConfig(AppConfig):
 
     def ready(self):
         import account.signals
+        from django.contrib.auth.hashers import get_hashers
+
+        # Misconfigured hashers, e.g. the fast profile in production, fail at startup rather than on the first login.
+        get_hashers()
@@ -0,0 +1,179 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .models import AuthToken
+
+logger = logging.getLogger(__name__)
+
+# User columns kept with a cached token: all but the password hash, which never leaves the database.
+CACHED_FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname != "password"]
+
+
+def get_cache():
+    return caches[settings.ACCOUNT_TOKEN_CACHE]
+
+
+class TokenCache:
+    """
+    Recently validated tokens and their users, in an in-process LRU backed by a shared cache.
+
+    Entries are dropped from both when a token is deleted or its user changes, but only from the LRU of the process
+    making the change: other processes keep theirs for up to ``ACCOUNT_TOKEN_CACHE_LOCAL_TIMEOUT`` seconds.
+    """
+
+    def __init__(self):
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shared_key(key: str) -> str:
+        # Tokens are credentials, so only their digest is used as a cache key.
+        return "account:token:{}".format(hashlib.sha256(key.encode()).hexdigest())
+
+    def get(self, key: str) -> Optional[AuthToken]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                values, expires = entry
+                if expires > time.monotonic():
+                    self._local.move_to_end(key)
+                    return self._token(key, values)
+                del self._local[key]
+
+        values = get_cache().get(self._shared_key(key))
+        if values is None:
+            return None
+        self._remember(key, values)
+        return self._token(key, values)
+
+    def set(self, token: AuthToken) -> None:
+        values = [token.expires] + [getattr(token.user, field) for field in CACHED_FIELDS]
+        get_cache().set(self._shared_key(token.key), values, settings.ACCOUNT_TOKEN_CACHE_TIMEOUT)
+        self._remember(token.key, values)
+
+    def invalidate(self, keys: Iterable[str]) -> None:
+        """
+        Forget the given tokens.
+
+        They are dropped straight away, and again once the current transaction commits so that a request reading
+        the old rows in the meantime does not cache them back.
+        """
+        keys = list(keys)
+        if not keys:
+            return
+        with self._lock:
+            for key in keys:
+                self._local.pop(key, None)
+        shared_keys = [self._shared_key(key) for key in keys]
+        get_cache().delete_many(shared_keys)
+        transaction.on_commit(lambda: get_cache().delete_many(shared_keys))
+
+    def clear(self) -> None:
+        """Empty the in-process LRU, the shared cache is cleared with the cache itself."""
+        with self._lock:
+            self._local.clear()
+
+    def _remember(self, key: str, values: List) -> None:
+        with self._lock:
+            self._local[key] = (values, time.monotonic() + settings.ACCOUNT_TOKEN_CACHE_LOCAL_TIMEOUT)
+            self._local.move_to_end(key)
+            while len(self._local) > settings.ACCOUNT_TOKEN_CACHE_LOCAL_SIZE:
+                self._local.popitem(last=False)
+
+    @staticmethod
+    def _token(key: str, values: List) -> AuthToken:
+        # Fresh instances per request, as if loaded from the database, so requests never share one.
+        user = User.from_db(DEFAULT_DB_ALIAS, CACHED_FIELDS, values[1:])
+        return AuthToken(key=key, user=user, expires=values[0])
+
+
+token_cache = TokenCache()
+
+
+class TokenUsage:
+    """
+    The tokens used since the last flush, written as their ``last_used`` time in one update per batch.
+
+    Requests only record their token in memory, and the buffer is flushed once every
+    ``ACCOUNT_TOKEN_LAST_USED_INTERVAL`` seconds after a response is sent, so authentication never writes. The
+    time written is the flush time, at most one interval after the actual use, and the usage buffered when a
+    process stops is lost.
+    """
+
+    def __init__(self):
+        self._keys = set()
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def touch(self, key: str) -> None:
+        with self._lock:
+            self._keys.add(key)
+
+    def flush_if_due(self) -> None:
+        if time.monotonic() - self._flushed >= settings.ACCOUNT_TOKEN_LAST_USED_INTERVAL:
+            try:
+                self.flush()
+            except DatabaseError:
+                logger.exception("Could not record when tokens were last used.")
+
+    def flush(self) -> int:
+        """Write the buffered usage, returning the number of tokens updated."""
+        with self._lock:
+            keys, self._keys = sorted(self._keys), set()
+            self._flushed = time.monotonic()
+        now = timezone.now()
+        batch_size = settings.ACCOUNT_TOKEN_LAST_USED_BATCH_SIZE
+        for start in range(0, len(keys), batch_size):
+            AuthToken.objects.filter(key__in=keys[start : start + batch_size]).update(last_used=now)
+        return len(keys)
+
+    def reset(self) -> None:
+        """Drop the buffered usage without writing it."""
+        with self._lock:
+            self._keys.clear()
+            self._flushed = time.monotonic()
+
+
+token_usage = TokenUsage()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Authentication by ``AuthToken``, without the token and user query on every request.
+
+    Valid tokens are cached with their user by ``token_cache`` and the database is only queried on a miss. The
+    ``AuthToken`` set as ``request.auth`` on a hit is not loaded from the database either, and requests do not
+    write their token's ``last_used`` time, ``token_usage`` does it in batches.
+    """
+
+    model = AuthToken
+
+    def authenticate_credentials(self, key: str) -> Tuple[User, AuthToken]:
+        token = token_cache.get(key)
+        if token is None:
+            try:
+                token = AuthToken.objects.select_related("user").get(key=key)
+            except AuthToken.DoesNotExist:
+                raise AuthenticationFailed(_("Invalid token."))
+            if token.user.is_active and not token.is_expired:
+                token_cache.set(token)
+
+        if not token.user.is_active:
+            raise AuthenticationFailed(_("User inactive or deleted."))
+        if token.is_expired:
+            raise AuthenticationFailed(_("Token has expired."))
+        token_usage.touch(key)
+        return token.user, token
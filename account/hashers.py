@@ -0,0 +1,135 @@
+import base64
+import hashlib
+import sys
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    Argon2PasswordHasher,
+    BasePasswordHasher,
+    MD5PasswordHasher,
+    PBKDF2PasswordHasher,
+    mask_hash,
+    must_update_salt,
+)
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.crypto import constant_time_compare
+from django.utils.translation import gettext_noop as _
+
+# The hashers below read their cost from the settings, so it can be tuned per environment. Passwords hashed with
+# other parameters still verify, and are hashed again with the configured ones when their user next logs in.
+
+
+def testing() -> bool:
+    """Whether the tests are running, with pytest or ``manage.py test``."""
+    return "pytest" in sys.modules or sys.argv[1:2] == ["test"]
+
+
+class FastPasswordHasher(MD5PasswordHasher):
+    """
+    A single round of MD5, so the tests do not spend most of their time hashing passwords. Its hashes are cracked at
+    billions of guesses per second, so it refuses to be used unless DEBUG is on or the tests are running.
+    """
+
+    def __init__(self):
+        if not (settings.DEBUG or testing()):
+            raise ImproperlyConfigured("The 'fast' password hashing profile is only allowed with DEBUG or in tests.")
+
+
+class TunedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self) -> int:
+        return settings.ACCOUNT_PBKDF2_ITERATIONS
+
+
+class TunedArgon2PasswordHasher(Argon2PasswordHasher):
+    """Argon2, which needs the argon2-cffi package."""
+
+    @property
+    def time_cost(self) -> int:
+        return settings.ACCOUNT_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self) -> int:
+        return settings.ACCOUNT_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self) -> int:
+        return settings.ACCOUNT_ARGON2_PARALLELISM
+
+
+class ScryptPasswordHasher(BasePasswordHasher):
+    """
+    Memory-hard hashing with scrypt from hashlib, so it needs no extra package.
+
+    Hashes are stored as ``scrypt$<n>$<salt>$<r>$<p>$<hash>``, the format of the scrypt hasher of later Django
+    versions. Each hash needs ``128 * n * r * p`` bytes of memory.
+    """
+
+    algorithm = "scrypt"
+    dklen = 64
+
+    @property
+    def work_factor(self) -> int:
+        return settings.ACCOUNT_SCRYPT_N
+
+    @property
+    def block_size(self) -> int:
+        return settings.ACCOUNT_SCRYPT_R
+
+    @property
+    def parallelism(self) -> int:
+        return settings.ACCOUNT_SCRYPT_P
+
+    def encode(self, password, salt, n=None, r=None, p=None):
+        assert password is not None
+        assert salt and "$" not in salt
+        n = n or self.work_factor
+        r = r or self.block_size
+        p = p or self.parallelism
+        hash_ = hashlib.scrypt(
+            password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=2 * 128 * n * r * p, dklen=self.dklen
+        )
+        return "{}${}${}${}${}${}".format(self.algorithm, n, salt, r, p, base64.b64encode(hash_).decode("ascii"))
+
+    def decode(self, encoded):
+        algorithm, work_factor, salt, block_size, parallelism, hash_ = encoded.split("$", 6)
+        assert algorithm == self.algorithm
+        return {
+            "algorithm": algorithm,
+            "work_factor": int(work_factor),
+            "salt": salt,
+            "block_size": int(block_size),
+            "parallelism": int(parallelism),
+            "hash": hash_,
+        }
+
+    def verify(self, password, encoded):
+        decoded = self.decode(encoded)
+        encoded_2 = self.encode(
+            password, decoded["salt"], decoded["work_factor"], decoded["block_size"], decoded["parallelism"]
+        )
+        return constant_time_compare(encoded, encoded_2)
+
+    def safe_summary(self, encoded):
+        decoded = self.decode(encoded)
+        return {
+            _("algorithm"): decoded["algorithm"],
+            _("work factor"): decoded["work_factor"],
+            _("block size"): decoded["block_size"],
+            _("parallelism"): decoded["parallelism"],
+            _("salt"): mask_hash(decoded["salt"]),
+            _("hash"): mask_hash(decoded["hash"]),
+        }
+
+    def must_update(self, encoded):
+        decoded = self.decode(encoded)
+        return (
+            decoded["work_factor"] != self.work_factor
+            or decoded["block_size"] != self.block_size
+            or decoded["parallelism"] != self.parallelism
+            or must_update_salt(decoded["salt"], self.salt_entropy)
+        )
+
+    def harden_runtime(self, password, encoded):
+        # The runtime for scrypt is too complicated to emulate.
+        pass
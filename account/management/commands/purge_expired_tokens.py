@@ -0,0 +1,22 @@
+from account.models import AuthToken
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Delete expired authentication tokens, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of tokens deleted per batch.")
+
+    def handle(self, *args, batch_size, **options):
+        # Short deletes by primary key, rather than one long statement locking every expired row at once.
+        deleted = 0
+        while True:
+            keys = list(AuthToken.objects.expired().values_list("key", flat=True)[:batch_size])
+            if not keys:
+                break
+            AuthToken.objects.filter(key__in=keys).delete()
+            deleted += len(keys)
+            self.stdout.write("Deleted {} tokens.".format(len(keys)))
+
+        self.stdout.write(self.style.SUCCESS("Deleted {} expired tokens.".format(deleted)))
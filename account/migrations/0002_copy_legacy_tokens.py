@@ -0,0 +1,34 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:05
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+
+def copy_legacy_tokens(apps, schema_editor):
+    # Tokens issued before they expired keep working, for a full lifetime from now.
+    Token = apps.get_model('authtoken', 'Token')
+    AuthToken = apps.get_model('account', 'AuthToken')
+    expires = timezone.now() + timedelta(seconds=settings.ACCOUNT_TOKEN_LIFETIME)
+    tokens = Token.objects.values_list('key', 'user_id', 'created').iterator()
+    batch = []
+    for key, user_id, created in tokens:
+        batch.append(AuthToken(key=key, user_id=user_id, created=created, expires=expires))
+        if len(batch) == 1000:
+            AuthToken.objects.bulk_create(batch)
+            batch = []
+    AuthToken.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0001_initial'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_legacy_tokens, migrations.RunPython.noop),
+    ]
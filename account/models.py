@@ -1,3 +1,68 @@
-from django.db import models
+import binascii
+import os
+from datetime import datetime, timedelta
 
-# Create your models here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import models, transaction
+from django.utils import timezone
+
+
+def generate_key() -> str:
+    return binascii.hexlify(os.urandom(20)).decode()
+
+
+def default_expiry() -> datetime:
+    return timezone.now() + timedelta(seconds=settings.ACCOUNT_TOKEN_LIFETIME)
+
+
+class AuthTokenQuerySet(models.QuerySet):
+    def valid(self) -> "AuthTokenQuerySet":
+        return self.filter(expires__gt=timezone.now())
+
+    def expired(self) -> "AuthTokenQuerySet":
+        return self.filter(expires__lte=timezone.now())
+
+
+class AuthTokenManager(models.Manager.from_queryset(AuthTokenQuerySet)):
+    def issue(self, user: User) -> "AuthToken":
+        return self.create(user=user)
+
+    def for_login(self, user: User) -> "AuthToken":
+        """
+        The user's newest valid token, or a new one once that was issued ``ACCOUNT_TOKEN_ROTATE_AFTER`` seconds
+        ago. Older tokens stay valid until they expire, so other sessions are not logged out.
+        """
+        fresh = timezone.now() - timedelta(seconds=settings.ACCOUNT_TOKEN_ROTATE_AFTER)
+        token = self.valid().filter(user=user, created__gt=fresh).order_by("-created").first()
+        return token or self.issue(user)
+
+    def rotate(self, token: "AuthToken") -> "AuthToken":
+        """Replace a token with a new one for the same user, the old one stops working straight away."""
+        with transaction.atomic():
+            self.filter(key=token.key).delete()
+            return self.issue(token.user)
+
+
+class AuthToken(models.Model):
+    """
+    An API token, valid until it expires or is rotated.
+
+    ``last_used`` is written in periodic batches rather than on each request, see ``TokenUsage``, so it may lag
+    behind by up to ``ACCOUNT_TOKEN_LAST_USED_INTERVAL`` seconds.
+    """
+
+    key = models.CharField(max_length=40, primary_key=True, default=generate_key, editable=False)
+    user = models.ForeignKey(to=User, on_delete=models.CASCADE, related_name="auth_tokens")
+    created = models.DateTimeField(default=timezone.now)
+    expires = models.DateTimeField(default=default_expiry, db_index=True)
+    last_used = models.DateTimeField(null=True, blank=True)
+
+    objects = AuthTokenManager()
+
+    def __str__(self):
+        return "Token of {} - Expires: {}".format(self.user_id, self.expires)
+
+    @property
+    def is_expired(self) -> bool:
+        return self.expires <= timezone.now()
@@ -1,4 +1,6 @@
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 
 
@@ -6,10 +8,22 @@ class CreateUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['username', 'password']
-        extra_kwargs = {'password': {'write_only': True}}
+        extra_kwargs = {
+            'password': {'write_only': True},
+            # Taken usernames are rejected by the insert, rather than by a query of their own beforehand.
+            'username': {'validators': [UnicodeUsernameValidator()]},
+        }
 
     def create(self, validated_data):
         user = User(username=validated_data['username'])
+        # Hashed before the transaction, so it holds no lock while the CPU works. hashlib releases the GIL while
+        # hashing, so registrations served by other threads run in parallel.
         user.set_password(validated_data['password'])
-        user.save()
+        # The user and its token, issued by the post_save signal, are created together or not at all.
+        try:
+            with transaction.atomic():
+                user.save()
+        except IntegrityError:
+            message = User._meta.get_field('username').error_messages['unique']
+            raise serializers.ValidationError({'username': [message]})
         return user
@@ -1,10 +1,33 @@
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
-from rest_framework.authtoken.models import Token
+
+from .authentication import token_cache, token_usage
+from .models import AuthToken
 
 
 @receiver(post_save, sender=User)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     if created:
-        Token.objects.create(user=instance)
+        # Kept on the user, so the registration response does not query it back.
+        instance.issued_token = AuthToken.objects.issue(instance)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance=None, created=False, **kwargs):
+    """Cached tokens carry a copy of their user, e.g. whether it is active, so they go when the user changes."""
+    if not created:
+        token_cache.invalidate(AuthToken.objects.filter(user=instance).values_list("key", flat=True))
+
+
+@receiver(post_save, sender=AuthToken)
+@receiver(post_delete, sender=AuthToken)
+def invalidate_token(sender, instance=None, **kwargs):
+    token_cache.invalidate([instance.key])
+
+
+@receiver(request_finished)
+def record_token_usage(sender, **kwargs):
+    # Once the response is sent, so the write is never on a request's critical path.
+    token_usage.flush_if_due()
@@ -1,6 +1,6 @@
 from rest_framework import serializers
-from rest_framework.fields import UUIDField
 
 
 class SwaggerAuthSerializer(serializers.Serializer):
-    token = UUIDField()
+    token = serializers.CharField(source="key")
+    expires = serializers.DateTimeField()
@@ -1,8 +1,9 @@
 from django.urls import path
 
-from .views import UserLogin, UserRegistration
+from .views import RotateToken, UserLogin, UserRegistration
 
 urlpatterns = [
     path('register/', UserRegistration.as_view(), name='register'),
     path('login/', UserLogin.as_view(), name='login'),
+    path('token/rotate/', RotateToken.as_view(), name='rotate_token'),
 ]
@@ -1,15 +1,21 @@
 from drf_yasg.utils import swagger_auto_schema
 from rest_framework import status
-from rest_framework.authtoken.models import Token
 from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.generics import CreateAPIView
 from rest_framework.permissions import AllowAny
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from .models import AuthToken
 from .serializers import CreateUserSerializer
 from .swagger_utils import SwaggerAuthSerializer
 
 
+def token_response(token: AuthToken, status_code: int = status.HTTP_200_OK) -> Response:
+    return Response(SwaggerAuthSerializer(token).data, status=status_code)
+
+
 class UserRegistration(CreateAPIView):
     serializer_class = CreateUserSerializer
     permission_classes = [
@@ -26,8 +32,7 @@ class UserRegistration(CreateAPIView):
         serializer = self.serializer_class(data=request.data)
         if serializer.is_valid(raise_exception=True):
             account = serializer.save()
-            user_info = {"token": Token.objects.get(user=account).key}
-            return Response(data=user_info, status=201)
+            return token_response(account.issued_token, status.HTTP_201_CREATED)
         return Response({"message": "Account could not be created"}, status=400)
 
 
@@ -41,5 +46,16 @@ class UserLogin(ObtainAuthToken):
         serializer = self.serializer_class(data=request.data, context={"request": request})
         if serializer.is_valid(raise_exception=True):
             user = serializer.validated_data["user"]
-            token, created = Token.objects.get_or_create(user=user)
-            return Response({"token": token.key}, status=status.HTTP_200_OK)
+            return token_response(AuthToken.objects.for_login(user))
+
+
+class RotateToken(APIView):
+    @swagger_auto_schema(
+        request_body=None,
+        responses={
+            status.HTTP_200_OK: SwaggerAuthSerializer,
+        },
+    )
+    def post(self, request: Request) -> Response:
+        """Replace the token the request is authenticated with, which stops working straight away."""
+        return token_response(AuthToken.objects.rotate(request.auth))
@@ -1,7 +1,8 @@
 """
 ASGI config for imagerepo project.
 
-It exposes the ASGI callable as a module-level variable named ``application``.
+It exposes the ASGI callable as a module-level variable named ``application``, which streams responses from a thread
+rather than the event loop (see ``imagerepo.handlers``).
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
@@ -9,8 +10,10 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from imagerepo.handlers import ASGIHandler
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'imagerepo.settings')
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+application = ASGIHandler()
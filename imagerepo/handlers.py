@@ -0,0 +1,39 @@
+from asgiref.sync import sync_to_async
+from django.core.handlers import asgi
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django's ASGI handler, iterating streaming responses on the thread of sync views rather than on the event loop.
+
+    The content of a streaming response may be generated as it is sent, e.g. exports query the database and wait on
+    storage between chunks: neither is allowed on the event loop, where it would hold up every other request.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        response_headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            response_headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            response_headers.append((b"Set-Cookie", cookie.output(header="").encode("ascii").strip()))
+        await send({"type": "http.response.start", "status": response.status_code, "headers": response_headers})
+
+        # The same thread the view ran on, where its database connection lives.
+        parts = iter(response)
+        next_part = sync_to_async(next, thread_sensitive=True)
+        done = object()
+        while True:
+            part = await next_part(parts, done)
+            if part is done:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body"})
+        await sync_to_async(response.close, thread_sensitive=True)()
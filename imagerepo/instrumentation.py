@@ -0,0 +1,233 @@
+import asyncio
+import bisect
+import json
+import logging
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets, in milliseconds for durations and in queries for query counts.
+DURATION_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_current: ContextVar[Optional["RequestRecord"]] = ContextVar("instrumentation_record", default=None)
+
+
+class RequestRecord:
+    """
+    The time a sampled request spends in each phase, such as ``db``, ``storage``, ``parse`` or ``serialize``.
+
+    Phases may nest, e.g. storage writes made while an upload is parsed count towards both, and phases run in
+    worker threads are summed, so they can add up to more than the request's duration.
+    """
+
+    def __init__(self):
+        self.durations: Dict[str, float] = defaultdict(float)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.total = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, phase: str, seconds: float) -> None:
+        with self._lock:
+            self.durations[phase] += seconds
+            self.counts[phase] += 1
+
+    def server_timing(self) -> str:
+        metrics = ["total;dur={:.1f}".format(self.total * 1000)]
+        for phase, seconds in sorted(self.durations.items()):
+            unit = "queries" if phase == "db" else "calls"
+            metrics.append('{};dur={:.1f};desc="{} {}"'.format(phase, seconds * 1000, self.counts[phase], unit))
+        return ", ".join(metrics)
+
+    def as_dict(self) -> Dict[str, float]:
+        data = {"duration_ms": round(self.total * 1000, 3), "queries": self.counts.get("db", 0)}
+        for phase, seconds in self.durations.items():
+            data["{}_ms".format(phase)] = round(seconds * 1000, 3)
+            if phase != "db":
+                data["{}_calls".format(phase)] = self.counts[phase]
+        return data
+
+
+def time_query(execute, sql, params, many, context):
+    """A database execute wrapper adding the time of every query to the ``db`` phase of a sampled request."""
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    start = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        record.add("db", perf_counter() - start)
+
+
+def install_query_timer(connection, **kwargs) -> None:
+    # Installed on every connection rather than around each request, so that queries made from other threads,
+    # such as those of async views, are timed as well.
+    if time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(time_query)
+
+
+connection_created.connect(lambda sender, connection, **kwargs: install_query_timer(connection))
+
+
+@contextmanager
+def timed(phase: str):
+    """Add the time spent in the block to ``phase`` of the current request, if the request is sampled."""
+    record = _current.get()
+    if record is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        record.add(phase, perf_counter() - start)
+
+
+class Histogram:
+    """Counts of observations falling under each bucket's upper bound, along with their sum."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def snapshot(self) -> Dict:
+        cumulative, buckets = 0, []
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            cumulative += count
+            buckets.append({"le": bound, "count": cumulative})
+        snapshot = {"buckets": buckets, "count": cumulative, "sum": round(self.sum, 3)}
+        # Quantiles are estimated by the upper bound of the bucket they fall in.
+        for name, quantile in (("p50", 0.5), ("p99", 0.99)):
+            snapshot[name] = next(
+                (bucket["le"] for bucket in buckets if cumulative and bucket["count"] >= quantile * cumulative), None
+            )
+        return snapshot
+
+
+class Metrics:
+    """
+    Histograms of the sampled requests' records, by route and metric.
+
+    They are kept in memory, so every server process aggregates the requests it handled.
+    """
+
+    def __init__(self):
+        self._histograms: Dict[str, Dict[str, Histogram]] = defaultdict(dict)
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, record: Dict[str, float]) -> None:
+        with self._lock:
+            histograms = self._histograms[route]
+            for metric, value in record.items():
+                if metric == "queries" or metric.endswith("_ms"):
+                    if metric not in histograms:
+                        histograms[metric] = Histogram(COUNT_BUCKETS if metric == "queries" else DURATION_BUCKETS)
+                    histograms[metric].observe(value)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                route: {metric: histogram.snapshot() for metric, histogram in sorted(histograms.items())}
+                for route, histograms in sorted(self._histograms.items())
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+metrics = Metrics()
+
+
+class InstrumentationMiddleware:
+    """
+    Time a sample of requests, split into database queries, storage calls, parsing and serialization.
+
+    Sampled responses get a ``Server-Timing`` header, their record is logged as JSON and added to the histograms
+    served by the metrics endpoint. Other requests only pay for drawing the sample. It should come first in
+    ``MIDDLEWARE``, so the total covers the other middleware. It runs natively under both WSGI and ASGI.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+
+        for connection in connections.all():
+            install_query_timer(connection)
+        record = RequestRecord()
+        token = _current.set(record)
+        start = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        record.total = perf_counter() - start
+        return self.report(request, response, record)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+
+        record = RequestRecord()
+        token = _current.set(record)
+        start = perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        record.total = perf_counter() - start
+        return self.report(request, response, record)
+
+    @staticmethod
+    def sampled() -> bool:
+        return random.random() < settings.INSTRUMENTATION_SAMPLE_RATE
+
+    def report(self, request, response, record: RequestRecord):
+        response["Server-Timing"] = record.server_timing()
+        data = record.as_dict()
+        route = self.get_route(request)
+        metrics.observe(route, data)
+        data.update(method=request.method, route=route, status=response.status_code)
+        logger.info(json.dumps(data), extra={"request_record": data})
+        return response
+
+    def process_template_response(self, request, response):
+        # Responses, including DRF's, are rendered once every middleware has had the chance to change them.
+        record = _current.get()
+        if record is not None:
+            start = perf_counter()
+            response.add_post_render_callback(lambda response: record.add("render", perf_counter() - start))
+        return response
+
+    @staticmethod
+    def get_route(request) -> str:
+        # Group requests by URL pattern rather than path, so the number of histograms stays bounded.
+        match = getattr(request, "resolver_match", None)
+        return match.view_name if match is not None else "unmatched"
+
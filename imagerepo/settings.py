@@ -26,7 +26,7 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 SECRET_KEY = config('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = config("DEBUG")
+DEBUG = config("DEBUG", cast=bool)
 
 ALLOWED_HOSTS = []
 
@@ -41,6 +41,7 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     # Third Party packages
+    # Only holds the tokens issued before account.AuthToken, which its migrations copy.
     'rest_framework.authtoken',
     'drf_yasg',
     'storages',
@@ -50,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'imagerepo.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,6 +92,73 @@ DATABASES = {
     }
 }
 
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# Use a cache shared by every process in production, e.g. django.core.cache.backends.memcached.PyMemcacheCache
+# or django.core.cache.backends.redis.RedisCache, so that derivative workers can invalidate cached responses.
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default=''),
+    }
+}
+
+
+# Authenticated tokens are cached in this cache for this many seconds, and in a per-process LRU of this many tokens
+# for this many seconds. A deleted token may still be accepted by other processes until it expires from their LRU.
+ACCOUNT_TOKEN_CACHE = config('ACCOUNT_TOKEN_CACHE', default='default')
+ACCOUNT_TOKEN_CACHE_TIMEOUT = config('ACCOUNT_TOKEN_CACHE_TIMEOUT', default=300, cast=int)
+ACCOUNT_TOKEN_CACHE_LOCAL_SIZE = config('ACCOUNT_TOKEN_CACHE_LOCAL_SIZE', default=10000, cast=int)
+ACCOUNT_TOKEN_CACHE_LOCAL_TIMEOUT = config('ACCOUNT_TOKEN_CACHE_LOCAL_TIMEOUT', default=10, cast=int)
+# Tokens expire this many seconds after they are issued (30 days by default). Logging in issues a new token once the
+# newest one is older than ACCOUNT_TOKEN_ROTATE_AFTER seconds.
+ACCOUNT_TOKEN_LIFETIME = config('ACCOUNT_TOKEN_LIFETIME', default=30 * 24 * 3600, cast=int)
+ACCOUNT_TOKEN_ROTATE_AFTER = config('ACCOUNT_TOKEN_ROTATE_AFTER', default=24 * 3600, cast=int)
+# When tokens were last used is written once per this many seconds per process, in updates of this many tokens.
+ACCOUNT_TOKEN_LAST_USED_INTERVAL = config('ACCOUNT_TOKEN_LAST_USED_INTERVAL', default=60, cast=int)
+ACCOUNT_TOKEN_LAST_USED_BATCH_SIZE = config('ACCOUNT_TOKEN_LAST_USED_BATCH_SIZE', default=500, cast=int)
+
+
+# Password hashing
+# The profile hashing new passwords: 'default' (Django's PBKDF2), 'pbkdf2', 'scrypt' or 'argon2' (which needs the
+# argon2-cffi package), with the costs below, or 'fast' (MD5), which is refused unless DEBUG is on or the tests run.
+# Passwords hashed by any other profile still verify, and are hashed again with the configured one when their user
+# next logs in.
+ACCOUNT_PASSWORD_HASHING = config('ACCOUNT_PASSWORD_HASHING', default='default')
+ACCOUNT_PBKDF2_ITERATIONS = config('ACCOUNT_PBKDF2_ITERATIONS', default=260000, cast=int)
+# scrypt needs 128 * N * R * P bytes of memory per hash, 16MiB by default.
+ACCOUNT_SCRYPT_N = config('ACCOUNT_SCRYPT_N', default=2 ** 14, cast=int)
+ACCOUNT_SCRYPT_R = config('ACCOUNT_SCRYPT_R', default=8, cast=int)
+ACCOUNT_SCRYPT_P = config('ACCOUNT_SCRYPT_P', default=1, cast=int)
+# Argon2 memory cost is in KiB.
+ACCOUNT_ARGON2_TIME_COST = config('ACCOUNT_ARGON2_TIME_COST', default=2, cast=int)
+ACCOUNT_ARGON2_MEMORY_COST = config('ACCOUNT_ARGON2_MEMORY_COST', default=102400, cast=int)
+ACCOUNT_ARGON2_PARALLELISM = config('ACCOUNT_ARGON2_PARALLELISM', default=8, cast=int)
+
+_PASSWORD_HASHERS = {
+    'default': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'pbkdf2': 'account.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'account.hashers.ScryptPasswordHasher',
+    'argon2': 'account.hashers.TunedArgon2PasswordHasher',
+}
+_FALLBACK_PASSWORD_HASHERS = [
+    'account.hashers.TunedPBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'account.hashers.ScryptPasswordHasher',
+    'account.hashers.TunedArgon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+# The hashers of each profile: the first hashes new passwords, the others verify existing ones.
+ACCOUNT_PASSWORD_HASHING_PROFILES = {
+    name: [hasher] + [fallback for fallback in _FALLBACK_PASSWORD_HASHERS if fallback != hasher]
+    for name, hasher in _PASSWORD_HASHERS.items()
+}
+ACCOUNT_PASSWORD_HASHING_PROFILES['fast'] = [
+    'account.hashers.FastPasswordHasher',
+] + _FALLBACK_PASSWORD_HASHERS
+PASSWORD_HASHERS = ACCOUNT_PASSWORD_HASHING_PROFILES[ACCOUNT_PASSWORD_HASHING]
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -130,7 +199,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'account.authentication.CachedTokenAuthentication',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -139,7 +208,25 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
         'rest_framework.renderers.JSONRenderer',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'imagerepo.throttling.TokenBucketThrottle',
+    ],
+    # Requests per user and endpoint, as "<burst>/<period>": up to <burst> requests at once, refilled evenly over
+    # the period. Endpoints without a rate are not throttled.
+    'DEFAULT_THROTTLE_RATES': {
+        'add_image': config('THROTTLE_ADD_IMAGE_RATE', default='60/min'),
+        'direct_upload': config('THROTTLE_DIRECT_UPLOAD_RATE', default='60/min'),
+        'confirm_direct_upload': config('THROTTLE_CONFIRM_DIRECT_UPLOAD_RATE', default='60/min'),
+        'share_image': config('THROTTLE_SHARE_IMAGE_RATE', default='120/min'),
+        'share_images': config('THROTTLE_SHARE_IMAGES_RATE', default='60/min'),
+        'export_images': config('THROTTLE_EXPORT_IMAGES_RATE', default='10/hour'),
+    },
 }
+# Where the throttles keep their buckets: 'local', in each process, or 'cache', in THROTTLE_CACHE so that every
+# process shares them. At most THROTTLE_LOCAL_SIZE buckets are kept in each process.
+THROTTLE_BACKEND = config('THROTTLE_BACKEND', default='local')
+THROTTLE_CACHE = config('THROTTLE_CACHE', default='default')
+THROTTLE_LOCAL_SIZE = config('THROTTLE_LOCAL_SIZE', default=100000, cast=int)
 
 
 # DRF_YASG
@@ -169,9 +256,87 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # AWS SETTINGS
 AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY')
-DEFAULT_FILE_STORAGE = 'storages.backends.s3boto3.S3Boto3Storage'
+DEFAULT_FILE_STORAGE = 'images.storage.PooledS3Storage'
+# Keep the files read from storage in a cache on local disk, shared by the processes of a server, of at most
+# IMAGES_STORAGE_CACHE_SIZE bytes (1 GiB by default).
+IMAGES_STORAGE_CACHE = config('IMAGES_STORAGE_CACHE', default=False, cast=bool)
+IMAGES_STORAGE_CACHE_DIR = config('IMAGES_STORAGE_CACHE_DIR', default=os.path.join(BASE_DIR, 'storage-cache'))
+IMAGES_STORAGE_CACHE_SIZE = config('IMAGES_STORAGE_CACHE_SIZE', default=1024 ** 3, cast=int)
+IMAGES_STORAGE_CACHE_BACKEND = DEFAULT_FILE_STORAGE
+if IMAGES_STORAGE_CACHE:
+    DEFAULT_FILE_STORAGE = 'images.storage.ReadThroughCacheStorage'
 AWS_STORAGE_BUCKET_NAME = config('AWS_STORAGE_BUCKET_NAME')
 AWS_S3_FILE_OVERWRITE = False
-AWS_DEFAULT_ACL = None
-AWS_QUERYSTRING_AUTH = False
+# Stored files are never publicly readable, and the bucket must not grant public reads either: a public image may
+# share its stored file with private ones. Images are served through signed URLs instead, and any storage URL is
+# presigned.
+AWS_DEFAULT_ACL = 'private'
+AWS_QUERYSTRING_AUTH = True
 AWS_S3_REGION_NAME = 'eu-west-3'
+# An S3 compatible endpoint to use instead of AWS, e.g. http://localhost:9000 for a local MinIO.
+AWS_S3_ENDPOINT_URL = config('AWS_S3_ENDPOINT_URL', default=None)
+# The S3 client shared by the threads of each process: its connection pool, which should cover the threads calling
+# S3 at once, how failed calls are retried and how long to wait for S3 before retrying.
+IMAGES_S3_MAX_POOL_CONNECTIONS = config('IMAGES_S3_MAX_POOL_CONNECTIONS', default=100, cast=int)
+IMAGES_S3_RETRY_MODE = config('IMAGES_S3_RETRY_MODE', default='adaptive')
+IMAGES_S3_MAX_ATTEMPTS = config('IMAGES_S3_MAX_ATTEMPTS', default=5, cast=int)
+IMAGES_S3_CONNECT_TIMEOUT = config('IMAGES_S3_CONNECT_TIMEOUT', default=5, cast=float)
+IMAGES_S3_READ_TIMEOUT = config('IMAGES_S3_READ_TIMEOUT', default=30, cast=float)
+# Files larger than the threshold are uploaded in parts of the chunk size, this many parts at a time. Files written
+# as they are received are sent in parts of the chunk size too.
+IMAGES_S3_MULTIPART_THRESHOLD = config('IMAGES_S3_MULTIPART_THRESHOLD', default=8 * 1024 * 1024, cast=int)
+IMAGES_S3_MULTIPART_CHUNKSIZE = config('IMAGES_S3_MULTIPART_CHUNKSIZE', default=8 * 1024 * 1024, cast=int)
+IMAGES_S3_MAX_CONCURRENCY = config('IMAGES_S3_MAX_CONCURRENCY', default=4, cast=int)
+AWS_S3_FILE_BUFFER_SIZE = IMAGES_S3_MULTIPART_CHUNKSIZE
+
+# IMAGES
+# Number of files of an upload sent to storage concurrently.
+IMAGES_UPLOAD_WORKERS = config('IMAGES_UPLOAD_WORKERS', default=8, cast=int)
+# Stream uploaded images straight to storage while they are received.
+IMAGES_STREAMING_UPLOADS = config('IMAGES_STREAMING_UPLOADS', default=True, cast=bool)
+# How uploads are validated: 'header' only parses the format and dimensions from the file header, 'full'
+# also decodes the image with Pillow.
+IMAGES_VALIDATION_MODE = config('IMAGES_VALIDATION_MODE', default='header')
+# Largest number of pixels an image may have, to reject decompression bombs.
+IMAGES_MAX_PIXELS = config('IMAGES_MAX_PIXELS', default=50_000_000, cast=int)
+# Variants generated for every new image, by name. Formats Pillow cannot write are skipped.
+IMAGES_DERIVATIVES = {
+    'thumbnail': {'format': 'WEBP', 'size': (256, 256), 'options': {'quality': 80}},
+    'webp': {'format': 'WEBP', 'options': {'quality': 85}},
+    'avif': {'format': 'AVIF', 'options': {'quality': 60}},
+}
+# Generate derivatives in a pool of local worker processes rather than in the request.
+IMAGES_DERIVATIVES_ASYNC = config('IMAGES_DERIVATIVES_ASYNC', default=True, cast=bool)
+IMAGES_DERIVATIVE_WORKERS = config('IMAGES_DERIVATIVE_WORKERS', default=2, cast=int)
+# Cache the image list and search responses in this cache, for this many seconds.
+IMAGES_RESPONSE_CACHE = config('IMAGES_RESPONSE_CACHE', default='default')
+IMAGES_RESPONSE_CACHE_TIMEOUT = config('IMAGES_RESPONSE_CACHE_TIMEOUT', default=300, cast=int)
+# Serve the image endpoints with async views, for ASGI servers. Storage calls then run on a pool of this many
+# threads shared by every request of the process, rather than holding a worker each.
+IMAGES_ASYNC_VIEWS = config('IMAGES_ASYNC_VIEWS', default=False, cast=bool)
+IMAGES_ASYNC_STORAGE_THREADS = config('IMAGES_ASYNC_STORAGE_THREADS', default=64, cast=int)
+# Presigned direct upload requests expire after this many seconds, and uploads must be confirmed within twice as
+# long. Expire objects under direct/ with a bucket lifecycle rule, to remove uploads which were never confirmed.
+IMAGES_DIRECT_UPLOAD_EXPIRY = config('IMAGES_DIRECT_UPLOAD_EXPIRY', default=900, cast=int)
+# Largest number of files one direct upload request may cover.
+IMAGES_DIRECT_UPLOAD_BATCH_MAX = config('IMAGES_DIRECT_UPLOAD_BATCH_MAX', default=100, cast=int)
+# Private images are served through URLs signed with this key, derived from SECRET_KEY when it is empty. Share it
+# with the CDN to check signatures at the edge.
+IMAGES_URL_SIGNING_KEY = config('IMAGES_URL_SIGNING_KEY', default='')
+# Signed URLs handed out within the same window of this many seconds are identical, so CDNs and browsers can cache
+# them, and stay valid for one to two windows.
+IMAGES_URL_SIGNING_WINDOW = config('IMAGES_URL_SIGNING_WINDOW', default=3600, cast=int)
+AWS_QUERYSTRING_EXPIRE = 2 * IMAGES_URL_SIGNING_WINDOW
+# Base URL of a CDN serving signed URLs, e.g. https://cdn.example.com/images. The API serves them when it is empty.
+IMAGES_SIGNED_URL_BASE = config('IMAGES_SIGNED_URL_BASE', default='')
+# Largest number of (image, user) pairs a batch share request may contain.
+IMAGES_SHARE_BATCH_MAX_PAIRS = config('IMAGES_SHARE_BATCH_MAX_PAIRS', default=1000, cast=int)
+# Files fetched from storage ahead of the one being written to an export archive, and so held in memory at once.
+IMAGES_EXPORT_PREFETCH = config('IMAGES_EXPORT_PREFETCH', default=8, cast=int)
+# Bytes of images each user may hold (1 GiB by default), 0 for no limit. Shared copies count in full.
+IMAGES_STORAGE_QUOTA = config('IMAGES_STORAGE_QUOTA', default=1024 ** 3, cast=int)
+
+# INSTRUMENTATION
+# Share of requests timed in detail, with a Server-Timing header, a log record and histograms on the metrics
+# endpoint. Requests which are not sampled are not instrumented at all.
+INSTRUMENTATION_SAMPLE_RATE = config('INSTRUMENTATION_SAMPLE_RATE', default=0.01, cast=float)
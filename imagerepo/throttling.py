@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# A bucket's state: the tokens it held when it was last updated, and when that was.
+Bucket = Tuple[float, float]
+
+PERIODS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_rate(rate: str) -> Tuple[int, int]:
+    """The ``(requests, seconds)`` of a rate such as ``"60/min"``, in the format of DRF's throttles."""
+    requests, period = rate.split("/")
+    return int(requests), PERIODS[period[0]]
+
+
+def take_token(bucket: Optional[Bucket], capacity: int, refill_rate: float, now: float) -> Tuple[Bucket, float]:
+    """
+    Take a token from a bucket refilled with ``refill_rate`` tokens per second, up to ``capacity``.
+
+    Returns the bucket's new state and 0 when a token was taken, or the seconds until one is available.
+    """
+    tokens, updated = bucket if bucket is not None else (capacity, now)
+    tokens = min(capacity, tokens + max(now - updated, 0) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+class LocalBuckets:
+    """Buckets kept in the process, the least recently used dropped beyond ``THROTTLE_LOCAL_SIZE``."""
+
+    def __init__(self):
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: int, refill_rate: float, now: float) -> float:
+        with self._lock:
+            self._buckets[key], wait = take_token(self._buckets.get(key), capacity, refill_rate, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > settings.THROTTLE_LOCAL_SIZE:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBuckets:
+    """
+    Buckets kept in the ``THROTTLE_CACHE`` cache, shared by every process.
+
+    A bucket is read and written back without a lock, so concurrent requests of the same user may take the same
+    token: the limit is approximate under contention. Buckets expire once they would be full again.
+    """
+
+    def take(self, key: str, capacity: int, refill_rate: float, now: float) -> float:
+        cache = caches[settings.THROTTLE_CACHE]
+        bucket, wait = take_token(cache.get(key), capacity, refill_rate, now)
+        cache.set(key, bucket, int(capacity / refill_rate) + 1)
+        return wait
+
+
+local_buckets = LocalBuckets()
+
+
+def get_buckets():
+    return CacheBuckets() if settings.THROTTLE_BACKEND == "cache" else local_buckets
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Limit the requests of each user to each endpoint with a token bucket.
+
+    The view's ``throttle_scope`` names its rate in ``DEFAULT_THROTTLE_RATES``, e.g. ``"60/min"``: a user may send
+    60 requests at once, then one more per second. Unlike DRF's scoped throttle, which keeps the time of every
+    request in the window, a bucket is two numbers, and views without a rate are not throttled. Anonymous requests
+    are throttled by client address.
+    """
+
+    cache_format = "throttle:{scope}:{ident}"
+
+    def __init__(self):
+        self._wait = None
+
+    def allow_request(self, request, view) -> bool:
+        scope = getattr(view, "throttle_scope", None)
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(scope) if scope else None
+        if rate is None:
+            return True
+
+        capacity, period = parse_rate(rate)
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        key = self.cache_format.format(scope=scope, ident=ident)
+        self._wait = get_buckets().take(key, capacity, capacity / period, time.time())
+        return not self._wait
+
+    def wait(self) -> Optional[float]:
+        return self._wait
@@ -4,6 +4,8 @@ from drf_yasg import openapi
 from drf_yasg.views import get_schema_view
 from rest_framework import permissions
 
+from .views import MetricsView
+
 SchemaView = get_schema_view(
     openapi.Info(
         title='Image Repository API',
@@ -18,6 +20,7 @@ urlpatterns = [
     # API
     path('api/auth/', include(('account.urls', 'account'), namespace='account_api')),
     path('api/images/', include(('images.urls', 'images'), namespace='images_api')),
+    path('api/metrics/', MetricsView.as_view(), name='metrics'),
     # API Swagger Docs
     path('api/docs/swagger/', SchemaView.with_ui('swagger'), name='schema_swagger'),
     path('api/docs/redoc/', SchemaView.with_ui('redoc'), name='schema_redoc'),
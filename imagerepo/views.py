@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from drf_yasg.utils import swagger_auto_schema
+from images.storage import storage_metrics
+from rest_framework import permissions, status
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .instrumentation import metrics
+
+
+class MetricsView(APIView):
+    """Histograms of the sampled requests' timings and query counts, by route, as seen by this server process."""
+
+    permission_classes = (permissions.IsAdminUser,)
+
+    @swagger_auto_schema(responses={status.HTTP_200_OK: ""})
+    def get(self, request: Request) -> Response:
+        data = {
+            "sample_rate": settings.INSTRUMENTATION_SAMPLE_RATE,
+            "routes": metrics.snapshot(),
+            "storage_operations": storage_metrics.snapshot(),
+        }
+        cache_stats = getattr(default_storage, "cache_stats", None)
+        if cache_stats is not None:
+            data["storage_cache"] = cache_stats()
+        return Response(data)
@@ -0,0 +1,104 @@
+import asyncio
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .storage import run_in_storage_thread
+from .uploads import AsyncBulkImageUpload
+from .views import (
+    AddImageView,
+    BulkShareImageView,
+    ListImageView,
+    SearchImagesView,
+    ShareImageView,
+    add_image_schema,
+)
+
+
+class AsyncAPIView(APIView):
+    """
+    An ``APIView`` whose handlers are coroutines, for ASGI servers.
+
+    Authentication, permissions and throttling may query the database, so they run through ``sync_to_async``
+    like any other ORM call, then the handler is awaited on the event loop.
+    """
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Django 3.2 class-based views are synchronous, mark the view as a coroutine function so it is awaited.
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+def run_in_thread(handler):
+    """An async version of a synchronous handler, run on Django's thread for database access."""
+
+    @wraps(handler)
+    async def async_handler(self, request, *args, **kwargs):
+        return await sync_to_async(handler)(self, request, *args, **kwargs)
+
+    return async_handler
+
+
+class AsyncAddImageView(AsyncAPIView, AddImageView):
+    """
+    Add images without holding a thread while they are sent to storage.
+
+    The body is parsed, and streamed uploads written, on the storage thread pool, and the files of a batch are
+    stored concurrently, so a single process serves many uploads at once.
+    """
+
+    upload_class = AsyncBulkImageUpload
+
+    @add_image_schema
+    async def post(self, request: Request) -> Response:
+        files, private = await run_in_storage_thread(self.get_files, request)
+        upload = self.upload_class(
+            owner=request.user, files=files, private=private, remaining_storage=request.remaining_storage
+        )
+        results = await upload.arun()
+        return await sync_to_async(self.upload_response)(upload, results)
+
+
+class AsyncListImageView(AsyncAPIView, ListImageView):
+    get = run_in_thread(ListImageView.get)
+
+
+class AsyncSearchImagesView(AsyncAPIView, SearchImagesView):
+    get = run_in_thread(SearchImagesView.get)
+
+
+class AsyncShareImageView(AsyncAPIView, ShareImageView):
+    post = run_in_thread(ShareImageView.post)
+
+
+class AsyncBulkShareImageView(AsyncAPIView, BulkShareImageView):
+    post = run_in_thread(BulkShareImageView.post)
@@ -0,0 +1,122 @@
+import hashlib
+import uuid
+from functools import wraps
+from typing import Iterable, List
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from .url_signing import current_window
+
+# Scope of the responses which include other users' public images.
+PUBLIC_SCOPE = "public"
+
+
+def owner_scope(owner_id) -> str:
+    """Scope of the responses which include the images of the given owner."""
+    return "owner:{}".format(owner_id)
+
+
+def get_cache():
+    return caches[settings.IMAGES_RESPONSE_CACHE]
+
+
+def _version_key(scope: str) -> str:
+    return "images:version:{}".format(scope)
+
+
+def get_versions(scopes: Iterable[str]) -> List[str]:
+    """The current version of each scope, starting a new one for scopes which have none."""
+    cache = get_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    new_versions = {key: uuid.uuid4().hex for key in keys if key not in versions}
+    if new_versions:
+        cache.set_many(new_versions, timeout=None)
+        versions.update(new_versions)
+    return [versions[key] for key in keys]
+
+
+def invalidate(scopes: Iterable[str]) -> None:
+    """
+    Drop the cached responses of the given scopes, by forgetting their version.
+
+    The versions are dropped straight away, and again once the current transaction commits so that a response
+    built from the data the transaction replaces cannot outlive it.
+    """
+    keys = [_version_key(scope) for scope in set(scopes)]
+    if not keys:
+        return
+    get_cache().delete_many(keys)
+    transaction.on_commit(lambda: get_cache().delete_many(keys))
+
+
+def invalidate_images(images, public=None) -> None:
+    """Drop the cached responses which may include the given images. ``public`` overrides their privacy."""
+    scopes = set()
+    for image in images:
+        scopes.add(owner_scope(image.owner_id))
+        if public or (public is None and not image.private):
+            scopes.add(PUBLIC_SCOPE)
+    invalidate(scopes)
+
+
+def cache_response(public: bool = False):
+    """
+    Cache the successful responses of an APIView ``get`` method per user and query.
+
+    Responses are keyed by the version of the requesting user's images, plus the version of all public images
+    when ``public`` is set, so changing an image invalidates every response which could include it without
+    having to track them. The key doubles as the ETag: a request whose ``If-None-Match`` holds it gets a 304
+    before anything is queried or serialized. The key also changes with the URL signing window, so neither cached
+    bodies nor revalidated ones hand out signed image URLs which are about to expire.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            scopes = [owner_scope(request.user.pk)]
+            if public:
+                scopes.append(PUBLIC_SCOPE)
+            key = hashlib.sha256(
+                repr(
+                    (
+                        type(view).__name__,
+                        request.user.pk,
+                        get_versions(scopes),
+                        sorted(request.query_params.lists()),
+                        current_window(),
+                    )
+                ).encode()
+            ).hexdigest()
+            etag = quote_etag(key)
+
+            if_none_match = parse_etags(request.headers.get("If-None-Match", ""))
+            if etag in if_none_match or "*" in if_none_match:
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                cache = get_cache()
+                data = cache.get("images:response:{}".format(key))
+                if data is not None:
+                    response = Response(data)
+                else:
+                    response = method(view, request, *args, **kwargs)
+                    if response.status_code != status.HTTP_200_OK:
+                        return response
+                    cache.set(
+                        "images:response:{}".format(key), response.data, settings.IMAGES_RESPONSE_CACHE_TIMEOUT
+                    )
+
+            response["ETag"] = etag
+            patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ["Authorization"])
+            return response
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,131 @@
+import io
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from functools import partial
+from typing import Iterable, List, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import ImageBlob, ImageDerivative
+from .workers import generate_in_worker, init_worker
+
+logger = logging.getLogger(__name__)
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def create_worker_pool(max_workers: int) -> ProcessPoolExecutor:
+    """A pool of worker processes to run ``generate_in_worker`` in."""
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"), initializer=init_worker
+    )
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """The pool of local worker processes derivatives are generated in, started on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = create_worker_pool(settings.IMAGES_DERIVATIVE_WORKERS)
+    return _executor
+
+
+def schedule_derivatives(blob_ids: Iterable) -> None:
+    """Generate the derivatives of the given blobs in the background once the current transaction commits."""
+    blob_ids = [str(blob_id) for blob_id in blob_ids]
+    if not blob_ids:
+        return
+
+    def submit():
+        if not settings.IMAGES_DERIVATIVES_ASYNC:
+            for blob_id in blob_ids:
+                generate_derivatives(blob_id)
+            return
+        executor = get_executor()
+        submitter = threading.get_ident()
+        for blob_id in blob_ids:
+            executor.submit(generate_in_worker, blob_id).add_done_callback(partial(_generated, blob_id, submitter))
+
+    transaction.on_commit(submit)
+
+
+def _generated(blob_id: str, submitter: int, future: Future) -> None:
+    """Log a failed generation in the background, and mark its blob for the generate_derivatives command to retry."""
+    if future.cancelled() or future.exception() is None:
+        return
+    logger.error("Could not generate derivatives of blob %s.", blob_id, exc_info=future.exception())
+    try:
+        ImageBlob.objects.filter(pk=blob_id).update(derivatives_failed_at=timezone.now())
+    except DatabaseError:
+        logger.exception("Could not mark blob %s for its derivatives to be generated again.", blob_id)
+    finally:
+        # Callbacks run in the pool's own thread, unless the future was already done when submitted. Nothing
+        # else would ever close that thread's connection.
+        if threading.get_ident() != submitter:
+            connection.close()
+
+
+def generate_derivatives(blob_id) -> List[ImageDerivative]:
+    """Generate every configured derivative a blob is missing. Runs in a worker process."""
+    try:
+        blob = ImageBlob.objects.get(pk=blob_id)
+    except ImageBlob.DoesNotExist:
+        # Deleted before the worker got to it.
+        return []
+    if blob.derivatives_failed_at is not None:
+        # Retried, a new failure marks it again.
+        ImageBlob.objects.filter(pk=blob.pk).update(derivatives_failed_at=None)
+
+    existing = set(blob.derivatives.values_list("kind", flat=True))
+    missing = {kind: spec for kind, spec in settings.IMAGES_DERIVATIVES.items() if kind not in existing}
+    if not missing:
+        return []
+
+    Image.init()
+    Image.MAX_IMAGE_PIXELS = settings.IMAGES_MAX_PIXELS
+    derivatives = []
+    try:
+        with blob.file.open("rb") as file, Image.open(file) as original:
+            original.load()
+            for kind, spec in missing.items():
+                if spec["format"] not in Image.SAVE:
+                    logger.warning("Skipping %s derivatives, Pillow cannot write %s images.", kind, spec["format"])
+                    continue
+                derivative = _create_derivative(blob, kind, spec, original)
+                if derivative is not None:
+                    derivatives.append(derivative)
+    except (OSError, Image.DecompressionBombError):
+        logger.exception("Could not generate derivatives of blob %s.", blob_id)
+    return derivatives
+
+
+def _create_derivative(blob: ImageBlob, kind: str, spec: dict, original: Image.Image) -> Optional[ImageDerivative]:
+    image = original.copy()
+    if "size" in spec:
+        image.thumbnail(spec["size"])
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=spec["format"], **spec.get("options", {}))
+
+    extension = spec["format"].lower()
+    derivative = ImageDerivative(blob=blob, kind=kind, width=image.width, height=image.height, size=buffer.tell())
+    derivative.file.save(
+        "derivatives/{}/{}.{}".format(blob.digest, kind, extension), ContentFile(buffer.getvalue()), save=False
+    )
+    try:
+        with transaction.atomic():
+            derivative.save()
+    except IntegrityError:
+        # Generated concurrently by another worker.
+        derivative.file.delete(save=False)
+        return None
+    return derivative
@@ -0,0 +1,225 @@
+import base64
+import hashlib
+import os
+from typing import Dict, NamedTuple, Optional
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.files.storage import Storage
+from django.urls import reverse
+from django.utils.text import get_valid_filename
+from imagerepo.instrumentation import timed
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .headers import READ_SIZE, ImageHeaderParser, ImageInfo
+from .models import ImageBlob
+
+TICKET_SALT = "images.direct_uploads.ticket"
+EMULATION_SALT = "images.direct_uploads.emulation"
+# Most bytes read from the start of an uploaded file to find its header.
+HEADER_LIMIT = 1024 * 1024
+
+
+class DirectUploadsUnavailable(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = "Direct uploads are not supported by the file storage."
+    default_code = "direct_uploads_unavailable"
+
+
+class StoredObject(NamedTuple):
+    """What the storage reports about an uploaded file, without reading it."""
+
+    size: int
+    sha256: Optional[str]
+    content_type: Optional[str] = None
+
+
+class DirectUploadTicket(NamedTuple):
+    """A file a user may upload straight to storage, as ``key``, and confirm as one of their images."""
+
+    owner_id: int
+    name: str
+    key: str
+    size: int
+    content_type: str
+    sha256: str
+
+    @classmethod
+    def issue(cls, owner: User, name: str, size: int, content_type: str, sha256: str) -> "DirectUploadTicket":
+        # Each upload gets its own key, so concurrent uploads of the same name never overwrite each other.
+        key = "direct/{}/{}".format(uuid4().hex, get_valid_filename(os.path.basename(name)))
+        return cls(owner.pk, name, key, size, content_type, sha256)
+
+    @property
+    def upload_id(self) -> str:
+        return signing.dumps(list(self), salt=TICKET_SALT, compress=True)
+
+    @classmethod
+    def load(cls, upload_id: str, owner: User) -> "DirectUploadTicket":
+        """Read a ticket back from its ``upload_id``, raising ``signing.BadSignature`` if it is not the owner's."""
+        ticket = cls(*signing.loads(upload_id, salt=TICKET_SALT, max_age=2 * settings.IMAGES_DIRECT_UPLOAD_EXPIRY))
+        if ticket.owner_id != owner.pk:
+            raise signing.BadSignature("The upload belongs to another user.")
+        return ticket
+
+
+class DirectUploads:
+    """Let clients upload files straight to a storage, then inspect what they uploaded without downloading it."""
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+
+    @classmethod
+    def for_storage(cls, storage: Optional[Storage] = None) -> "DirectUploads":
+        storage = storage or ImageBlob._meta.get_field("file").storage
+        if hasattr(storage, "bucket"):
+            return S3DirectUploads(storage)
+        try:
+            storage.path("")
+        except NotImplementedError:
+            raise DirectUploadsUnavailable()
+        return FileSystemDirectUploads(storage)
+
+    def presign(self, ticket: DirectUploadTicket) -> Dict:
+        """The request the client must send to upload the ticket's file, as ``{"url", "method", "headers"}``."""
+        raise NotImplementedError()
+
+    def head(self, key: str) -> Optional[StoredObject]:
+        """Describe the file stored as ``key``, or return ``None`` if it was not uploaded."""
+        raise NotImplementedError()
+
+    def read_header(self, key: str) -> Optional[ImageInfo]:
+        """Parse the image header of the file stored as ``key``, reading no more of it than needed."""
+        raise NotImplementedError()
+
+    def _parse(self, chunks) -> Optional[ImageInfo]:
+        parser = ImageHeaderParser()
+        read = 0
+        for chunk in chunks:
+            parser.feed(chunk)
+            read += len(chunk)
+            if parser.done or read >= HEADER_LIMIT:
+                break
+        return parser.close()
+
+
+class S3DirectUploads(DirectUploads):
+    """
+    Direct uploads to an ``S3Boto3Storage`` bucket, with presigned PUT requests.
+
+    The client declares each file's size and SHA-256 and S3 rejects uploads whose contents do not match them, so
+    nothing larger than declared can be stored, and the digest can be trusted for deduplication once the upload is
+    confirmed.
+    """
+
+    def __init__(self, storage: Storage):
+        super().__init__(storage)
+        self.client = storage.bucket.meta.client
+
+    def _object(self, key: str) -> Dict[str, str]:
+        # The storage's own name normalization, which applies AWS_LOCATION.
+        key = self.storage._normalize_name(self.storage._clean_name(key))
+        return {"Bucket": self.storage.bucket.name, "Key": key}
+
+    def presign(self, ticket: DirectUploadTicket) -> Dict:
+        checksum = base64.b64encode(bytes.fromhex(ticket.sha256)).decode()
+        url = self.client.generate_presigned_url(
+            "put_object",
+            Params={
+                **self._object(ticket.key),
+                "ContentType": ticket.content_type,
+                "ContentLength": ticket.size,
+                "ChecksumSHA256": checksum,
+            },
+            ExpiresIn=settings.IMAGES_DIRECT_UPLOAD_EXPIRY,
+            HttpMethod="PUT",
+        )
+        return {
+            "url": url,
+            "method": "PUT",
+            "headers": {"Content-Type": ticket.content_type, "x-amz-checksum-sha256": checksum},
+        }
+
+    def head(self, key: str) -> Optional[StoredObject]:
+        from botocore.exceptions import ClientError
+
+        try:
+            with timed("storage"):
+                response = self.client.head_object(**self._object(key), ChecksumMode="ENABLED")
+        except ClientError as error:
+            if error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey"):
+                return None
+            raise
+        checksum = response.get("ChecksumSHA256")
+        return StoredObject(
+            size=response["ContentLength"],
+            sha256=base64.b64decode(checksum).hex() if checksum else None,
+            content_type=response.get("ContentType"),
+        )
+
+    def read_header(self, key: str) -> Optional[ImageInfo]:
+        with timed("storage"):
+            body = self.client.get_object(**self._object(key), Range="bytes=0-{}".format(HEADER_LIMIT - 1))["Body"]
+            try:
+                return self._parse(body.iter_chunks(READ_SIZE))
+            finally:
+                body.close()
+
+
+class FileSystemDirectUploads(DirectUploads):
+    """
+    Direct uploads to a storage with local paths, emulating presigned URLs with signed links to the upload view.
+
+    It behaves like S3 from the client's point of view, for development and tests.
+    """
+
+    def presign(self, ticket: DirectUploadTicket) -> Dict:
+        token = signing.dumps([ticket.key, ticket.content_type, ticket.size, ticket.sha256], salt=EMULATION_SALT)
+        return {
+            "url": reverse("images_api:direct_upload_emulation", args=[token]),
+            "method": "PUT",
+            "headers": {"Content-Type": ticket.content_type},
+        }
+
+    def receive(self, token: str, content_type: str, stream) -> None:
+        """
+        Store the body of an emulated presigned upload, rejecting it like S3 would if it does not match.
+
+        Raises ``signing.BadSignature`` for invalid or expired links and ``ValueError`` for mismatching files.
+        """
+        key, expected_type, size, sha256 = signing.loads(
+            token, salt=EMULATION_SALT, max_age=settings.IMAGES_DIRECT_UPLOAD_EXPIRY
+        )
+        if content_type != expected_type:
+            raise ValueError("The Content-Type header does not match the signed one.")
+
+        path = self.storage.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        hasher = hashlib.sha256()
+        with open(path, "wb") as file:
+            for chunk in iter(lambda: stream.read(READ_SIZE), b""):
+                hasher.update(chunk)
+                file.write(chunk)
+            written = file.tell()
+        if written != size or hasher.hexdigest() != sha256:
+            os.remove(path)
+            raise ValueError("The uploaded file does not match its declared size and SHA-256 digest.")
+
+    def head(self, key: str) -> Optional[StoredObject]:
+        path = self.storage.path(key)
+        if not os.path.exists(path):
+            return None
+        # Only verified uploads are kept, but the digest is cheap to recompute from local disk.
+        hasher = hashlib.sha256()
+        with open(path, "rb") as file:
+            for chunk in iter(lambda: file.read(READ_SIZE), b""):
+                hasher.update(chunk)
+        return StoredObject(size=os.path.getsize(path), sha256=hasher.hexdigest())
+
+    def read_header(self, key: str) -> Optional[ImageInfo]:
+        with open(self.storage.path(key), "rb") as file:
+            return self._parse(iter(lambda: file.read(READ_SIZE), b""))
+
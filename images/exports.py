@@ -0,0 +1,151 @@
+import io
+import json
+import logging
+import zipfile
+from collections import deque
+from contextvars import copy_context
+from datetime import datetime
+from typing import Iterator, List
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import Q, prefetch_related_objects
+from django.utils import timezone
+from imagerepo.instrumentation import timed
+
+from .models import UserImage
+from .serializers import ImageSerializer
+from .storage import storage_executor
+
+logger = logging.getLogger(__name__)
+
+
+class ZipStream(io.RawIOBase):
+    """
+    A write-only sink for ``zipfile``, whose output is taken in chunks as it is written.
+
+    It cannot seek, so ``zipfile`` writes each entry's sizes and checksum after its data instead of going back to
+    its header, and the archive is produced front to back.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def take(self) -> bytes:
+        chunks, self._chunks = self._chunks, []
+        return b"".join(chunks)
+
+
+class ImageExport:
+    """
+    A user's images as a ZIP archive, generated while it is sent.
+
+    The archive holds ``manifest.json``, the ``ImageSerializer`` data of every image along with the path of its
+    file, then the files under ``images/``. Images are read from the database a page at a time and their files
+    fetched from storage on the storage thread pool, at most ``IMAGES_EXPORT_PREFETCH`` ahead of the one being
+    written. Each chunk of the archive is yielded as soon as it is written, and the next file is only fetched once
+    an earlier one was consumed, so a slow client holds back the export rather than having it buffered: the
+    memory used is bounded by the prefetch window, whatever the number of images.
+
+    Images added after the export started are left out, and files deleted meanwhile are skipped.
+    """
+
+    page_size = 200
+    # Images are compressed already, storing them as they are saves the CPU for no loss in size.
+    compression = zipfile.ZIP_STORED
+
+    def __init__(self, owner: User, request=None, prefetch: int = None):
+        self.owner = owner
+        self.request = request
+        self.prefetch = prefetch or settings.IMAGES_EXPORT_PREFETCH
+        self.started = timezone.now()
+        self.storage = UserImage._meta.get_field("image").storage
+
+    @staticmethod
+    def path(image: UserImage) -> str:
+        # Names are unique per owner. Stored files are named after their contents, which are no one's business.
+        return "images/{}".format(image.name)
+
+    def pages(self, columns=None) -> Iterator[List[UserImage]]:
+        """The owner's images as of the start of the export, oldest first, a page at a time."""
+        objects = UserImage.objects.filter(owner=self.owner, datetime_created__lte=self.started)
+        if columns is not None:
+            objects = objects.only(*columns)
+        objects = objects.order_by("datetime_created", "id")
+        page = list(objects[: self.page_size])
+        while page:
+            yield page
+            created, pk = page[-1].datetime_created, page[-1].pk
+            following = objects.filter(Q(datetime_created__gt=created) | Q(datetime_created=created, id__gt=pk))
+            page = list(following[: self.page_size])
+
+    def __iter__(self) -> Iterator[bytes]:
+        stream = ZipStream()
+        with zipfile.ZipFile(stream, mode="w", compression=self.compression) as archive:
+            yield from self.write_manifest(archive, stream)
+            yield from self.write_images(archive, stream)
+        yield stream.take()
+
+    def write_manifest(self, archive: zipfile.ZipFile, stream: ZipStream) -> Iterator[bytes]:
+        with archive.open(self.entry("manifest.json"), mode="w") as manifest:
+            manifest.write(b"[")
+            first = True
+            for page in self.pages():
+                for image in page:
+                    # The owner is the same for every image.
+                    image.owner = self.owner
+                prefetch_related_objects(page, "blob__derivatives")
+                data = ImageSerializer(page, many=True, context={"request": self.request}).data
+                for image, item in zip(page, data):
+                    item = dict(item, private=image.private, file=self.path(image))
+                    manifest.write((b"" if first else b",") + json.dumps(item).encode())
+                    first = False
+                yield stream.take()
+            manifest.write(b"]")
+
+    def write_images(self, archive: zipfile.ZipFile, stream: ZipStream) -> Iterator[bytes]:
+        executor = storage_executor()
+        window = deque()
+        images = (image for page in self.pages(columns=("image", "name", "datetime_created")) for image in page)
+        try:
+            for image in images:
+                window.append((image, executor.submit(copy_context().run, self.fetch, image)))
+                if len(window) >= self.prefetch:
+                    yield from self.write_image(archive, stream, *window.popleft())
+            while window:
+                yield from self.write_image(archive, stream, *window.popleft())
+        finally:
+            # The client went away, stop fetching what it will not read.
+            for _, future in window:
+                future.cancel()
+
+    def write_image(self, archive: zipfile.ZipFile, stream: ZipStream, image: UserImage, future) -> Iterator[bytes]:
+        try:
+            contents = future.result()
+        except Exception:
+            logger.warning("Could not export %s, it is left out of the archive.", image.image.name, exc_info=True)
+            return
+        info = self.entry(self.path(image), image.datetime_created)
+        info.file_size = len(contents)
+        with archive.open(info, mode="w") as file:
+            file.write(contents)
+        yield stream.take()
+
+    def fetch(self, image: UserImage) -> bytes:
+        with timed("storage"):
+            with self.storage.open(image.image.name, "rb") as file:
+                return file.read()
+
+    def entry(self, name: str, created: datetime = None) -> zipfile.ZipInfo:
+        created = timezone.localtime(created or self.started)
+        info = zipfile.ZipInfo(name, date_time=created.timetuple()[:6])
+        info.compress_type = self.compression
+        return info
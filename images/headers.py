@@ -0,0 +1,152 @@
+import struct
+from typing import NamedTuple, Optional
+
+# Chunk size files are read in while looking for their header.
+READ_SIZE = 16 * 1024
+
+# JPEG start-of-frame markers, which hold the image dimensions. 0xC4, 0xC8 and 0xCC are other segments.
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# JPEG markers without a length or payload.
+_JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7, 0xD8}
+
+
+class ImageInfo(NamedTuple):
+    content_type: str
+    width: int
+    height: int
+
+    @property
+    def pixels(self) -> int:
+        return self.width * self.height
+
+
+class ImageHeaderParser:
+    """
+    Find the format and dimensions of an image from its container header, without decoding any pixels.
+
+    Data is fed in as it arrives. Only the header of PNG, GIF and WebP files is ever buffered, and JPEG
+    segments before the frame header are skipped over rather than kept, so memory use stays small whatever
+    the size of the file. ``info`` is set once the header has been parsed, and stays ``None`` for files that
+    are not a supported image or whose header is malformed.
+    """
+
+    def __init__(self):
+        self.info: Optional[ImageInfo] = None
+        self.done = False
+        self._buffer = b""
+        # Absolute offset of the first byte in the buffer.
+        self._offset = 0
+        # Absolute offset of the next JPEG marker.
+        self._marker = 2
+
+    def feed(self, data: bytes) -> None:
+        if self.done:
+            return
+        self._buffer += data
+        self._parse()
+
+    def close(self) -> Optional[ImageInfo]:
+        """Stop parsing, e.g. at the end of the file, and return what was found."""
+        if not self.done:
+            # Files shorter than the longest header, e.g. tiny GIFs, are only parsed once known to be complete.
+            self._parse(final=True)
+            self._stop()
+        return self.info
+
+    def _stop(self) -> None:
+        self.done = True
+        self._buffer = b""
+
+    def _finish(self, content_type: Optional[str] = None, width: int = 0, height: int = 0) -> None:
+        if content_type is not None and width > 0 and height > 0:
+            self.info = ImageInfo(content_type, width, height)
+        self._stop()
+
+    def _parse(self, final: bool = False) -> None:
+        buffer = self._buffer
+        if self._offset > 0 or buffer.startswith(b"\xff\xd8"):
+            self._parse_jpeg()
+        elif len(buffer) < 30 and not final:
+            # Not enough data to tell the format yet.
+            return
+        elif buffer.startswith(b"\x89PNG\r\n\x1a\n"):
+            if buffer[12:16] == b"IHDR" and len(buffer) >= 24:
+                self._finish("image/png", *struct.unpack(">II", buffer[16:24]))
+            else:
+                self._finish()
+        elif buffer[:6] in (b"GIF87a", b"GIF89a"):
+            if len(buffer) >= 10:
+                self._finish("image/gif", *struct.unpack("<HH", buffer[6:10]))
+            else:
+                self._finish()
+        elif buffer[:4] == b"RIFF" and buffer[8:12] == b"WEBP":
+            self._parse_webp(buffer)
+        else:
+            self._finish()
+
+    def _parse_webp(self, buffer: bytes) -> None:
+        chunk = buffer[12:16]
+        if chunk == b"VP8 " and buffer[23:26] == b"\x9d\x01\x2a" and len(buffer) >= 30:
+            width, height = struct.unpack("<HH", buffer[26:30])
+            self._finish("image/webp", width & 0x3FFF, height & 0x3FFF)
+        elif chunk == b"VP8L" and buffer[20:21] == b"\x2f" and len(buffer) >= 25:
+            bits = int.from_bytes(buffer[21:25], "little")
+            self._finish("image/webp", (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1)
+        elif chunk == b"VP8X" and len(buffer) >= 30:
+            width = int.from_bytes(buffer[24:27], "little") + 1
+            height = int.from_bytes(buffer[27:30], "little") + 1
+            self._finish("image/webp", width, height)
+        else:
+            self._finish()
+
+    def _parse_jpeg(self) -> None:
+        while True:
+            start = self._marker - self._offset
+            if start > len(self._buffer):
+                # The marker lies beyond the data received so far, drop the skipped segment.
+                self._offset += len(self._buffer)
+                self._buffer = b""
+                return
+            self._buffer = self._buffer[start:]
+            self._offset = self._marker
+            if len(self._buffer) < 2:
+                return
+            if self._buffer[0] != 0xFF:
+                return self._finish()
+
+            marker = self._buffer[1]
+            if marker == 0xFF:
+                # Fill byte before a marker.
+                self._marker += 1
+                continue
+            if marker in _JPEG_STANDALONE_MARKERS:
+                self._marker += 2
+                continue
+            if marker == 0xD9 or marker == 0xDA:
+                # End of image or start of scan before any frame header.
+                return self._finish()
+            if marker in _JPEG_SOF_MARKERS:
+                if len(self._buffer) < 9:
+                    return
+                height, width = struct.unpack(">HH", self._buffer[5:9])
+                return self._finish("image/jpeg", width, height)
+            if len(self._buffer) < 4:
+                return
+            self._marker += 2 + struct.unpack(">H", self._buffer[2:4])[0]
+
+
+def read_image_info(file) -> Optional[ImageInfo]:
+    """Parse the header of an image file, reading no more of it than needed. The file position is restored."""
+    parser = ImageHeaderParser()
+    position = file.tell() if hasattr(file, "tell") else None
+    file.seek(0)
+    try:
+        while not parser.done:
+            data = file.read(READ_SIZE)
+            if not data:
+                break
+            parser.feed(data)
+    finally:
+        if position is not None:
+            file.seek(position)
+    return parser.close()
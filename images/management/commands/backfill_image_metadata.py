@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from images.cache import invalidate_images
+from images.direct_uploads import DirectUploads, DirectUploadsUnavailable
+from images.headers import ImageInfo, read_image_info
+from images.models import UserImage, file_digest
+
+
+class Command(BaseCommand):
+    help = "Fill in the dimensions, content type and digest of images added before they were captured at upload."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of images handled per batch.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IMAGES_UPLOAD_WORKERS,
+            help="Number of files of a batch read from storage concurrently.",
+        )
+
+    def handle(self, *args, batch_size, workers, **options):
+        self.storage = UserImage._meta.get_field("image").storage
+        try:
+            # Reads only the start of the files, with ranged requests on S3.
+            self.uploads = DirectUploads.for_storage(self.storage)
+        except DirectUploadsUnavailable:
+            self.uploads = None
+
+        described = failed = 0
+        last_pk = None
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            while True:
+                images = UserImage.objects.filter(Q(width__isnull=True) | Q(digest="")).order_by("pk")
+                if last_pk is not None:
+                    images = images.filter(pk__gt=last_pk)
+                rows = list(images.values("pk", "image", "digest", "blob__digest")[:batch_size])
+                if not rows:
+                    break
+                last_pk = rows[-1]["pk"]
+
+                # Copies of an image share its file, which is read once for all of them.
+                digests = {}
+                for row in rows:
+                    digests[row["image"]] = row["blob__digest"] or row["digest"] or digests.get(row["image"])
+                futures = {name: executor.submit(self.describe, name, digest) for name, digest in digests.items()}
+                updated = []
+
+                for name, future in futures.items():
+                    try:
+                        info, digest = future.result()
+                    except Exception as error:
+                        failed += 1
+                        self.stderr.write("Could not read {}: {}".format(name, error))
+                        continue
+                    fields = {"digest": digest}
+                    if info is not None:
+                        fields.update(content_type=info.content_type, width=info.width, height=info.height)
+                    UserImage.objects.filter(image=name).update(**fields)
+                    updated.append(name)
+                    described += 1
+                # update() sends no signals.
+                invalidate_images(UserImage.objects.filter(image__in=updated).only("owner", "private"))
+                self.stdout.write("Processed {} images.".format(len(rows)))
+
+        self.stdout.write(
+            self.style.SUCCESS("Described {} files, {} could not be read.".format(described, failed))
+        )
+
+    def describe(self, name: str, digest: Optional[str]) -> Tuple[Optional[ImageInfo], str]:
+        """The header of the file stored as ``name``, and its digest, only reading the whole file when unknown."""
+        if digest and self.uploads is not None:
+            return self.uploads.read_header(name), digest
+        with self.storage.open(name, "rb") as file:
+            return read_image_info(file), digest or file_digest(file)
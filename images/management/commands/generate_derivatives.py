@@ -0,0 +1,71 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+from images.derivatives import create_worker_pool, generate_derivatives
+from images.models import ImageBlob, UserImage
+from images.workers import generate_in_worker
+
+
+class Command(BaseCommand):
+    help = "Generate the missing derivatives of existing images."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Number of images handled per batch.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=settings.IMAGES_DERIVATIVE_WORKERS,
+            help="Number of worker processes, 0 generates the derivatives in this process.",
+        )
+        parser.add_argument(
+            "--failed",
+            action="store_true",
+            help="Only retry the images whose derivatives could not be generated in the background.",
+        )
+
+    def handle(self, *args, batch_size, workers, failed, **options):
+        blobs = ImageBlob.objects.all()
+        if failed:
+            blobs = blobs.filter(derivatives_failed_at__isnull=False)
+        else:
+            self.adopt_legacy_images(batch_size)
+
+        kinds = list(settings.IMAGES_DERIVATIVES)
+        blob_ids = list(
+            blobs.annotate(generated=Count("derivatives", filter=Q(derivatives__kind__in=kinds)))
+            .filter(generated__lt=len(kinds))
+            .values_list("pk", flat=True)
+        )
+        batches = [blob_ids[i : i + batch_size] for i in range(0, len(blob_ids), batch_size)]
+
+        if workers == 0:
+            for batch in batches:
+                for blob_id in batch:
+                    generate_derivatives(blob_id)
+                self.stdout.write("Processed {} images.".format(len(batch)))
+        else:
+            with create_worker_pool(workers) as executor:
+                for batch in batches:
+                    list(executor.map(generate_in_worker, [str(blob_id) for blob_id in batch]))
+                    self.stdout.write("Processed {} images.".format(len(batch)))
+
+        self.stdout.write(self.style.SUCCESS("Generated the derivatives of {} images.".format(len(blob_ids))))
+
+    def adopt_legacy_images(self, batch_size):
+        """Images stored before blobs existed have nothing to attach derivatives to, move them onto blobs."""
+        failed = set()
+        while True:
+            names = list(
+                UserImage.objects.filter(blob__isnull=True)
+                .exclude(image__in=failed)
+                .values_list("image", flat=True)
+                .distinct()[:batch_size]
+            )
+            if not names:
+                break
+            for name in names:
+                try:
+                    ImageBlob.objects.adopt(name)
+                except OSError as error:
+                    failed.add(name)
+                    self.stderr.write("Could not read {}: {}".format(name, error))
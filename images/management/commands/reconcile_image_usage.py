@@ -0,0 +1,30 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from images.models import ImageUsage
+
+
+class Command(BaseCommand):
+    help = "Recount the image statistics of every user from their images, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of users recounted per batch.")
+
+    def handle(self, *args, batch_size, **options):
+        # One short transaction per batch of users, so uploads and shares only wait for the batch they are in.
+        checked = corrected = 0
+        last_pk = 0
+        while True:
+            owner_ids = list(
+                User.objects.filter(pk__gt=last_pk).order_by("pk").values_list("pk", flat=True)[:batch_size]
+            )
+            if not owner_ids:
+                break
+            last_pk = owner_ids[-1]
+            fixed = ImageUsage.objects.reconcile(owner_ids)
+            checked += len(owner_ids)
+            corrected += fixed
+            self.stdout.write("Checked {} users, corrected {}.".format(len(owner_ids), fixed))
+
+        self.stdout.write(
+            self.style.SUCCESS("Recounted the images of {} users, {} were corrected.".format(checked, corrected))
+        )
@@ -0,0 +1,78 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:18
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copies of images.search as of this migration, so that it keeps indexing names the same way whatever the app
+# code becomes.
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return _SEPARATORS.sub(' ', name.casefold()).strip()
+
+
+def name_trigrams(search_name):
+    if not search_name:
+        return set()
+    padded = '  {} '.format(search_name)
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def index_existing_images(apps, schema_editor):
+    UserImage = apps.get_model('images', 'UserImage')
+    ImageTrigram = apps.get_model('images', 'ImageTrigram')
+
+    images = []
+    for image in UserImage.objects.only('id', 'image').iterator(chunk_size=1000):
+        image.search_name = normalize_name(image.image.name)
+        images.append(image)
+        if len(images) == 1000:
+            _index(UserImage, ImageTrigram, images)
+            images = []
+    _index(UserImage, ImageTrigram, images)
+
+
+def _index(UserImage, ImageTrigram, images):
+    UserImage.objects.bulk_update(images, ['search_name'])
+    ImageTrigram.objects.bulk_create(
+        [ImageTrigram(image_id=image.pk, trigram=trigram) for image in images for trigram in name_trigrams(image.search_name)]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='search_name',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.CreateModel(
+            name='ImageTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+                (
+                    'image',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='images.userimage'
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='imagetrigram',
+            index=models.Index(fields=['trigram', 'image'], name='images_trigram_lookup'),
+        ),
+        migrations.RunPython(index_existing_images, migrations.RunPython.noop),
+    ]
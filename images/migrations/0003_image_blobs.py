@@ -0,0 +1,55 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:20
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def name_existing_images(apps, schema_editor):
+    # Existing images keep the name of their stored file.
+    UserImage = apps.get_model('images', 'UserImage')
+    UserImage.objects.update(name=models.F('image'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0002_image_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('datetime_updated', models.DateTimeField(auto_now=True)),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('file', models.FileField(upload_to='')),
+                ('size', models.IntegerField()),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='name',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='blob',
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name='images',
+                to='images.imageblob',
+            ),
+        ),
+        migrations.RunPython(name_existing_images, migrations.RunPython.noop),
+    ]
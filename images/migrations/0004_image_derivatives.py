@@ -0,0 +1,39 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:26
+
+import uuid
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0003_image_blobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageDerivative',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('datetime_updated', models.DateTimeField(auto_now=True)),
+                ('datetime_created', models.DateTimeField(auto_now_add=True)),
+                ('kind', models.CharField(max_length=32)),
+                ('file', models.FileField(upload_to='')),
+                ('width', models.IntegerField()),
+                ('height', models.IntegerField()),
+                ('size', models.IntegerField()),
+                (
+                    'blob',
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name='derivatives', to='images.imageblob'
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='imagederivative',
+            constraint=models.UniqueConstraint(fields=('blob', 'kind'), name='images_unique_derivative_kind'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.2.7 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+def merge_duplicate_images(apps, schema_editor):
+    # Owners keep their oldest copy of each image, which takes over the shares of the others.
+    UserImage = apps.get_model('images', 'UserImage')
+    ImageBlob = apps.get_model('images', 'ImageBlob')
+    duplicates = (
+        UserImage.objects.values('owner', 'image')
+        .annotate(copies=models.Count('id'))
+        .filter(copies__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        kept, *merged = UserImage.objects.filter(owner=duplicate['owner'], image=duplicate['image']).order_by(
+            'datetime_created', 'id'
+        )
+        kept.times_shared += sum(image.times_shared for image in merged)
+        kept.save(update_fields=['times_shared'])
+        if kept.blob_id is not None:
+            ImageBlob.objects.filter(pk=kept.blob_id).update(ref_count=models.F('ref_count') - len(merged))
+        UserImage.objects.filter(pk__in=[image.pk for image in merged]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0004_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_images, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userimage',
+            constraint=models.UniqueConstraint(fields=('owner', 'image'), name='images_unique_owner_image'),
+        ),
+    ]
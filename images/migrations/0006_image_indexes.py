@@ -0,0 +1,31 @@
+# Generated by Django 3.2.7 on 2026-10-18 11:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('images', '0005_unique_owner_image'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userimage',
+            name='owner',
+            field=models.ForeignKey(
+                db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='userimage',
+            index=models.Index(fields=['owner', '-datetime_created', '-id'], name='images_owner_recent'),
+        ),
+        migrations.AddIndex(
+            model_name='userimage',
+            index=models.Index(fields=['owner', 'name'], name='images_owner_name'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:12
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def count_existing_images(apps, schema_editor):
+    UserImage = apps.get_model('images', 'UserImage')
+    ImageUsage = apps.get_model('images', 'ImageUsage')
+    totals = UserImage.objects.values('owner').annotate(total=models.Sum('size'), count=models.Count('id'))
+    ImageUsage.objects.bulk_create(
+        (ImageUsage(owner_id=row['owner'], bytes=row['total'] or 0, images=row['count']) for row in totals.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('images', '0006_image_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageUsage',
+            fields=[
+                (
+                    'owner',
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name='image_usage',
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ('bytes', models.BigIntegerField(default=0)),
+                ('images', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(count_existing_images, migrations.RunPython.noop),
+    ]
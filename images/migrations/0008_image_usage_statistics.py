@@ -0,0 +1,36 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:16
+
+from django.db import migrations, models
+
+
+def count_existing_statistics(apps, schema_editor):
+    UserImage = apps.get_model('images', 'UserImage')
+    ImageUsage = apps.get_model('images', 'ImageUsage')
+    totals = UserImage.objects.values('owner').annotate(
+        private_images=models.Count('id', filter=models.Q(private=True)), times_shared=models.Sum('times_shared')
+    )
+    for row in totals.iterator():
+        ImageUsage.objects.filter(pk=row['owner']).update(
+            private_images=row['private_images'], times_shared=row['times_shared'] or 0
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0007_image_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageusage',
+            name='private_images',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='imageusage',
+            name='times_shared',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(count_existing_statistics, migrations.RunPython.noop),
+    ]
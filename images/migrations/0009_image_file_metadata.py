@@ -0,0 +1,33 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0008_image_usage_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userimage',
+            name='content_type',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='height',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='userimage',
+            name='width',
+            field=models.IntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:37
+
+import os
+import re
+import unicodedata
+
+from django.db import migrations, models
+
+# Copies of images.models.numbered_name and images.search as of this migration, so that it keeps renaming and
+# indexing names the same way whatever the app code becomes.
+_SEPARATORS = re.compile(r'[\W_]+')
+
+
+def numbered_name(name, number, max_length=255):
+    stem, extension = os.path.splitext(name)
+    suffix = ' ({}){}'.format(number, extension)
+    return stem[: max_length - len(suffix)] + suffix
+
+
+def normalize_name(name):
+    name = unicodedata.normalize('NFKD', name or '')
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    return _SEPARATORS.sub(' ', name.casefold()).strip()
+
+
+def name_trigrams(search_name):
+    if not search_name:
+        return set()
+    padded = '  {} '.format(search_name)
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def number_duplicate_names(apps, schema_editor):
+    UserImage = apps.get_model('images', 'UserImage')
+    ImageTrigram = apps.get_model('images', 'ImageTrigram')
+    duplicates = (
+        UserImage.objects.values('owner', 'name').annotate(count=models.Count('id')).filter(count__gt=1).order_by()
+    )
+    for row in duplicates.iterator():
+        taken = set(UserImage.objects.filter(owner=row['owner']).values_list('name', flat=True))
+        images = UserImage.objects.filter(owner=row['owner'], name=row['name']).order_by('datetime_created', 'id')
+        # The oldest image keeps the name.
+        for image in list(images)[1:]:
+            number = 2
+            while numbered_name(row['name'], number) in taken:
+                number += 1
+            image.name = numbered_name(row['name'], number)
+            image.search_name = normalize_name(image.name)
+            image.save(update_fields=['name', 'search_name'])
+            taken.add(image.name)
+            ImageTrigram.objects.filter(image=image).delete()
+            ImageTrigram.objects.bulk_create(
+                [ImageTrigram(image_id=image.pk, trigram=trigram) for trigram in name_trigrams(image.search_name)]
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0009_image_file_metadata'),
+    ]
+
+    operations = [
+        migrations.RunPython(number_duplicate_names, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userimage',
+            constraint=models.UniqueConstraint(fields=('owner', 'name'), name='images_unique_owner_name'),
+        ),
+        migrations.RemoveIndex(
+            model_name='userimage',
+            name='images_owner_name',
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.7 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0010_unique_owner_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='imageblob',
+            name='derivatives_failed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,18 +1,590 @@
+import hashlib
+import mimetypes
+import os
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Case, Count, F, IntegerField, Q, Sum, When
+from django.db.models.functions import Length
 from lib.models import BaseAbstractModel
 
+from .cache import invalidate_images
+from .headers import read_image_info
+from .search import name_trigrams, normalize_name, query_trigrams
+from .storage import copy_stored_file
+
+
+def file_digest(file) -> str:
+    """Hex SHA-256 of a file's contents, reusing the digest computed while it was uploaded if there is one."""
+    digest = getattr(file, "sha256", None)
+    if digest is None:
+        hasher = hashlib.sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        digest = hasher.hexdigest()
+    return digest
+
+
+def blob_name(digest: str, file) -> str:
+    """
+    The name the file of a blob holding the contents of ``file`` is stored as.
+
+    It only depends on the contents, never on the name any user uploaded them as: blobs are shared by every user
+    with the same contents, so their names must neither reveal another user's file name nor whether someone else
+    stored the contents first.
+    """
+    info = getattr(file, "image_info", None) or read_image_info(file)
+    extension = mimetypes.guess_extension(info.content_type) if info is not None else None
+    return "blobs/{}{}".format(digest, extension or "")
+
+
+def numbered_name(name: str, number: int, max_length: int = 255) -> str:
+    """``name`` marked as the ``number``-th of that name, e.g. ``"cat (2).png"``, within ``max_length``."""
+    stem, extension = os.path.splitext(name)
+    suffix = " ({}){}".format(number, extension)
+    return stem[: max_length - len(suffix)] + suffix
+
+
+def discard_stored_upload(file) -> None:
+    """Remove the stored copy of an upload that was streamed to storage, if it was."""
+    if hasattr(file, "discard"):
+        file.discard()
+
+
+class ImageBlobManager(models.Manager):
+    def acquire(self, file) -> Tuple["ImageBlob", bool]:
+        """
+        Return a reference to the blob holding the contents of ``file``, and whether the blob was created.
+
+        The file is only sent to storage when no blob holds the same contents yet.
+        """
+        digest = file_digest(file)
+        blob = self._retain(digest=digest)
+        if blob is not None:
+            discard_stored_upload(file)
+            return blob, False
+
+        blob = self.model(digest=digest, size=file.size, ref_count=1)
+        if getattr(file, "storage_name", None):
+            # Already streamed to storage while it was uploaded, under the name it was uploaded as.
+            blob.file.name = copy_stored_file(blob.file.storage, file.storage_name, blob_name(digest, file))
+            discard_stored_upload(file)
+        else:
+            blob.file.save(blob_name(digest, file), file, save=False)
+        try:
+            with transaction.atomic():
+                blob.save(force_insert=True)
+        except IntegrityError:
+            # A concurrent upload stored the same contents first, use theirs instead.
+            existing = self._retain(digest=digest)
+            if existing.file.name != blob.file.name:
+                blob.file.delete(save=False)
+            return existing, False
+        return blob, True
+
+    def missing(self, digests: Iterable[str]) -> Set[str]:
+        """The digests no blob holds the contents of yet."""
+        digests = set(digests)
+        return digests - set(self.filter(digest__in=digests).values_list("digest", flat=True))
+
+    def reference_many(self, digests: Iterable[str], stored: Dict[str, Tuple[str, int]]) -> Dict[str, "ImageBlob"]:
+        """
+        Add a reference to a blob for each digest in ``digests`` (repeated once per reference), and return the
+        blobs by digest. ``stored`` maps digests just sent to storage to their ``(file name, size)``.
+
+        Must run in a transaction. Digests with no blob, e.g. if it was deleted meanwhile, are left out.
+        """
+        self.bulk_create(
+            [self.model(digest=digest, file=name, size=size) for digest, (name, size) in stored.items()],
+            ignore_conflicts=True,
+        )
+
+        counts = Counter(digests)
+        references = defaultdict(list)
+        for digest, count in counts.items():
+            references[count].append(digest)
+        for count, grouped in references.items():
+            self.filter(digest__in=grouped).update(ref_count=F("ref_count") + count)
+
+        blobs = {blob.digest: blob for blob in self.filter(digest__in=counts)}
+        for digest, (name, size) in stored.items():
+            if digest in blobs and blobs[digest].file.name != name:
+                # A concurrent upload stored the same contents first, use theirs instead.
+                transaction.on_commit(lambda name=name, storage=blobs[digest].file.storage: storage.delete(name))
+        return blobs
+
+    def adopt(self, name: str) -> "ImageBlob":
+        """Move the images stored as ``name`` before blobs existed onto a blob, and return the blob."""
+        storage = self.model._meta.get_field("file").storage
+        with storage.open(name, "rb") as file:
+            digest = file_digest(file)
+            size = file.size
+            key = blob_name(digest, file)
+
+        blob = self.filter(digest=digest).first()
+        # Stored again under the blob's name, the file is only removed once the images point at the copy.
+        copy = copy_stored_file(storage, name, key) if blob is None else None
+        try:
+            with transaction.atomic():
+                images = UserImage.objects.filter(image=name, blob__isnull=True)
+                blob, _ = self.get_or_create(digest=digest, defaults={"file": copy, "size": size})
+                # Owners who already have these contents keep a single image.
+                images.filter(owner__in=UserImage.objects.filter(image=blob.file.name).values("owner")).delete()
+                adopted = images.update(blob=blob, image=blob.file.name)
+                self.filter(pk=blob.pk).update(ref_count=F("ref_count") + adopted)
+                transaction.on_commit(lambda: storage.delete(name))
+        except BaseException:
+            if copy is not None:
+                storage.delete(copy)
+            raise
+        if copy is not None and blob.file.name != copy:
+            # The contents were stored as a blob concurrently.
+            storage.delete(copy)
+        return blob
+
+    def retain(self, blob_id) -> None:
+        """Add a reference to an existing blob."""
+        self._retain(pk=blob_id, fetch=False)
+
+    def release(self, blob_ids: Iterable) -> None:
+        """Drop a reference to each blob, deleting blobs and their stored file once nothing refers to them."""
+        blob_ids = [blob_id for blob_id in blob_ids if blob_id is not None]
+        if not blob_ids:
+            return
+
+        with transaction.atomic():
+            for blob_id in blob_ids:
+                self.filter(pk=blob_id).update(ref_count=F("ref_count") - 1)
+            orphans = list(
+                self.select_for_update().filter(pk__in=blob_ids, ref_count__lte=0).prefetch_related("derivatives")
+            )
+            for blob in orphans:
+                files = [blob.file] + [derivative.file for derivative in blob.derivatives.all()]
+                blob.delete()
+                for file in files:
+                    transaction.on_commit(lambda name=file.name, storage=file.storage: storage.delete(name))
+
+    def _retain(self, fetch=True, **lookup) -> Optional["ImageBlob"]:
+        if self.filter(**lookup).update(ref_count=F("ref_count") + 1):
+            return self.get(**lookup) if fetch else None
+        return None
+
+
+class ImageBlob(BaseAbstractModel):
+    """A stored file, shared by every UserImage with the same contents."""
+
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.FileField(null=False, blank=False)
+    size = models.IntegerField()
+    ref_count = models.PositiveIntegerField(default=0)
+    # When generating its derivatives in the background last failed, until the generate_derivatives command retries.
+    derivatives_failed_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return "Blob: {} - References: {}".format(self.digest, self.ref_count)
+
+
+class ImageDerivative(BaseAbstractModel):
+    """A variant of a blob's image, e.g. a thumbnail, generated in the background."""
+
+    blob = models.ForeignKey(to=ImageBlob, on_delete=models.CASCADE, related_name="derivatives")
+    kind = models.CharField(max_length=32)
+    file = models.FileField(null=False, blank=False)
+    width = models.IntegerField()
+    height = models.IntegerField()
+    size = models.IntegerField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["blob", "kind"], name="images_unique_derivative_kind")]
+
+    def __str__(self):
+        return "Derivative: {} - Kind: {}".format(self.blob.digest, self.kind)
+
+
+class UserImageQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Like QuerySet.bulk_create, also filling in the fields ``save()`` derives, indexing the names and dropping
+        the cached responses the images appear in, since no signals are sent.
+        """
+        objs = list(objs)
+        for image in objs:
+            image.name = image.name or image.image.name
+            image.search_name = normalize_name(image.name)
+            if image.size is None:
+                image.size = image.blob.size if image.blob_id else image.image.size
+            if image.blob_id and not image.digest:
+                image.digest = image.blob.digest
+
+        with transaction.atomic():
+            created = super().bulk_create(objs, *args, **kwargs)
+            ImageTrigram.objects.add(created)
+            ImageUsage.objects.add(created)
+            invalidate_images(created)
+        return created
+
+    def available_names(self, owner_id, names: Iterable[str], reserved: Iterable[str] = ()) -> List[str]:
+        """
+        Names for new images of an owner, with one query: each of ``names``, numbered when the owner already has
+        an image of that name, or it is ``reserved`` or taken by an earlier one of ``names``.
+        """
+        names = list(names)
+        if not names:
+            return []
+        lookup = Q()
+        for name in set(names):
+            lookup |= Q(name__startswith=os.path.splitext(name)[0][:200])
+        taken = set(self.filter(lookup, owner_id=owner_id).values_list("name", flat=True))
+        taken.update(reserved)
+
+        available = []
+        for name in names:
+            free, number = name, 1
+            while free in taken:
+                number += 1
+                free = numbered_name(name, number)
+            taken.add(free)
+            available.append(free)
+        return available
+
+    def share(self, image: "UserImage", owner_id) -> Optional["UserImage"]:
+        """
+        Give a copy of ``image`` to another user and count the share, or return None if they already have it.
+
+        Conflicts are detected by the unique constraints when the copy is inserted, and the counter is incremented
+        in the database, so concurrent shares neither create duplicates nor lose counts. A copy whose name the user
+        has already given another image is numbered, like an upload would be.
+        """
+        copy = self.model(
+            owner_id=owner_id, image=image.image.name, name=image.name, blob=image.blob, **image.file_metadata()
+        )
+        try:
+            self._insert_share(image, copy)
+        except IntegrityError:
+            if self.filter(owner_id=owner_id, image=copy.image.name).exists():
+                return None
+            copy.name = self.available_names(owner_id, [image.name])[0]
+            try:
+                self._insert_share(image, copy)
+            except IntegrityError:
+                return None
+        # The image's owner counts its shares when it is deleted.
+        image.times_shared += 1
+        # update() sends no signals.
+        invalidate_images([image])
+        return copy
+
+    def _insert_share(self, image: "UserImage", copy: "UserImage") -> None:
+        with transaction.atomic():
+            copy.save(force_insert=True, shared_from=image)
+            self.filter(pk=image.pk).update(times_shared=F("times_shared") + 1)
+
+    def search(self, name: str) -> "UserImageQuerySet":
+        """Images whose name contains ``name``, best matches first."""
+        query = normalize_name(name)
+        trigrams = query_trigrams(query)
+        if not trigrams:
+            return self.none()
+
+        # Candidates come from the trigram index, then are checked against the name itself since
+        # sharing every trigram does not guarantee the trigrams appear in the same order.
+        candidates = (
+            ImageTrigram.objects.filter(trigram__in=trigrams)
+            .values("image")
+            .annotate(hits=Count("trigram"))
+            .filter(hits=len(trigrams))
+            .values("image")
+        )
+        lookup = "search_name__contains" if len(query) >= 3 else "search_name__startswith"
+        return (
+            self.filter(pk__in=candidates, **{lookup: query})
+            .annotate(
+                rank=Case(
+                    When(search_name=query, then=0),
+                    When(search_name__startswith=query, then=1),
+                    default=2,
+                    output_field=IntegerField(),
+                ),
+                name_length=Length("search_name"),
+            )
+            .order_by("rank", "name_length", "datetime_created", "id")
+        )
+
 
 class UserImage(BaseAbstractModel):
-    owner = models.ForeignKey(to=User, on_delete=models.CASCADE)
+    # Indexed by the composite indexes below, which all lead with the owner.
+    owner = models.ForeignKey(to=User, on_delete=models.CASCADE, db_index=False)
     private = models.BooleanField(default=False)
     image = models.FileField(null=False, blank=False)
+    name = models.CharField(max_length=255, blank=True, default="")
+    blob = models.ForeignKey(
+        to=ImageBlob, null=True, blank=True, editable=False, on_delete=models.PROTECT, related_name="images"
+    )
     times_shared = models.IntegerField(default=0)
     size = models.IntegerField()
+    search_name = models.CharField(max_length=255, blank=True, default="", editable=False)
+    # Captured from the upload when the image is added, so the stored file is never read again to describe it.
+    # Unknown for images added before they were, until ``backfill_image_metadata`` fills them in.
+    width = models.IntegerField(null=True, blank=True, editable=False)
+    height = models.IntegerField(null=True, blank=True, editable=False)
+    content_type = models.CharField(max_length=32, blank=True, default="", editable=False)
+    # Hex SHA-256 of the file's contents.
+    digest = models.CharField(max_length=64, blank=True, default="", editable=False)
+
+    objects = UserImageQuerySet.as_manager()
+
+    # The fields describing the stored file, which every copy of the image shares.
+    file_metadata_fields = ("size", "width", "height", "content_type", "digest")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "image"], name="images_unique_owner_image"),
+            # Images are shared by name, which must pick a single one. Also indexes a user's images by name.
+            models.UniqueConstraint(fields=["owner", "name"], name="images_unique_owner_name"),
+        ]
+        indexes = [
+            # A user's images newest first, as listed and paginated.
+            models.Index(fields=["owner", "-datetime_created", "-id"], name="images_owner_recent"),
+        ]
+
+    def save(self, *args, shared_from: "UserImage" = None, **kwargs):
+        """Save the image, counting it as a share of ``shared_from`` in its owner's usage if given."""
+        adding = self._state.adding
+        uploaded = bool(adding and self.image and not self.image._committed)
+        acquired = bool(adding and not self.blob_id and self.image and not self.image._committed)
+        if acquired:
+            # A new upload, only stored if no blob has the same contents.
+            self.name = self.name or self.image.name
+            self.capture_file_metadata(self.image.file)
+            self.blob, _ = ImageBlob.objects.acquire(self.image.file)
+            self.image = self.blob.file.name
+
+        # Another image with the same contents, e.g. a shared image.
+        shared = bool(adding and self.blob_id and not acquired)
+        try:
+            # A share is saved in a transaction of its own already, which it rolls back whole on conflicts.
+            with transaction.atomic(savepoint=shared_from is None):
+                if shared:
+                    self.image = self.blob.file.name
+                elif self.image and not self.image._committed:
+                    # Described before the file is stored, as its size would then be asked of the storage.
+                    self.size = self.image.size
+                    self.capture_file_metadata(self.image.file)
+                    self.image.save(self.image.name, self.image.file, save=False)
 
-    def save(self, *args, **kwargs):
-        self.size = self.image.size
-        super().save(*args, **kwargs)
+                if self.blob_id:
+                    self.size = self.blob.size
+                    self.digest = self.digest or self.blob.digest
+                elif self.size is None:
+                    self.size = self.image.size
+                self.name = self.name or self.image.name
+                if uploaded:
+                    # Uploads are numbered rather than rejected when the owner has an image of the same name.
+                    self.name = UserImage.objects.available_names(self.owner_id, [self.name])[0]
+                self.search_name = normalize_name(self.name)
+                super().save(*args, **kwargs)
+                if shared:
+                    # After the insert, which fails first if the owner already has the image.
+                    ImageBlob.objects.retain(self.blob_id)
+
+                update_fields = kwargs.get("update_fields")
+                if adding:
+                    ImageTrigram.objects.add([self])
+                    ImageUsage.objects.add([self], shares=[shared_from] if shared_from else [])
+                elif update_fields is None or "name" in update_fields:
+                    ImageTrigram.objects.index([self])
+        except Exception:
+            if acquired:
+                ImageBlob.objects.release([self.blob_id])
+            raise
+
+    def capture_file_metadata(self, file) -> None:
+        """
+        Describe the image from its upload ``file``, with the header parsed while the upload was validated or
+        received if it was. Files streamed to storage are not read back.
+        """
+        info = getattr(file, "image_info", None)
+        if info is None and not getattr(file, "storage_name", None):
+            info = read_image_info(file)
+        if info is not None:
+            self.content_type, self.width, self.height = info
+        if getattr(file, "sha256", None):
+            self.digest = file.sha256
+
+    def file_metadata(self) -> Dict:
+        return {field: getattr(self, field) for field in self.file_metadata_fields}
 
     def __str__(self):
-        return "ImageName: {} - Owner: {}".format(self.image.name, self.owner.username)
+        return "ImageName: {} - Owner: {}".format(self.name, self.owner.username)
+
+
+class ImageTrigramManager(models.Manager):
+    def index(self, images) -> None:
+        """(Re)build the trigram index of the given images."""
+        self.filter(image__in=[image.pk for image in images]).delete()
+        self.add(images)
+
+    def add(self, images) -> None:
+        """Index images that are not in the index yet."""
+        self.bulk_create(
+            [
+                self.model(image_id=image.pk, trigram=trigram)
+                for image in images
+                for trigram in name_trigrams(image.search_name)
+            ]
+        )
+
+
+class ImageTrigram(models.Model):
+    """Search index of UserImage names, one row per trigram of the normalized name."""
+
+    image = models.ForeignKey(to=UserImage, on_delete=models.CASCADE, related_name="trigrams")
+    trigram = models.CharField(max_length=3)
+
+    objects = ImageTrigramManager()
+
+    class Meta:
+        indexes = [models.Index(fields=["trigram", "image"], name="images_trigram_lookup")]
+
+
+class ImageUsageManager(models.Manager):
+    # The counters kept for each owner, and what each image adds to them.
+    counters = {
+        "bytes": lambda image: image.size,
+        "images": lambda image: 1,
+        "private_images": lambda image: int(image.private),
+        "times_shared": lambda image: image.times_shared,
+    }
+
+    def _totals(self, images) -> Dict[int, Dict[str, int]]:
+        totals = defaultdict(lambda: dict.fromkeys(self.counters, 0))
+        for image in images:
+            owner_totals = totals[image.owner_id]
+            for counter, value in self.counters.items():
+                owner_totals[counter] += value(image)
+        return totals
+
+    def add(self, images, shares=()) -> None:
+        """
+        Count new images in their owners' usage, and the images in ``shares`` as shared once more in theirs, with a
+        single upsert whatever the number of owners.
+
+        The totals are incremented in the database, so concurrent uploads and shares never lose counts.
+        """
+        totals = self._totals(images)
+        for image in shares:
+            totals[image.owner_id]["times_shared"] += 1
+        if not totals:
+            return
+
+        connection = connections[self.db]
+        if connection.vendor not in ("postgresql", "sqlite"):
+            for owner_id, owner_totals in totals.items():
+                usage, created = self.get_or_create(owner_id=owner_id, defaults=owner_totals)
+                if not created:
+                    self.increment(owner_id, **owner_totals)
+            return
+
+        quote = connection.ops.quote_name
+        table = quote(self.model._meta.db_table)
+        columns = [quote(self.model._meta.get_field(name).column) for name in ["owner", *self.counters]]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO {table} ({columns}) VALUES {rows} ON CONFLICT ({owner}) DO UPDATE SET {updates}".format(
+                    table=table,
+                    columns=", ".join(columns),
+                    rows=", ".join(["({})".format(", ".join(["%s"] * len(columns)))] * len(totals)),
+                    owner=columns[0],
+                    updates=", ".join(
+                        "{column} = {table}.{column} + excluded.{column}".format(table=table, column=column)
+                        for column in columns[1:]
+                    ),
+                ),
+                [
+                    value
+                    for owner_id, owner_totals in totals.items()
+                    for value in (owner_id, *(owner_totals[counter] for counter in self.counters))
+                ],
+            )
+
+    def remove(self, images) -> None:
+        """Stop counting deleted images in their owners' usage."""
+        for owner_id, owner_totals in self._totals(images).items():
+            self.increment(owner_id, **{counter: -value for counter, value in owner_totals.items()})
+
+    def increment(self, owner_id, **counters) -> None:
+        """Add to an owner's counters in the database, if they have a row."""
+        self.filter(pk=owner_id).update(**{counter: F(counter) + value for counter, value in counters.items()})
+
+    def used_bytes(self, owner_id) -> int:
+        return self.filter(pk=owner_id).values_list("bytes", flat=True).first() or 0
+
+    def reconcile(self, owner_ids) -> int:
+        """
+        Recount the usage of the given owners from their images, returning the number of rows corrected.
+
+        The rows are locked while they are recounted, so uploads and shares of those owners wait for the new
+        totals and then count on top of them.
+        """
+        owner_ids = list(owner_ids)
+        with transaction.atomic():
+            rows = self.select_for_update().in_bulk(owner_ids)
+            actual = {
+                row.pop("owner"): row
+                for row in UserImage.objects.filter(owner_id__in=owner_ids)
+                .values("owner")
+                .annotate(
+                    bytes=Sum("size"),
+                    images=Count("id"),
+                    private_images=Count("id", filter=Q(private=True)),
+                    times_shared=Sum("times_shared"),
+                )
+                .order_by()
+            }
+
+            stale, missing = [], []
+            for owner_id in owner_ids:
+                totals = actual.get(owner_id, dict.fromkeys(self.counters, 0))
+                row = rows.get(owner_id)
+                if row is None:
+                    if owner_id in actual:
+                        missing.append(self.model(owner_id=owner_id, **totals))
+                elif any(getattr(row, counter) != totals[counter] for counter in self.counters):
+                    for counter in self.counters:
+                        setattr(row, counter, totals[counter])
+                    stale.append(row)
+            self.bulk_update(stale, list(self.counters))
+            # Rows created by a concurrent upload meanwhile count it already.
+            self.bulk_create(missing, ignore_conflicts=True)
+        return len(stale) + len(missing)
+
+
+class ImageUsage(models.Model):
+    """
+    Statistics of a user's images, kept up to date as images are added, shared and deleted so they are read
+    without aggregating the images.
+
+    Every copy of an image counts in full, even though copies share one stored blob, as each is the owner's to
+    keep. The row is created with the owner's first image. The counters are only changed by increments in the
+    transactions changing the images, ``reconcile`` recounts them should they drift, e.g. after raw SQL changes.
+    """
+
+    owner = models.OneToOneField(to=User, on_delete=models.CASCADE, primary_key=True, related_name="image_usage")
+    bytes = models.BigIntegerField(default=0)
+    images = models.IntegerField(default=0)
+    private_images = models.IntegerField(default=0)
+    # How many times the owner's images were shared.
+    times_shared = models.BigIntegerField(default=0)
+
+    objects = ImageUsageManager()
+
+    def __str__(self):
+        return "Usage of {}: {} bytes in {} images".format(self.owner_id, self.bytes, self.images)
+
+    @property
+    def public_images(self) -> int:
+        return self.images - self.private_images
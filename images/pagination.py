@@ -0,0 +1,102 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from typing import List, Optional
+from uuid import UUID
+
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Paginate a queryset on the (datetime_created, id) keyset, newest first.
+
+    Unlike offset pagination, fetching a page costs the same no matter how deep into the result set it is,
+    since each page picks up strictly after the last row of the previous one.
+    """
+
+    ordering = ("-datetime_created", "-id")
+    cursor_query_param = "cursor"
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset: QuerySet, request: Request, view=None) -> List:
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_position = None
+
+        position = self.decode_cursor(request)
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            created, pk = position
+            queryset = queryset.filter(Q(datetime_created__lt=created) | Q(datetime_created=created, id__lt=pk))
+
+        # Fetch one extra row to find out whether there is a following page.
+        results = list(queryset[: self.page_size + 1])
+        if len(results) > self.page_size:
+            results = results[: self.page_size]
+            last = results[-1]
+            self.next_position = (last.datetime_created, last.pk)
+        return results
+
+    def get_paginated_response(self, data) -> Response:
+        return Response(OrderedDict([("next", self.get_next_link()), ("results", data)]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "properties": {
+                "next": {"type": "string", "nullable": True},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request: Request) -> int:
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_next_link(self) -> Optional[str]:
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def encode_cursor(self, position) -> str:
+        created, pk = position
+        token = "{}|{}".format(created.isoformat(), pk)
+        return urlsafe_b64encode(token.encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, request: Request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created, pk = urlsafe_b64decode(encoded.encode("ascii")).decode("ascii").split("|", 1)
+            created = parse_datetime(created)
+            pk = UUID(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created, pk
+
+
+class SearchResultsPagination(PageNumberPagination):
+    """Page through ranked search results, which have no stable keyset to paginate on."""
+
+    page_size = 50
+    page_size_query_param = "page_size"
+    max_page_size = 200
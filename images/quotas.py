@@ -0,0 +1,50 @@
+from typing import Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework import permissions, status
+from rest_framework.exceptions import APIException
+
+from .models import ImageUsage
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = "This upload would take you over your storage quota."
+    default_code = "quota_exceeded"
+
+
+def remaining_storage(owner: User) -> Optional[int]:
+    """The bytes the owner may still add to their images, or None when storage is not limited."""
+    quota = settings.IMAGES_STORAGE_QUOTA
+    if not quota:
+        return None
+    return max(quota - ImageUsage.objects.used_bytes(owner.pk), 0)
+
+
+class WithinStorageQuota(permissions.BasePermission):
+    """
+    Reject uploads larger than the storage their user has left, from their ``Content-Length``.
+
+    Permissions are checked before the body is parsed, so no byte of a rejected upload is read, let alone sent to
+    storage. The remaining bytes are kept as ``request.remaining_storage`` for the upload to check the files it
+    actually adds, as the body is larger than the files it holds. Concurrent uploads are checked against the same
+    usage, so together they may go over the quota by up to one request each.
+    """
+
+    def has_permission(self, request, view) -> bool:
+        if not request.user.is_authenticated:
+            # Rejected by the other permissions.
+            return True
+
+        remaining = remaining_storage(request.user)
+        request.remaining_storage = remaining
+        if remaining is None:
+            return True
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > remaining:
+            raise QuotaExceeded()
+        return True
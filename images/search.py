@@ -0,0 +1,42 @@
+import re
+import unicodedata
+from typing import Set
+
+_SEPARATORS = re.compile(r"[\W_]+")
+
+
+def normalize_name(name: str) -> str:
+    """
+    Normalize an image name for searching.
+
+    Accents are stripped, the name is lowercased and every run of punctuation becomes a single space,
+    so ``"My_Photo.PNG"`` and ``"my photo png"`` are indexed the same way.
+    """
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(char for char in name if not unicodedata.combining(char))
+    return _SEPARATORS.sub(" ", name.casefold()).strip()
+
+
+def _trigrams(text: str) -> Set[str]:
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def name_trigrams(search_name: str) -> Set[str]:
+    """Trigrams stored in the index for a normalized name. The padding marks the start and end of the name."""
+    if not search_name:
+        return set()
+    return _trigrams("  {} ".format(search_name))
+
+
+def query_trigrams(query: str) -> Set[str]:
+    """
+    Trigrams an indexed name must contain to match a normalized query.
+
+    Queries of three characters or more match anywhere in the name. Shorter queries cannot be split into
+    trigrams, so they only match the start of a name.
+    """
+    if not query:
+        return set()
+    if len(query) < 3:
+        return _trigrams("  {}".format(query))
+    return _trigrams(query)
@@ -1,28 +1,168 @@
-from typing import Dict
+from typing import Dict, List
 
-from images.models import UserImage
+from django.conf import settings
+from django.core import signing
+from django.core.files.uploadedfile import UploadedFile
+from images.direct_uploads import DirectUploadTicket
+from images.headers import read_image_info
+from images.models import ImageUsage, UserImage
+from images.url_signing import file_url
 from lib.validators import validate_image_extension, validate_image_file_size
 from rest_framework import serializers
 from rest_framework.fields import CharField
 
 
+class ImageHeaderField(serializers.ImageField):
+    """
+    An ImageField which validates images by parsing their container header instead of decoding them.
+
+    The format and dimensions come from the magic bytes and header alone, which is enough to reject non-images
+    and decompression bombs over ``IMAGES_MAX_PIXELS`` without spending the CPU to decode every upload. Files
+    streamed to storage were parsed while they were received, so they are not fetched back. The full Pillow
+    check still runs on top when ``IMAGES_VALIDATION_MODE`` is ``"full"``.
+    """
+
+    default_error_messages = {
+        "too_many_pixels": "The image may have at most {max_pixels} pixels.",
+    }
+
+    def to_internal_value(self, data):
+        file_object = serializers.FileField.to_internal_value(self, data)
+        if hasattr(file_object, "image_info"):
+            info = file_object.image_info
+        else:
+            info = read_image_info(file_object)
+        if info is None:
+            self.fail("invalid_image")
+        if info.pixels > settings.IMAGES_MAX_PIXELS:
+            self.fail("too_many_pixels", max_pixels=settings.IMAGES_MAX_PIXELS)
+
+        file_object.image_info = info
+        file_object.content_type = info.content_type
+        if settings.IMAGES_VALIDATION_MODE == "full":
+            return super().to_internal_value(data)
+        return file_object
+
+    def to_representation(self, value):
+        # The URL is picked by ImageSerializer, asking the storage for one here would be wasted.
+        return value.name if value else None
+
+
 class ImageSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField(
+    image = ImageHeaderField(
         required=True, validators=[validate_image_file_size, validate_image_extension]
     )
-    name = serializers.CharField(source="image.name", read_only=True)
+    name = serializers.CharField(read_only=True)
     owner = serializers.CharField(source="owner.username", read_only=True)
+    derivatives = serializers.SerializerMethodField()
 
     class Meta:
         model = UserImage
-        fields = ["owner", "image", "name", "times_shared", "size", "private"]
+        fields = [
+            "owner", "image", "name", "times_shared", "size", "width", "height", "content_type", "private", "derivatives"
+        ]
         extra_kwargs = {
             "size": {"read_only": True},
             "times_shared": {"read_only": True},
             "private": {"write_only": True}
         }
 
+    def __init__(self, *args, **kwargs):
+        # Optionally restrict the serialized output to a subset of fields, e.g. ``fields=["name", "size"]``.
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+    def to_representation(self, instance: UserImage) -> Dict:
+        data = super().to_representation(instance)
+        # Stored files are only reachable through signed, expiring URLs.
+        if data.get("image") and instance.image:
+            url = file_url(instance.image)
+            request = self.context.get("request")
+            data["image"] = request.build_absolute_uri(url) if request is not None else url
+        return data
+
+    def get_derivatives(self, obj: UserImage) -> Dict[str, str]:
+        """URLs of the image's generated variants, by kind. Prefetch ``blob__derivatives`` when listing images."""
+        if obj.blob_id is None:
+            return {}
+        return {derivative.kind: file_url(derivative.file) for derivative in obj.blob.derivatives.all()}
+
+
+class ImageUsageSerializer(serializers.ModelSerializer):
+    public_images = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = ImageUsage
+        fields = ("images", "public_images", "private_images", "bytes", "times_shared")
+
 
 class ShareImageSerializer(serializers.Serializer[Dict[str, str]]):
     target_user = CharField()
     image_name = CharField()
+
+
+class BulkShareImageSerializer(serializers.Serializer[Dict[str, List[str]]]):
+    """Share each of ``image_names`` to each of ``target_users``."""
+
+    target_users = serializers.ListField(child=CharField(), allow_empty=False)
+    image_names = serializers.ListField(child=CharField(), allow_empty=False)
+
+    def validate(self, attrs):
+        pairs = len(set(attrs["target_users"])) * len(set(attrs["image_names"]))
+        if pairs > settings.IMAGES_SHARE_BATCH_MAX_PAIRS:
+            raise serializers.ValidationError(
+                "At most {} images can be shared in one request.".format(settings.IMAGES_SHARE_BATCH_MAX_PAIRS)
+            )
+        return attrs
+
+
+class DirectUploadFileSerializer(serializers.Serializer[Dict]):
+    """A file the client is about to upload straight to storage, described by its name, size, type and digest."""
+
+    name = CharField(max_length=255)
+    size = serializers.IntegerField(min_value=1)
+    content_type = serializers.ChoiceField(choices=["image/png", "image/jpeg", "image/gif", "image/webp"])
+    sha256 = serializers.RegexField(r"^[0-9a-f]{64}$", error_messages={"invalid": "Enter a hex SHA-256 digest."})
+
+    def validate(self, attrs):
+        # Run the checks of uploaded images which do not need the contents, such as the extension and size.
+        file = UploadedFile(name=attrs["name"], size=attrs["size"], content_type=attrs["content_type"])
+        ImageSerializer().fields["image"].run_validators(file)
+        return attrs
+
+
+class DirectUploadSerializer(serializers.Serializer[Dict]):
+    files = DirectUploadFileSerializer(many=True, allow_empty=False)
+
+    def validate_files(self, files):
+        if len(files) > settings.IMAGES_DIRECT_UPLOAD_BATCH_MAX:
+            raise serializers.ValidationError(
+                "At most {} files can be uploaded in one request.".format(settings.IMAGES_DIRECT_UPLOAD_BATCH_MAX)
+            )
+        return files
+
+
+class ConfirmDirectUploadSerializer(serializers.Serializer[Dict]):
+    """Confirm files uploaded straight to storage, by the ``upload_id`` they were issued."""
+
+    upload_ids = serializers.ListField(child=CharField(), allow_empty=False)
+    private = serializers.BooleanField(default=False)
+
+    def validate_upload_ids(self, upload_ids):
+        if len(upload_ids) > settings.IMAGES_DIRECT_UPLOAD_BATCH_MAX:
+            raise serializers.ValidationError(
+                "At most {} files can be uploaded in one request.".format(settings.IMAGES_DIRECT_UPLOAD_BATCH_MAX)
+            )
+
+        tickets, errors = [], {}
+        for index, upload_id in enumerate(upload_ids):
+            try:
+                tickets.append(DirectUploadTicket.load(upload_id, self.context["request"].user))
+            except signing.BadSignature:
+                errors[index] = ["This upload is invalid or has expired."]
+        if errors:
+            raise serializers.ValidationError(errors)
+        return tickets
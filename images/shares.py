@@ -0,0 +1,177 @@
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from rest_framework import status
+
+from .cache import invalidate_images
+from .models import ImageBlob, ImageUsage, UserImage
+
+
+class ShareResult:
+    """The outcome of sharing one image to one user of a batch."""
+
+    def __init__(self, image_name: str, target_user: str):
+        self.image_name = image_name
+        self.target_user = target_user
+        self.image: Optional[UserImage] = None
+        self.target: Optional[User] = None
+        # The name of the target user's copy, when it cannot be the image's own.
+        self.copy_name: Optional[str] = None
+        self.message = "{} has been succesfully shared to {}".format(image_name, target_user)
+        self.status = status.HTTP_200_OK
+
+    def fail(self, message: str, status_code=status.HTTP_400_BAD_REQUEST):
+        self.message = message
+        self.status = status_code
+
+    @property
+    def ok(self) -> bool:
+        return self.status == status.HTTP_200_OK
+
+    @property
+    def data(self):
+        return {
+            "image_name": self.image_name,
+            "target_user": self.target_user,
+            "status": self.status,
+            "message": self.message,
+        }
+
+
+class BulkImageShare:
+    """
+    Share each of a user's images to each of the target users.
+
+    Users, images and the images the targets already have are looked up with one query each, whatever the
+    size of the batch, then every copy is inserted with a single ``bulk_create`` in one transaction. Each
+    ``(image, user)`` pair is reported separately rather than failing the whole batch.
+    """
+
+    user_not_found = "No user is named {}."
+    image_not_found = "You have no image named {}."
+    self_share = "Unfortunately, you are not allowed to share images to yourself, that would be weird."
+    already_shared = "Sorry, but this user already has this image. Try another one."
+
+    def __init__(self, owner: User, image_names: List[str], target_users: List[str]):
+        self.owner = owner
+        # Repeated names are only shared once.
+        image_names = list(dict.fromkeys(image_names))
+        target_users = list(dict.fromkeys(target_users))
+        self.results = [ShareResult(name, username) for name in image_names for username in target_users]
+
+    @property
+    def succeeded(self) -> List[ShareResult]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> List[ShareResult]:
+        return [result for result in self.results if not result.ok]
+
+    def run(self) -> List[ShareResult]:
+        self.resolve()
+        self.exclude_existing()
+        self.save()
+        return self.results
+
+    def resolve(self) -> None:
+        """Look up the target users and the owner's images by name."""
+        users = {
+            user.username: user
+            for user in User.objects.filter(username__in={result.target_user for result in self.results})
+        }
+        # Names are unique per owner.
+        images: Dict[str, UserImage] = {
+            image.name: image
+            for image in UserImage.objects.filter(
+                owner=self.owner, name__in={result.image_name for result in self.results}
+            ).select_related("blob")
+        }
+
+        for result in self.results:
+            result.target = users.get(result.target_user)
+            result.image = images.get(result.image_name)
+            if result.target is None:
+                result.fail(self.user_not_found.format(result.target_user), status.HTTP_404_NOT_FOUND)
+            elif result.image is None:
+                result.fail(self.image_not_found.format(result.image_name), status.HTTP_404_NOT_FOUND)
+            elif result.target.pk == self.owner.pk:
+                result.fail(self.self_share)
+
+    def exclude_existing(self) -> None:
+        """
+        Reject the pairs whose target user already has the image, and number the copies whose name the target user
+        has already given another image, like ``UserImage.objects.share`` does.
+        """
+        existing = set()
+        names = defaultdict(set)
+        for owner_id, image, name in UserImage.objects.filter(
+            Q(image__in={result.image.image.name for result in self.succeeded})
+            | Q(name__in={result.image.name for result in self.succeeded}),
+            owner__in={result.target.pk for result in self.succeeded},
+        ).values_list("owner", "image", "name"):
+            existing.add((owner_id, image))
+            names[owner_id].add(name)
+
+        clashes = defaultdict(list)
+        for result in self.succeeded:
+            if (result.target.pk, result.image.image.name) in existing:
+                result.fail(self.already_shared, status.HTTP_409_CONFLICT)
+            elif result.image.name in names[result.target.pk]:
+                clashes[result.target.pk].append(result)
+        for target_id, results in clashes.items():
+            # Names the batch gives the target user as they are, which the numbered copies must not take either.
+            reserved = {result.image.name for result in self.succeeded if result.target.pk == target_id}
+            available = UserImage.objects.available_names(
+                target_id, [result.image.name for result in results], reserved=reserved
+            )
+            for result, name in zip(results, available):
+                result.copy_name = name
+
+    def save(self) -> None:
+        try:
+            self._save(self.succeeded)
+        except IntegrityError:
+            # Some targets were given an image concurrently, share pair by pair to find out which.
+            for result in self.succeeded:
+                if UserImage.objects.share(result.image, result.target.pk) is None:
+                    result.fail(self.already_shared, status.HTTP_409_CONFLICT)
+
+    def _save(self, results: List[ShareResult]) -> None:
+        if not results:
+            return
+
+        with transaction.atomic():
+            blobs = ImageBlob.objects.reference_many(
+                [result.image.blob.digest for result in results if result.image.blob_id], {}
+            )
+            copies = []
+            for result in results:
+                image = result.image
+                if image.blob_id and image.blob.digest not in blobs:
+                    # The blob was deleted since the image was looked up.
+                    result.fail(self.image_not_found.format(result.image_name), status.HTTP_404_NOT_FOUND)
+                    continue
+                copies.append(
+                    UserImage(
+                        owner=result.target,
+                        image=image.image.name,
+                        name=result.copy_name or image.name,
+                        blob=image.blob,
+                        **image.file_metadata(),
+                    )
+                )
+            UserImage.objects.bulk_create(copies)
+
+            shares = Counter(result.image.pk for result in self.succeeded)
+            grouped = defaultdict(list)
+            for image_id, count in shares.items():
+                grouped[count].append(image_id)
+            for count, image_ids in grouped.items():
+                UserImage.objects.filter(pk__in=image_ids).update(times_shared=F("times_shared") + count)
+            if shares:
+                ImageUsage.objects.increment(self.owner.pk, times_shared=sum(shares.values()))
+            # update() sends no signals.
+            invalidate_images({result.image.pk: result.image for result in self.succeeded}.values())
@@ -0,0 +1,39 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidate_images
+from .derivatives import schedule_derivatives
+from .models import ImageBlob, ImageDerivative, ImageUsage, UserImage
+
+
+@receiver(post_delete, sender=UserImage)
+def release_image_blob(sender, instance=None, **kwargs):
+    ImageBlob.objects.release([instance.blob_id])
+
+
+@receiver(post_delete, sender=UserImage)
+def count_deleted_image(sender, instance=None, **kwargs):
+    ImageUsage.objects.remove([instance])
+
+
+@receiver(post_save, sender=ImageBlob)
+def generate_blob_derivatives(sender, instance=None, created=False, **kwargs):
+    if created:
+        schedule_derivatives([instance.pk])
+
+
+@receiver(post_save, sender=UserImage)
+def invalidate_saved_image(sender, instance=None, created=False, **kwargs):
+    # An updated image may just have been made private, so it may have been public until now.
+    invalidate_images([instance], public=None if created else True)
+
+
+@receiver(post_delete, sender=UserImage)
+def invalidate_deleted_image(sender, instance=None, **kwargs):
+    invalidate_images([instance])
+
+
+@receiver(post_save, sender=ImageDerivative)
+def invalidate_derivative_images(sender, instance=None, **kwargs):
+    # Derivatives are listed with every image of the blob.
+    invalidate_images(UserImage.objects.filter(blob=instance.blob_id).only("owner", "private"))
@@ -0,0 +1,558 @@
+import asyncio
+import os
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from tempfile import NamedTemporaryFile, SpooledTemporaryFile
+from time import perf_counter
+from typing import Dict, Optional
+from urllib.parse import quote
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import Storage, get_storage_class
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import force_bytes
+from imagerepo.instrumentation import Metrics, timed
+from storages.backends.s3boto3 import S3Boto3Storage, S3Boto3StorageFile
+
+
+class StorageWriter:
+    """
+    Write a new file to a storage chunk by chunk, without holding the whole file in memory or on local disk.
+
+    S3 storages stream the chunks into a multipart upload and storages with a local path write to it directly.
+    Any other storage falls back to buffering the file and saving it in one go when it is closed.
+    """
+
+    def __init__(self, storage: Storage, name: str, max_length=None):
+        self.storage = storage
+        self.name = storage.get_available_name(storage.generate_filename(name), max_length=max_length)
+        self.streaming = True
+        with timed("storage"):
+            self._file = self._open()
+
+    def _open(self):
+        if hasattr(self.storage, "bucket"):
+            # S3Boto3Storage files opened for writing upload each buffered part as soon as it fills up.
+            return self.storage.open(self.name, "wb")
+        try:
+            path = self.storage.path(self.name)
+        except NotImplementedError:
+            self.streaming = False
+            return SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE, dir=settings.FILE_UPLOAD_TEMP_DIR)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, "xb")
+
+    def write(self, chunk: bytes) -> None:
+        with timed("storage"):
+            self._file.write(chunk)
+
+    def close(self) -> str:
+        """Finish writing the file, returning its name in the storage."""
+        with timed("storage"):
+            if not self.streaming:
+                self._file.seek(0)
+                self.name = self.storage.save(self.name, File(self._file, name=self.name))
+            self._file.close()
+        return self.name
+
+    def abort(self) -> None:
+        """Stop writing the file and remove what was written so far."""
+        multipart = getattr(self._file, "_multipart", None)
+        with timed("storage"):
+            if isinstance(self._file, PooledS3StorageFile):
+                self._file.abort()
+            elif multipart is not None:
+                multipart.abort()
+            else:
+                self._file.close()
+                if self.streaming:
+                    self.storage.delete(self.name)
+
+
+def copy_stored_file(storage: Storage, name: str, new_name: str) -> str:
+    """
+    Copy the file stored as ``name`` to ``new_name``, or an available name derived from it, returning that name.
+
+    S3 storages copy the object within the bucket and storages with a local path copy the file on disk, so the
+    contents never go through this process. Any other storage reads the file back and saves it again.
+    """
+    new_name = storage.get_available_name(storage.generate_filename(new_name))
+    with timed("storage"):
+        if hasattr(storage, "bucket"):
+            source, target = (storage._normalize_name(storage._clean_name(key)) for key in (name, new_name))
+            storage.bucket.Object(target).copy_from(
+                CopySource={"Bucket": storage.bucket.name, "Key": source},
+                MetadataDirective="REPLACE",
+                **storage._get_write_parameters(target),
+            )
+            return new_name
+        try:
+            source, target = storage.path(name), storage.path(new_name)
+        except NotImplementedError:
+            with storage.open(name, "rb") as file:
+                return storage.save(new_name, file)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+    return new_name
+
+
+# The names of blob files, see ``images.models.blob_name``.
+_BLOB_NAME = re.compile(r"^blobs/(?P<digest>[0-9a-f]{64})([_.]|$)")
+
+
+@deconstructible
+class ReadThroughCacheStorage(Storage):
+    """
+    Any storage, with the blob files read from it kept in a bounded cache on local disk.
+
+    Blobs are stored under names derived from the digest of their contents, ``blobs/<sha256>.<ext>``, and never
+    written again, so entries are keyed by that digest and hits need no request to the storage at all. Other files
+    are read from the storage every time. Entries are written to a temporary file then renamed into place, so
+    readers, including other processes sharing the directory, see whole files or none. Reading an entry marks it as
+    used, and once the directory outgrows ``max_size`` the least recently used entries are removed until it is back
+    under ``LOW_WATER`` of it. Files larger than a tenth of the cache are not kept.
+
+    Anything else, e.g. URLs, writes and the ``bucket`` of S3 storages, is the wrapped storage's.
+    """
+
+    LOW_WATER = 0.9
+    # Temporary files older than this were left by a writer which died, they are removed when measuring.
+    STALE_TEMPORARY_AGE = 3600
+
+    def __init__(self, backend=None, location=None, max_size=None):
+        if backend is None:
+            backend = settings.IMAGES_STORAGE_CACHE_BACKEND
+        self.backend = get_storage_class(backend)() if isinstance(backend, str) else backend
+        self.location = location or settings.IMAGES_STORAGE_CACHE_DIR
+        self.max_size = max_size or settings.IMAGES_STORAGE_CACHE_SIZE
+        self.hits = 0
+        self.misses = 0
+        self._size: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # Only called for attributes the wrapper does not have.
+        if name == "backend":
+            raise AttributeError(name)
+        return getattr(self.backend, name)
+
+    def cache_path(self, name: str) -> Optional[str]:
+        """Where the file stored as ``name`` is cached, ``None`` for files which are not."""
+        match = _BLOB_NAME.match(name)
+        if match is None:
+            return None
+        digest = match.group("digest")
+        return os.path.join(self.location, digest[:2], digest)
+
+    def _open(self, name, mode="rb"):
+        path = None if "w" in mode or "a" in mode or "+" in mode else self.cache_path(name)
+        if path is None:
+            return self.backend.open(name, mode)
+
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            pass
+        else:
+            self._count(hit=True)
+            self._touch(path)
+            return File(file, name=name)
+
+        self._count(hit=False)
+        with self.backend.open(name, mode) as source:
+            file, size = self._fill(path, source)
+        if size is not None:
+            self._added(size)
+        return File(file, name=name)
+
+    def _fill(self, path: str, source):
+        """
+        Copy a file into the cache, returning it opened for reading along with its size, or ``None`` when it is too
+        large to keep. Its size is only known once read, which saves a metadata request per miss.
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with NamedTemporaryFile(dir=os.path.dirname(path), prefix=".", delete=False) as temporary:
+            try:
+                with timed("storage"):
+                    for chunk in source.chunks():
+                        temporary.write(chunk)
+            except BaseException:
+                os.unlink(temporary.name)
+                raise
+            size = temporary.tell()
+        # Opened before it is in place, so it stays readable even if it is evicted straight away.
+        file = open(temporary.name, "rb")
+        if size > self.max_size // 10:
+            os.unlink(temporary.name)
+            return file, None
+        os.replace(temporary.name, path)
+        return file, size
+
+    def _save(self, name, content):
+        return self.backend.save(name, content)
+
+    def delete(self, name):
+        self.backend.delete(name)
+
+    def exists(self, name):
+        return self.backend.exists(name)
+
+    def size(self, name):
+        return self.backend.size(name)
+
+    def url(self, name):
+        return self.backend.url(name)
+
+    def listdir(self, path):
+        return self.backend.listdir(path)
+
+    def path(self, name):
+        return self.backend.path(name)
+
+    def get_valid_name(self, name):
+        return self.backend.get_valid_name(name)
+
+    def get_available_name(self, name, max_length=None):
+        return self.backend.get_available_name(name, max_length=max_length)
+
+    def generate_filename(self, filename):
+        return self.backend.generate_filename(filename)
+
+    def get_accessed_time(self, name):
+        return self.backend.get_accessed_time(name)
+
+    def get_created_time(self, name):
+        return self.backend.get_created_time(name)
+
+    def get_modified_time(self, name):
+        return self.backend.get_modified_time(name)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """This process's reads from the cache, and the size of the directory as last measured."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": self._size or 0, "max_size": self.max_size}
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted meanwhile, the open file is still readable.
+            pass
+
+    def _added(self, size: int) -> None:
+        # The size is tracked in the process and only measured again when it goes over the limit, as other
+        # processes add and evict entries too.
+        with self._lock:
+            if self._size is None:
+                self._size = self._measure()[0]
+            else:
+                self._size += size
+            if self._size <= self.max_size:
+                return
+            self._size = self._evict()
+
+    def _measure(self):
+        entries = []
+        stale = time.time() - self.STALE_TEMPORARY_AGE
+        for directory in os.scandir(self.location):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                try:
+                    stat = entry.stat()
+                    if not entry.name.startswith("."):
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    elif stat.st_mtime < stale:
+                        os.unlink(entry.path)
+                except FileNotFoundError:
+                    continue
+        return sum(size for _, size, _ in entries), entries
+
+    def _evict(self) -> int:
+        """Remove the least recently used entries until the cache is under its low water mark, returning its size."""
+        size, entries = self._measure()
+        target = self.max_size * self.LOW_WATER
+        for _, entry_size, path in sorted(entries):
+            if size <= target:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                # Evicted by another process.
+                pass
+            size -= entry_size
+        return size
+
+
+# Latency histograms of S3 operations by name, e.g. PutObject, for every call made by this process.
+storage_metrics = Metrics()
+
+_clients = {}
+# A key whose URL holds nothing but the bucket's URL and the key itself.
+_URL_PROBE = "url-probe"
+_clients_lock = threading.Lock()
+
+
+def _start_call(model, context, **kwargs):
+    context["images_operation"] = (model.name, perf_counter())
+
+
+def _end_call(context, **kwargs):
+    operation = context.pop("images_operation", None)
+    if operation is not None:
+        name, started = operation
+        storage_metrics.observe(name, {"duration_ms": (perf_counter() - started) * 1000})
+
+
+class PooledS3StorageFile(S3Boto3StorageFile):
+    """
+    A file of a ``PooledS3Storage``, written with the same transfer settings as the files it saves.
+
+    What is written is buffered until it reaches ``multipart_threshold`` bytes, and stored with one PutObject when
+    the file is closed if it never does. Past it, the file is sent in parts of ``multipart_chunksize`` bytes, up to
+    ``max_concurrency`` of them at a time while writing goes on, after which writes wait for the oldest part.
+    """
+
+    def __init__(self, name, mode, storage, buffer_size=None):
+        super().__init__(name, mode, storage, buffer_size=buffer_size or storage.multipart_chunksize)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._parts = deque()
+        self._uploaded = []
+
+    def write(self, content):
+        if "w" not in self._mode:
+            raise AttributeError("File was not opened in write mode.")
+        self._is_dirty = True
+        limit = self.buffer_size if self._multipart is not None else self._storage.multipart_threshold
+        if self._buffer_file_size >= limit:
+            self._flush_write_buffer()
+        data = force_bytes(content)
+        self._raw_bytes_written += len(data)
+        return self.file.write(data)
+
+    def _flush_write_buffer(self):
+        if not self._buffer_file_size:
+            return
+        if self._multipart is None:
+            self._multipart = self.obj.initiate_multipart_upload(**self._storage._get_write_parameters(self.obj.key))
+            self._executor = ThreadPoolExecutor(
+                max_workers=self._storage.max_concurrency, thread_name_prefix="images-upload"
+            )
+        while len(self._parts) >= self._storage.max_concurrency:
+            self._uploaded.append(self._parts.popleft().result())
+        self.file.seek(0)
+        self._write_counter += 1
+        self._parts.append(
+            self._executor.submit(copy_context().run, self._upload_part, self._write_counter, self.file.read())
+        )
+        self.file.seek(0)
+        self.file.truncate()
+
+    def _upload_part(self, number: int, data: bytes) -> dict:
+        # Through the client, which unlike resources is thread-safe.
+        response = self._storage.client.upload_part(
+            Bucket=self._multipart.bucket_name,
+            Key=self._multipart.object_key,
+            UploadId=self._multipart.id,
+            PartNumber=number,
+            Body=data,
+        )
+        return {"ETag": response["ETag"], "PartNumber": number}
+
+    def close(self):
+        if self._is_dirty and self._multipart is None:
+            self.file.seek(0)
+            self.obj.put(Body=self.file.read(), **self._storage._get_write_parameters(self.obj.key))
+        elif self._is_dirty:
+            self._flush_write_buffer()
+            try:
+                while self._parts:
+                    self._uploaded.append(self._parts.popleft().result())
+            except BaseException:
+                self.abort()
+                raise
+            self._multipart.complete(MultipartUpload={"Parts": self._uploaded})
+            self._multipart = None
+            self._executor.shutdown()
+        self._is_dirty = False
+        super().close()
+
+    def abort(self) -> None:
+        """Stop the upload, leaving nothing stored."""
+        if self._executor is not None:
+            for future in self._parts:
+                future.cancel()
+            # Parts still being sent would be kept by S3 if they completed after the upload was aborted.
+            self._executor.shutdown()
+        if self._multipart is not None:
+            self._multipart.abort()
+            self._multipart = None
+        self._is_dirty = False
+        self._parts.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+@deconstructible
+class PooledS3Storage(S3Boto3Storage):
+    """
+    An S3 storage whose threads share one client, with tuned connection pooling, retries and transfers.
+
+    django-storages gives each thread its own boto3 resource, each with a client holding its own connection pool.
+    Here every thread's resource uses the same client, which is thread-safe, so threads reuse each other's
+    connections from a single pool of ``max_pool_connections``. Clients are shared by every storage of the
+    process with the same configuration.
+
+    Failed calls are retried in botocore's ``adaptive`` mode, which also slows the client down while S3 throttles
+    it, and uploads are split into parts of ``multipart_chunksize`` bytes sent ``max_concurrency`` at a time once
+    larger than ``multipart_threshold``, whether the file is saved or written through ``open(name, "wb")``, see
+    ``PooledS3StorageFile``. The duration of every S3 call, retries included, is recorded in
+    ``storage_metrics``. Set ``AWS_S3_ENDPOINT_URL`` to use an S3 emulator such as MinIO.
+    """
+
+    def get_default_settings(self):
+        return {
+            **super().get_default_settings(),
+            "max_pool_connections": settings.IMAGES_S3_MAX_POOL_CONNECTIONS,
+            "retry_mode": settings.IMAGES_S3_RETRY_MODE,
+            "max_attempts": settings.IMAGES_S3_MAX_ATTEMPTS,
+            "connect_timeout": settings.IMAGES_S3_CONNECT_TIMEOUT,
+            "read_timeout": settings.IMAGES_S3_READ_TIMEOUT,
+            "multipart_threshold": settings.IMAGES_S3_MULTIPART_THRESHOLD,
+            "multipart_chunksize": settings.IMAGES_S3_MULTIPART_CHUNKSIZE,
+            "max_concurrency": settings.IMAGES_S3_MAX_CONCURRENCY,
+        }
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        # A botocore Config given to the storage replaces the one built from the settings below altogether.
+        if not kwargs.get("config") and not getattr(settings, "AWS_S3_CONFIG", None):
+            self.config = Config(
+                s3={"addressing_style": self.addressing_style},
+                signature_version=self.signature_version,
+                proxies=self.proxies,
+                max_pool_connections=self.max_pool_connections,
+                retries={"mode": self.retry_mode, "total_max_attempts": self.max_attempts},
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+            )
+        self._url_prefix = None
+        self.transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+        )
+
+    @property
+    def client(self):
+        """The client shared by every storage of the process with the same configuration."""
+        key = (
+            self.access_key,
+            self.secret_key,
+            self.security_token,
+            self.region_name,
+            self.use_ssl,
+            self.endpoint_url,
+            self.verify,
+            repr(sorted(vars(self.config).items())),
+        )
+        with _clients_lock:
+            client = _clients.get(key)
+            if client is None:
+                client = boto3.session.Session().client(
+                    "s3",
+                    aws_access_key_id=self.access_key,
+                    aws_secret_access_key=self.secret_key,
+                    aws_session_token=self.security_token,
+                    region_name=self.region_name,
+                    use_ssl=self.use_ssl,
+                    endpoint_url=self.endpoint_url,
+                    config=self.config,
+                    verify=self.verify,
+                )
+                # Rather than before-call, which stops at the first handler answering the call, e.g. a test stub.
+                client.meta.events.register("before-parameter-build.s3", _start_call)
+                client.meta.events.register("after-call.s3", _end_call)
+                client.meta.events.register("after-call-error.s3", _end_call)
+                _clients[key] = client
+        return client
+
+    @property
+    def connection(self):
+        connection = getattr(self._connections, "connection", None)
+        if connection is None:
+            connection = super().connection
+            # Resources are not thread-safe, so each thread keeps its own, but they all call S3 through one client.
+            connection.meta.client = self.client
+        return connection
+
+    def url(self, name, parameters=None, expire=None, http_method=None):
+        if self.querystring_auth or self.custom_domain or parameters or http_method:
+            return super().url(name, parameters, expire, http_method)
+        # Unsigned URLs only differ by the key, so they are built from the bucket's URL rather than signed by the
+        # client, then stripped of their signature, every time.
+        if self._url_prefix is None:
+            self._url_prefix = super().url(_URL_PROBE)[: -len(self._quote_key(_URL_PROBE))]
+        return self._url_prefix + self._quote_key(name)
+
+    def _quote_key(self, name):
+        # As botocore quotes keys in URLs.
+        return quote(self._normalize_name(self._clean_name(name)), safe="/~")
+
+    def _open(self, name, mode="rb"):
+        if "w" not in mode:
+            return super()._open(name, mode)
+        return PooledS3StorageFile(self._normalize_name(self._clean_name(name)), mode, self)
+
+    def _save(self, name, content):
+        cleaned_name = self._clean_name(name)
+        name = self._normalize_name(cleaned_name)
+        params = self._get_write_parameters(name, content)
+
+        if self.gzip and params["ContentType"] in self.gzip_content_types and "ContentEncoding" not in params:
+            content = self._compress_content(content)
+            params["ContentEncoding"] = "gzip"
+
+        content.seek(0, os.SEEK_SET)
+        self.bucket.Object(name).upload_fileobj(content, ExtraArgs=params, Config=self.transfer_config)
+        return cleaned_name
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def storage_executor() -> ThreadPoolExecutor:
+    """The thread pool async views send blocking storage calls to, shared by every request of the process."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGES_ASYNC_STORAGE_THREADS, thread_name_prefix="images-storage"
+            )
+    return _executor
+
+
+async def run_in_storage_thread(func, *args):
+    """Run a blocking storage call on the storage thread pool, in the caller's context, without blocking the loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(storage_executor(), partial(copy_context().run, func, *args))
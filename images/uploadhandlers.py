@@ -0,0 +1,95 @@
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from imagerepo.instrumentation import timed
+
+from .headers import ImageHeaderParser
+from .storage import StorageWriter
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    A file uploaded straight to storage by ``StreamingImageUploadHandler``.
+
+    Its size, SHA-256 digest and image header were parsed while it was received, so none of them need the
+    file to be read again. The contents are only fetched back from storage if the file is read.
+    """
+
+    def __init__(self, storage, storage_name, name, content_type, size, charset, content_type_extra, sha256, image_info):
+        super().__init__(None, name, content_type, size, charset, content_type_extra)
+        self.storage = storage
+        self.storage_name = storage_name
+        self.sha256 = sha256
+        self.image_info = image_info
+
+    def _get_file(self):
+        if self._file is None:
+            with timed("storage"):
+                self._file = self.storage.open(self.storage_name, "rb")
+        return self._file
+
+    def _set_file(self, file):
+        self._file = file
+
+    file = property(_get_file, _set_file)
+
+    def open(self, mode=None):
+        self.file.seek(0)
+        return self
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self) -> None:
+        """Remove the stored file, e.g. when it turns out to be invalid or a duplicate."""
+        self.close()
+        with timed("storage"):
+            self.storage.delete(self.storage_name)
+
+
+class StreamingImageUploadHandler(FileUploadHandler):
+    """
+    Stream uploaded files straight to the default storage.
+
+    Each chunk is hashed and written to storage as soon as it is received, so neither memory nor local disk
+    usage grows with the size of the file. The upload is committed as a ``StoredUploadedFile``.
+    """
+
+    def __init__(self, request=None, storage=None):
+        super().__init__(request)
+        self.storage = storage or default_storage
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+        self.header_parser = ImageHeaderParser()
+        self.writer = StorageWriter(self.storage, self.file_name)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        self.header_parser.feed(raw_data)
+        self.writer.write(raw_data)
+
+    def file_complete(self, file_size):
+        storage_name = self.writer.close()
+        self.writer = None
+        return StoredUploadedFile(
+            storage=self.storage,
+            storage_name=storage_name,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra,
+            sha256=self.hasher.hexdigest(),
+            image_info=self.header_parser.close(),
+        )
+
+    def upload_interrupted(self):
+        if getattr(self, "writer", None) is not None:
+            self.writer.abort()
+            self.writer = None
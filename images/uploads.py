@@ -0,0 +1,321 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Dict, List, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import prefetch_related_objects
+from imagerepo.instrumentation import timed
+from rest_framework import status
+
+from .derivatives import schedule_derivatives
+from .direct_uploads import DirectUploads, DirectUploadTicket
+from .models import ImageBlob, UserImage, blob_name, discard_stored_upload, file_digest
+from .serializers import ImageSerializer
+from .storage import copy_stored_file, run_in_storage_thread
+from .uploadhandlers import StoredUploadedFile
+
+
+class UploadResult:
+    """The outcome of uploading one file of a batch."""
+
+    def __init__(self, file):
+        self.file = file
+        self.digest: Optional[str] = None
+        self.image: Optional[UserImage] = None
+        self.errors = None
+        self.status = status.HTTP_201_CREATED
+
+    def fail(self, errors, status_code=status.HTTP_400_BAD_REQUEST):
+        self.errors = errors
+        self.status = status_code
+
+    @property
+    def ok(self) -> bool:
+        return self.errors is None
+
+    @property
+    def data(self):
+        data = {"file": self.file.name, "status": self.status}
+        if self.ok:
+            data["image"] = ImageSerializer(self.image).data
+        else:
+            data["errors"] = self.errors
+        return data
+
+
+class BulkImageUpload:
+    """
+    Add a batch of uploaded files to a user's images.
+
+    Every file is validated first, contents that are not stored yet are then sent to storage concurrently,
+    and finally every image is written in a single transaction. Failures are reported per file rather than
+    aborting the whole batch.
+    """
+
+    serializer_class = ImageSerializer
+    store_error = {"image": ["The image could not be stored, please try again."]}
+    conflict_error = {"image": ["You already have this image."]}
+    quota_error = {"image": ["This image would take you over your storage quota."]}
+
+    def __init__(
+        self,
+        owner: User,
+        files,
+        private: bool = False,
+        workers: Optional[int] = None,
+        remaining_storage: Optional[int] = None,
+    ):
+        self.owner = owner
+        self.private = private
+        self.workers = workers or settings.IMAGES_UPLOAD_WORKERS
+        # The bytes the owner may still add, None when their storage is not limited.
+        self.remaining_storage = remaining_storage
+        self.results = [UploadResult(file) for file in files]
+        # The file sent to storage for each new digest.
+        self.pending = {}
+
+    @property
+    def succeeded(self) -> List[UploadResult]:
+        return [result for result in self.results if result.ok]
+
+    @property
+    def failed(self) -> List[UploadResult]:
+        return [result for result in self.results if not result.ok]
+
+    def run(self) -> List[UploadResult]:
+        try:
+            self.validate()
+            self.deduplicate()
+            self.enforce_quota()
+            stored = self.store()
+            self.save(stored)
+        finally:
+            self.cleanup()
+        return self.results
+
+    def validate(self) -> None:
+        with timed("validate"):
+            for result in self.succeeded:
+                data = {"image": result.file}
+                if self.private:
+                    data["private"] = True
+
+                serializer = self.serializer_class(data=data)
+                if serializer.is_valid():
+                    result.digest = file_digest(result.file)
+                else:
+                    result.fail(serializer.errors)
+
+    def deduplicate(self) -> None:
+        """Reject files whose contents the owner already has, including earlier files of the same batch."""
+        seen = set(
+            UserImage.objects.filter(
+                owner=self.owner, blob__digest__in={result.digest for result in self.succeeded}
+            ).values_list("blob__digest", flat=True)
+        )
+        for result in self.succeeded:
+            if result.digest in seen:
+                result.fail(self.conflict_error, status.HTTP_409_CONFLICT)
+            seen.add(result.digest)
+
+    def enforce_quota(self) -> None:
+        """Reject the files which would take the owner over their storage quota, keeping those sent first."""
+        if self.remaining_storage is None:
+            return
+        remaining = self.remaining_storage
+        for result in self.succeeded:
+            if result.file.size > remaining:
+                result.fail(self.quota_error, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+            else:
+                remaining -= result.file.size
+
+    def store(self) -> Dict[str, Tuple[str, int]]:
+        """Send the contents no blob holds yet to storage, returning their ``(file name, size)`` by digest."""
+        self.find_pending()
+        stored = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # Each file is stored in the request's context, so the time it takes is recorded for the request.
+            futures = {
+                digest: executor.submit(copy_context().run, self._store_file, digest, file)
+                for digest, file in self.pending.items()
+            }
+        for digest, future in futures.items():
+            try:
+                stored[digest] = (future.result(), self.pending[digest].size)
+            except Exception:
+                self._fail_digest(digest, status.HTTP_502_BAD_GATEWAY)
+        return stored
+
+    def find_pending(self) -> None:
+        """Find the contents no blob holds yet, and the file of the batch each of them is stored from."""
+        missing = ImageBlob.objects.missing(result.digest for result in self.succeeded)
+        for result in self.succeeded:
+            if result.digest in missing:
+                self.pending.setdefault(result.digest, result.file)
+
+    def save(self, stored: Dict[str, Tuple[str, int]]) -> None:
+        try:
+            self._save(stored)
+        except IntegrityError:
+            # The owner added some of the same contents concurrently, nothing of the batch was saved.
+            for result in self.succeeded:
+                result.fail(self.conflict_error, status.HTTP_409_CONFLICT)
+            storage = ImageBlob._meta.get_field("file").storage
+            names = {name for name, _ in stored.values()}
+            # Blobs are stored under names derived from their contents, which a concurrent upload may have used.
+            names -= set(ImageBlob.objects.filter(file__in=names).values_list("file", flat=True))
+            for name in names:
+                storage.delete(name)
+
+    def _save(self, stored: Dict[str, Tuple[str, int]]) -> None:
+        with transaction.atomic():
+            blobs = ImageBlob.objects.reference_many([result.digest for result in self.succeeded], stored)
+
+            images = []
+            for result in self.succeeded:
+                blob = blobs.get(result.digest)
+                if blob is None:
+                    # The blob was deleted since the batch was validated.
+                    result.fail(self.store_error, status.HTTP_409_CONFLICT)
+                    continue
+
+                result.image = UserImage(
+                    owner=self.owner,
+                    private=self.private,
+                    image=blob.file.name,
+                    name=result.file.name,
+                    blob=blob,
+                    size=blob.size,
+                )
+                result.image.capture_file_metadata(result.file)
+                images.append(result.image)
+            names = UserImage.objects.available_names(self.owner.pk, [image.name for image in images])
+            for image, name in zip(images, names):
+                image.name = name
+            UserImage.objects.bulk_create(images)
+            prefetch_related_objects(images, "blob__derivatives")
+
+            created = [blob.pk for digest, blob in blobs.items() if stored.get(digest, (None,))[0] == blob.file.name]
+            schedule_derivatives(created)
+
+    def cleanup(self) -> None:
+        """Remove the streamed copies of files which did not become a blob, e.g. invalid files or duplicates."""
+        for result in self.results:
+            if self.pending.get(result.digest) is not result.file or not result.ok:
+                discard_stored_upload(result.file)
+
+    def _store_file(self, digest: str, file) -> str:
+        field = ImageBlob._meta.get_field("file")
+        name = blob_name(digest, file)
+        if getattr(file, "storage_name", None):
+            # Already streamed to storage while it was uploaded, under the name it was uploaded as.
+            name = copy_stored_file(field.storage, file.storage_name, name)
+            discard_stored_upload(file)
+            return name
+        with timed("storage"):
+            return field.storage.save(field.generate_filename(None, name), file, max_length=field.max_length)
+
+    def _fail_digest(self, digest, status_code):
+        for result in self.succeeded:
+            if result.digest == digest:
+                result.fail(self.store_error, status_code)
+
+
+class AsyncBulkImageUpload(BulkImageUpload):
+    """
+    A ``BulkImageUpload`` for async views, which must not block the event loop.
+
+    Queries run through ``sync_to_async`` on Django's thread for database access, files are validated in a worker
+    thread and sent to storage concurrently on the process-wide storage thread pool.
+    """
+
+    async def arun(self) -> List[UploadResult]:
+        try:
+            await sync_to_async(self.validate, thread_sensitive=False)()
+            await sync_to_async(self.deduplicate)()
+            self.enforce_quota()
+            stored = await self.astore()
+            await sync_to_async(self.save)(stored)
+        finally:
+            await run_in_storage_thread(self.cleanup)
+        return self.results
+
+    async def astore(self) -> Dict[str, Tuple[str, int]]:
+        await sync_to_async(self.find_pending)()
+        stored = {}
+        digests = list(self.pending)
+        # At most ``workers`` files of the batch are sent at once, like the synchronous upload.
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def store_file(digest) -> str:
+            async with semaphore:
+                return await run_in_storage_thread(self._store_file, digest, self.pending[digest])
+
+        names = await asyncio.gather(*(store_file(digest) for digest in digests), return_exceptions=True)
+        for digest, name in zip(digests, names):
+            if isinstance(name, Exception):
+                self._fail_digest(digest, status.HTTP_502_BAD_GATEWAY)
+            else:
+                stored[digest] = (name, self.pending[digest].size)
+        return stored
+
+
+class DirectImageUpload(BulkImageUpload):
+    """
+    Add files uploaded straight to storage to a user's images.
+
+    Each file is only inspected where it is stored, its size and digest with a HEAD request and its header with
+    a ranged read, before it is validated, deduplicated and saved like any other upload.
+    """
+
+    missing_error = {"image": ["The file was not uploaded."]}
+    mismatch_error = {"image": ["The uploaded file does not match its declared size and SHA-256 digest."]}
+
+    def __init__(self, owner: User, tickets: List[DirectUploadTicket], uploads: DirectUploads, **kwargs):
+        self.uploads = uploads
+        files = [
+            StoredUploadedFile(
+                storage=uploads.storage,
+                storage_name=ticket.key,
+                name=ticket.name,
+                content_type=ticket.content_type,
+                size=ticket.size,
+                charset=None,
+                content_type_extra=None,
+                sha256=ticket.sha256,
+                image_info=None,
+            )
+            for ticket in tickets
+        ]
+        super().__init__(owner, files, **kwargs)
+
+    def validate(self) -> None:
+        self.inspect()
+        super().validate()
+
+    def inspect(self) -> None:
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(copy_context().run, self._inspect_file, result.file) for result in self.results]
+        for result, future in zip(self.results, futures):
+            try:
+                errors = future.result()
+            except Exception:
+                errors = self.store_error
+            if errors is not None:
+                result.fail(errors)
+
+    def _inspect_file(self, file: StoredUploadedFile):
+        # Every file must be uploaded, even if its contents are stored already: knowing a digest must not be
+        # enough to get a copy of someone else's image.
+        head = self.uploads.head(file.storage_name)
+        if head is None:
+            return self.missing_error
+        if head.size != file.size or head.sha256 != file.sha256:
+            return self.mismatch_error
+        file.image_info = self.uploads.read_header(file.storage_name)
+        return None
@@ -1,10 +1,70 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import AddImageView, ListImageView, SearchImagesView, ShareImageView
+from .async_views import (
+    AsyncAddImageView,
+    AsyncBulkShareImageView,
+    AsyncListImageView,
+    AsyncSearchImagesView,
+    AsyncShareImageView,
+)
+from .views import (
+    AddImageView,
+    BulkShareImageView,
+    ConfirmDirectUploadView,
+    DirectUploadEmulationView,
+    DirectUploadView,
+    ExportImagesView,
+    ImageStatsView,
+    ListImageView,
+    SearchImagesView,
+    ShareImageView,
+    SignedFileView,
+)
 
-urlpatterns = [
+# Direct uploads only wait on the database and on metadata requests to storage, so they have no async version.
+direct_upload_urlpatterns = [
+    path('uploads/', DirectUploadView.as_view(), name='direct_upload'),
+    path('uploads/confirm/', ConfirmDirectUploadView.as_view(), name='confirm_direct_upload'),
+    path('uploads/emulated/<str:token>/', DirectUploadEmulationView.as_view(), name='direct_upload_emulation'),
+]
+
+# Signed URLs are checked without touching the database, and the file is streamed by the response itself.
+file_urlpatterns = [
+    path('files/<path:name>', SignedFileView.as_view(), name='signed_file'),
+]
+
+# Statistics are a single primary key lookup, there is nothing to gain from an async version.
+stats_urlpatterns = [
+    path('stats/', ImageStatsView.as_view(), name='image_stats'),
+]
+
+# Exports stream their archive from a generator, which fetches files on the storage thread pool itself. Under ASGI it
+# is iterated on a thread by ``imagerepo.handlers.ASGIHandler``.
+export_urlpatterns = [
+    path('export/', ExportImagesView.as_view(), name='export_images'),
+]
+
+sync_urlpatterns = [
     path('add/', AddImageView.as_view(), name='add_image'),
     path('my_images/', ListImageView.as_view(), name='my_image'),
     path('search/', SearchImagesView.as_view(), name='search_image'),
     path('share/', ShareImageView.as_view(), name='share_image'),
+    path('share/batch/', BulkShareImageView.as_view(), name='share_images'),
 ]
+
+async_urlpatterns = [
+    path('add/', AsyncAddImageView.as_view(), name='add_image'),
+    path('my_images/', AsyncListImageView.as_view(), name='my_image'),
+    path('search/', AsyncSearchImagesView.as_view(), name='search_image'),
+    path('share/', AsyncShareImageView.as_view(), name='share_image'),
+    path('share/batch/', AsyncBulkShareImageView.as_view(), name='share_images'),
+]
+
+urlpatterns = (
+    (async_urlpatterns if settings.IMAGES_ASYNC_VIEWS else sync_urlpatterns)
+    + direct_upload_urlpatterns
+    + file_urlpatterns
+    + stats_urlpatterns
+    + export_urlpatterns
+)
@@ -1,51 +1,97 @@
+import mimetypes
+import time
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.db.models import Subquery
 from django.db.models.query_utils import Q
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils.cache import patch_cache_control
 from drf_yasg import openapi
 from drf_yasg.utils import swagger_auto_schema
-from images.serializers import ImageSerializer, ShareImageSerializer
-from rest_framework import status
-from rest_framework.exceptions import ValidationError
+from imagerepo.instrumentation import timed
+from images.serializers import (
+    BulkShareImageSerializer,
+    ConfirmDirectUploadSerializer,
+    DirectUploadSerializer,
+    ImageSerializer,
+    ImageUsageSerializer,
+    ShareImageSerializer,
+)
+from rest_framework import permissions, status
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.generics import get_object_or_404
-from rest_framework.parsers import FileUploadParser, MultiPartParser
+from rest_framework.parsers import FileUploadParser, JSONParser, MultiPartParser
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from .models import UserImage
+from .cache import cache_response
+from .direct_uploads import DirectUploads, DirectUploadTicket, FileSystemDirectUploads
+from .exports import ImageExport
+from .models import ImageUsage, UserImage
+from .pagination import KeysetPagination, SearchResultsPagination
+from .quotas import WithinStorageQuota
+from .shares import BulkImageShare
+from .uploadhandlers import StreamingImageUploadHandler
+from .uploads import BulkImageUpload, DirectImageUpload
+from .url_signing import verify
+
+
+add_image_schema = swagger_auto_schema(
+    request_body=ImageSerializer,
+    responses={
+        status.HTTP_201_CREATED: ImageSerializer(many=True),
+        status.HTTP_207_MULTI_STATUS: "Some images could not be added, the result of each file is listed.",
+    },
+)
 
 
 class AddImageView(APIView):
     serializer_class = ImageSerializer
     parser_classes = (MultiPartParser,)
+    permission_classes = (permissions.IsAuthenticated, WithinStorageQuota)
+    throttle_scope = "add_image"
+    upload_class = BulkImageUpload
 
-    @swagger_auto_schema(
-        request_body=ImageSerializer,
-        responses={
-            status.HTTP_201_CREATED: ImageSerializer,
-        },
-    )
+    def initialize_request(self, request, *args, **kwargs):
+        # Stream uploaded files straight to storage instead of spooling them to memory or a temporary file.
+        if settings.IMAGES_STREAMING_UPLOADS:
+            request.upload_handlers = [StreamingImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    @add_image_schema
     def post(self, request: Request) -> Response:
-        files = request.FILES.getlist("image")
-        images = []
-        private = request.data.get("private")
+        files, private = self.get_files(request)
+        upload = self.upload_class(
+            owner=request.user, files=files, private=private, remaining_storage=request.remaining_storage
+        )
+        return self.upload_response(upload, upload.run())
+
+    def get_files(self, request: Request):
+        # The multipart body is parsed, and streamed uploads are sent to storage, when it is first accessed.
+        with timed("parse"):
+            files = request.FILES.getlist("image")
+            # determine upload type. private or public.
+            private = bool(request.data.get("private"))
 
         if not files:
             raise ValidationError("You must include at least one image.")
+        return files, private
 
-        for file in files:
-            # determine upload type. private or public.
-            data = {"image": file}
-            if private:
-                data["private"] = True
-
-            serializer = self.serializer_class(data=data)
+    def upload_response(self, upload, results) -> Response:
+        if not upload.failed:
+            with timed("serialize"):
+                data = [result.data["image"] for result in results]
+            return Response(data, status=status.HTTP_201_CREATED)
 
-            if serializer.is_valid(raise_exception=True):
-                serializer.save(owner=request.user)
-                images.append(serializer.data)
-            else:
-                return Response({"message": "An Error Occured!"}, status=400)
-        return Response(images, status=status.HTTP_201_CREATED)
+        # Report the outcome of every file when some could not be added.
+        response_status = status.HTTP_207_MULTI_STATUS if upload.succeeded else status.HTTP_400_BAD_REQUEST
+        with timed("serialize"):
+            data = [result.data for result in results]
+        return Response(data, status=response_status)
 
 
 class ListImageView(APIView):
@@ -53,16 +99,68 @@ class ListImageView(APIView):
 
     model = UserImage
     serializer_class = ImageSerializer
+    pagination_class = KeysetPagination
+    throttle_scope = "my_image"
+
+    # Database columns each serializer field needs, so projected requests only load what they return.
+    field_columns = {
+        "owner": ("owner", "owner__username"),
+        "image": ("image", "private"),
+        "name": ("name",),
+        "times_shared": ("times_shared",),
+        "size": ("size",),
+        "width": ("width",),
+        "height": ("height",),
+        "content_type": ("content_type",),
+        "derivatives": ("blob", "private"),
+    }
 
     @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter("cursor", in_=openapi.IN_QUERY, type=openapi.TYPE_STRING),
+            openapi.Parameter("page_size", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter(
+                "fields",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Comma separated list of fields to return, e.g. name,size",
+            ),
+        ],
         responses={
             status.HTTP_200_OK: ImageSerializer(many=True),
         },
     )
+    @cache_response()
     def get(self, request: Request, *args, **kwargs):
-        objects = self.model.objects.filter(owner=request.user)
-        serializer = self.serializer_class(objects, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        fields = self.get_fields(request)
+
+        columns = {"id", "datetime_created"}
+        for field in fields:
+            columns.update(self.field_columns[field])
+
+        objects = self.model.objects.filter(owner=request.user).only(*columns)
+        if "owner" in fields:
+            objects = objects.select_related("owner")
+        if "derivatives" in fields:
+            objects = objects.prefetch_related("blob__derivatives")
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(objects, request, view=self)
+        serializer = self.serializer_class(page, many=True, fields=fields)
+        with timed("serialize"):
+            data = serializer.data
+        return paginator.get_paginated_response(data)
+
+    def get_fields(self, request: Request):
+        requested = request.query_params.get("fields")
+        if not requested:
+            return list(self.field_columns)
+
+        fields = [field.strip() for field in requested.split(",") if field.strip()]
+        unknown = set(fields) - set(self.field_columns)
+        if unknown:
+            raise ValidationError({"fields": ["Unknown field(s): {}.".format(", ".join(sorted(unknown)))]})
+        return fields
 
 
 class SearchImagesView(APIView):
@@ -70,6 +168,8 @@ class SearchImagesView(APIView):
 
     model = UserImage
     serializer_class = ImageSerializer
+    pagination_class = SearchResultsPagination
+    throttle_scope = "search_image"
 
     @swagger_auto_schema(
         manual_parameters=[
@@ -77,12 +177,15 @@ class SearchImagesView(APIView):
                 "name",
                 in_=openapi.IN_QUERY,
                 type=openapi.TYPE_STRING,
-            )
+            ),
+            openapi.Parameter("page", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
+            openapi.Parameter("page_size", in_=openapi.IN_QUERY, type=openapi.TYPE_INTEGER),
         ],
         responses={
-            status.HTTP_201_CREATED: ImageSerializer(many=True),
+            status.HTTP_200_OK: ImageSerializer(many=True),
         },
     )
+    @cache_response(public=True)
     def get(self, request: Request) -> Response:
         image_name = request.GET.get("name")
         if not image_name:
@@ -91,17 +194,76 @@ class SearchImagesView(APIView):
                 status=status.HTTP_400_BAD_REQUEST,
             )
 
-        # Grab images all images, then filter by name and including images that are NOT private unless,
-        # the private image owned by the requesting user.
-        objects = self.model.objects.filter(Q(image__icontains=image_name) & (Q(owner=request.user) | Q(private=False)))
-        serializer = self.serializer_class(objects, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        # Look the name up in the search index, then keep images that are NOT private unless,
+        # the private image is owned by the requesting user.
+        objects = (
+            self.model.objects.search(image_name)
+            .filter(Q(owner=request.user) | Q(private=False))
+            .select_related("owner")
+            .prefetch_related("blob__derivatives")
+        )
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(objects, request, view=self)
+        serializer = self.serializer_class(page, many=True)
+        with timed("serialize"):
+            data = serializer.data
+        return paginator.get_paginated_response(data)
+
+
+class ExportImagesView(APIView):
+    """Download all the user's images as a ZIP archive, along with a manifest.json of their metadata."""
+
+    throttle_scope = "export_images"
+    export_class = ImageExport
+
+    @swagger_auto_schema(responses={status.HTTP_200_OK: "A ZIP archive, streamed as it is generated."})
+    def get(self, request: Request) -> StreamingHttpResponse:
+        export = self.export_class(request.user, request=request)
+        response = StreamingHttpResponse(export, content_type="application/zip")
+        response["Content-Disposition"] = 'attachment; filename="images-{}.zip"'.format(request.user.username)
+        return response
+
+
+class ImageStatsView(APIView):
+    """Get the statistics of a user's images, read from a row kept up to date rather than counted from the images."""
+
+    serializer_class = ImageUsageSerializer
+    throttle_scope = "image_stats"
+
+    @swagger_auto_schema(
+        manual_parameters=[
+            openapi.Parameter(
+                "username",
+                in_=openapi.IN_QUERY,
+                type=openapi.TYPE_STRING,
+                description="Staff only, the user whose statistics to get instead of your own.",
+            ),
+        ],
+        responses={
+            status.HTTP_200_OK: ImageUsageSerializer,
+        },
+    )
+    def get(self, request: Request) -> Response:
+        username = request.query_params.get("username")
+        if username and username != request.user.username:
+            if not request.user.is_staff:
+                raise PermissionDenied()
+            usage = ImageUsage.objects.filter(owner__username=username).first()
+            if usage is None and not User.objects.filter(username=username).exists():
+                raise NotFound()
+        else:
+            usage = ImageUsage.objects.filter(pk=request.user.pk).first()
+
+        # Users without images have no row yet.
+        return Response(self.serializer_class(usage or ImageUsage()).data)
 
 
 class ShareImageView(APIView):
     """Transfer an image from the owner to a targeted user."""
 
     serializer_class = ShareImageSerializer
+    throttle_scope = "share_image"
 
     @swagger_auto_schema(
         request_body=ShareImageSerializer,
@@ -117,30 +279,217 @@ class ShareImageView(APIView):
         target_user = serializer.validated_data["target_user"]
         image_name = serializer.validated_data["image_name"]
 
-        target_user = get_object_or_404(User, username=target_user)
-
-        # Attempt to get an image by the name which also belongs to the requsting user.
-        owner_image = get_object_or_404(UserImage, owner=request.user, image=image_name)
+        # Get the image by the name which also belongs to the requesting user, along with the target user's id.
+        owner_image = get_object_or_404(
+            UserImage.objects.select_related("blob").annotate(
+                target_user_id=Subquery(User.objects.filter(username=target_user).values("pk")[:1])
+            ),
+            owner=request.user,
+            name=image_name,
+        )
+        if owner_image.target_user_id is None:
+            raise NotFound()
 
         # User should not be able to share an image to themselves
-        if owner_image.owner == target_user:
+        if owner_image.owner_id == owner_image.target_user_id:
             return Response(
                 {"message": "Unfortunately, you are not allowed to share images to yourself, that would be weird."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        target_user_has_image = UserImage.objects.filter(owner=target_user, image=owner_image.image).exists()
 
-        if target_user_has_image:
+        # Create a new UserImage object for the target user so they now have the image, sharing the stored file,
+        # and increment times_shared of the owner's image.
+        if UserImage.objects.share(owner_image, owner_image.target_user_id) is None:
             return Response(
                 {"message": "Sorry, but this user already has this image. Try another one."},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        # Create a new UserImage object for the to_user so he now has the image.
-        UserImage.objects.create(owner=target_user, image=owner_image.image)
-
-        # Increment times_shared for the image instance of the image owner by 1
-        owner_image.times_shared += 1
-        owner_image.save(update_fields=["times_shared"])
 
         message = "{} has been succesfully shared to {}".format(image_name, target_user)
         return Response({"message": message}, status=status.HTTP_200_OK)
+
+
+class BulkShareImageView(APIView):
+    """Share several images to several users at once."""
+
+    serializer_class = BulkShareImageSerializer
+    share_class = BulkImageShare
+    throttle_scope = "share_images"
+
+    @swagger_auto_schema(
+        request_body=BulkShareImageSerializer,
+        responses={
+            status.HTTP_200_OK: "Every image was shared to every user, the result of each pair is listed.",
+            status.HTTP_207_MULTI_STATUS: "Some images could not be shared, the result of each pair is listed.",
+        },
+    )
+    def post(self, request: Request) -> Response:
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        share = self.share_class(
+            owner=request.user,
+            image_names=serializer.validated_data["image_names"],
+            target_users=serializer.validated_data["target_users"],
+        )
+        results = share.run()
+
+        if not share.failed:
+            response_status = status.HTTP_200_OK
+        elif share.succeeded:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response([result.data for result in results], status=response_status)
+
+
+class DirectUploadView(APIView):
+    """Issue requests uploading files straight to storage, bypassing the API, to confirm once they are done."""
+
+    serializer_class = DirectUploadSerializer
+    permission_classes = (permissions.IsAuthenticated, WithinStorageQuota)
+    throttle_scope = "direct_upload"
+
+    @swagger_auto_schema(
+        request_body=DirectUploadSerializer,
+        responses={
+            status.HTTP_200_OK: "The request uploading each file, along with the upload_id confirming it.",
+            status.HTTP_207_MULTI_STATUS: "Some files need not be uploaded, the result of each file is listed.",
+        },
+    )
+    def post(self, request: Request) -> Response:
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        files = serializer.validated_data["files"]
+        uploads = DirectUploads.for_storage()
+
+        # Files the owner already has would be rejected once uploaded, spare the client uploading them.
+        owned = set(
+            UserImage.objects.filter(
+                owner=request.user, blob__digest__in={file["sha256"] for file in files}
+            ).values_list("blob__digest", flat=True)
+        )
+        # The request is small, the quota is checked against the declared size of each file instead.
+        remaining = request.remaining_storage
+        results = []
+        for file in files:
+            if file["sha256"] in owned:
+                results.append(
+                    {"name": file["name"], "status": status.HTTP_409_CONFLICT, "errors": BulkImageUpload.conflict_error}
+                )
+                continue
+            if remaining is not None and file["size"] > remaining:
+                results.append(
+                    {
+                        "name": file["name"],
+                        "status": status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        "errors": BulkImageUpload.quota_error,
+                    }
+                )
+                continue
+            owned.add(file["sha256"])
+            if remaining is not None:
+                remaining -= file["size"]
+
+            ticket = DirectUploadTicket.issue(request.user, **file)
+            upload = uploads.presign(ticket)
+            upload["url"] = request.build_absolute_uri(upload["url"])
+            results.append(
+                {
+                    "name": file["name"],
+                    "status": status.HTTP_200_OK,
+                    "upload_id": ticket.upload_id,
+                    "upload": upload,
+                    "expires_in": settings.IMAGES_DIRECT_UPLOAD_EXPIRY,
+                }
+            )
+
+        succeeded = sum(result["status"] == status.HTTP_200_OK for result in results)
+        if succeeded == len(results):
+            response_status = status.HTTP_200_OK
+        elif succeeded:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response(results, status=response_status)
+
+
+class ConfirmDirectUploadView(AddImageView):
+    """Add files uploaded straight to storage to the user's images, once they are verified where they are stored."""
+
+    serializer_class = ConfirmDirectUploadSerializer
+    parser_classes = (JSONParser,)
+    throttle_scope = "confirm_direct_upload"
+    upload_class = DirectImageUpload
+
+    @swagger_auto_schema(
+        request_body=ConfirmDirectUploadSerializer,
+        responses={
+            status.HTTP_201_CREATED: ImageSerializer(many=True),
+            status.HTTP_207_MULTI_STATUS: "Some images could not be added, the result of each file is listed.",
+        },
+    )
+    def post(self, request: Request) -> Response:
+        serializer = self.serializer_class(data=request.data, context={"request": request})
+        serializer.is_valid(raise_exception=True)
+
+        upload = self.upload_class(
+            owner=request.user,
+            tickets=serializer.validated_data["upload_ids"],
+            uploads=DirectUploads.for_storage(),
+            private=serializer.validated_data["private"],
+            remaining_storage=request.remaining_storage,
+        )
+        return self.upload_response(upload, upload.run())
+
+
+class DirectUploadEmulationView(APIView):
+    """
+    Stand in for presigned S3 upload URLs when images are stored on the local file system, e.g. in development.
+
+    The signed link authorizes the upload, like a presigned URL does.
+    """
+
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+    swagger_schema = None
+
+    def put(self, request: Request, token: str) -> Response:
+        uploads = DirectUploads.for_storage()
+        if not isinstance(uploads, FileSystemDirectUploads):
+            raise NotFound()
+
+        try:
+            uploads.receive(token, request.META.get("CONTENT_TYPE", ""), request)
+        except signing.BadSignature:
+            return Response(
+                {"message": "This upload link is invalid or has expired."}, status=status.HTTP_403_FORBIDDEN
+            )
+        except ValueError as error:
+            return Response({"message": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(status=status.HTTP_200_OK)
+
+
+class SignedFileView(APIView):
+    """
+    Serve stored image files through the signed URLs handed out for private images.
+
+    The signature is checked against the signing key alone, without authentication or any database query, and the
+    response may be cached by CDNs and browsers until the URL expires.
+    """
+
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+    swagger_schema = None
+
+    def get(self, request: Request, name: str):
+        expires = request.query_params.get("expires")
+        if not verify(name, expires, request.query_params.get("signature")):
+            return Response({"message": "This link is invalid or has expired."}, status=status.HTTP_403_FORBIDDEN)
+        if not default_storage.exists(name):
+            raise NotFound()
+
+        content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        response = FileResponse(default_storage.open(name, "rb"), content_type=content_type)
+        patch_cache_control(response, public=True, max_age=max(int(expires) - int(time.time()), 0))
+        return response
@@ -0,0 +1,22 @@
+"""
+Entry points of worker processes.
+
+Worker processes are spawned without Django set up, so this module must not import models at import time.
+"""
+import django
+from django.db import connections
+
+
+def init_worker() -> None:
+    django.setup()
+
+
+def generate_in_worker(blob_id) -> None:
+    """Generate the derivatives of a blob in a worker process."""
+    from .derivatives import generate_derivatives
+
+    try:
+        generate_derivatives(blob_id)
+    finally:
+        # Worker processes are long lived, do not hold on to a connection between jobs.
+        connections.close_all()
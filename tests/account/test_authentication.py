@@ -0,0 +1,181 @@
+from datetime import timedelta
+
+from account.authentication import CachedTokenAuthentication, token_cache, token_usage
+from account.models import AuthToken
+from django.core.cache import caches
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.testutils import TestUtils
+
+
+class CachedTokenAuthenticationTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.token = AuthToken.objects.get(user=self.user)
+        self.key = self.token.key
+        self.authentication = CachedTokenAuthentication()
+
+    def authenticate(self):
+        return self.authentication.authenticate_credentials(self.key)
+
+    def test_token_is_looked_up_once(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+        with self.assertNumQueries(0):
+            user, token = self.authenticate()
+
+        self.assertEqual((user.pk, user.username), (self.user.pk, self.user.username))
+        self.assertEqual(token.key, self.key)
+
+    def test_requests_are_not_authenticated_with_queries(self):
+        headers = TestUtils.generate_user_auth_headers(self.user)
+        self.client.get(reverse("images_api:my_image"), **headers)
+
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("images_api:my_image"), **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_each_request_gets_its_own_user(self):
+        self.authenticate()
+
+        first, _ = self.authenticate()
+        first.first_name = "changed"
+        second, _ = self.authenticate()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(second.first_name, "")
+
+    def test_password_hash_is_not_cached(self):
+        self.authenticate()
+
+        user, _ = self.authenticate()
+
+        self.assertIn("password", user.get_deferred_fields())
+
+    def test_deleted_token_is_rejected(self):
+        self.authenticate()
+
+        self.token.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_rotated_token_is_rejected(self):
+        self.authenticate()
+
+        self.token.delete()
+        new_token = AuthToken.objects.issue(self.user)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+        user, _ = self.authentication.authenticate_credentials(new_token.key)
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+
+        self.user.is_active = False
+        self.user.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_deleted_user_is_rejected(self):
+        self.authenticate()
+
+        self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    @override_settings(ACCOUNT_TOKEN_CACHE_LOCAL_TIMEOUT=0)
+    def test_expired_local_entry_is_read_from_shared_cache(self):
+        self.authenticate()
+
+        with self.assertNumQueries(0):
+            user, _ = self.authenticate()
+
+        self.assertEqual(user.pk, self.user.pk)
+
+    def test_local_entry_is_used_without_shared_cache(self):
+        self.authenticate()
+
+        caches["default"].clear()
+
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    @override_settings(ACCOUNT_TOKEN_CACHE_LOCAL_SIZE=1)
+    def test_least_recently_used_tokens_are_evicted(self):
+        other = AuthToken.objects.get(user=UserFactory.create(username="other"))
+        self.authenticate()
+        self.authentication.authenticate_credentials(other.key)
+        caches["default"].clear()
+
+        with self.assertNumQueries(0):
+            self.authentication.authenticate_credentials(other.key)
+        with self.assertNumQueries(1):
+            self.authenticate()
+
+    def test_unknown_token(self):
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.authenticate_credentials("unknown")
+        self.assertIsNone(token_cache.get("unknown"))
+
+    def test_expired_token_is_rejected(self):
+        AuthToken.objects.filter(key=self.key).update(expires=timezone.now())
+
+        with self.assertRaisesMessage(AuthenticationFailed, "Token has expired."):
+            self.authenticate()
+
+    def test_cached_token_expires(self):
+        self.authenticate()
+        # Updates send no signals, the cached token is only rejected for its own expiry time.
+        AuthToken.objects.filter(key=self.key).update(expires=timezone.now() - timedelta(seconds=1))
+        self.token.expires = timezone.now() - timedelta(seconds=1)
+        token_cache.set(self.token)
+
+        with self.assertNumQueries(0), self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+
+class TokenUsageTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.token = AuthToken.objects.get(user=self.user)
+        self.headers = TestUtils.generate_user_auth_headers(self.user)
+
+    def test_requests_do_not_write_last_used(self):
+        for _ in range(3):
+            self.client.get(reverse("images_api:my_image"), **self.headers)
+
+        self.token.refresh_from_db()
+        self.assertIsNone(self.token.last_used)
+
+    def test_flush_writes_last_used_in_batches(self):
+        other = AuthToken.objects.get(user=UserFactory.create(username="other"))
+        unused = AuthToken.objects.issue(self.user)
+        for token in (self.token, other, self.token):
+            CachedTokenAuthentication().authenticate_credentials(token.key)
+
+        with override_settings(ACCOUNT_TOKEN_LAST_USED_BATCH_SIZE=1), self.assertNumQueries(2):
+            self.assertEqual(token_usage.flush(), 2)
+
+        self.assertEqual(AuthToken.objects.filter(last_used__isnull=False).count(), 2)
+        unused.refresh_from_db()
+        self.assertIsNone(unused.last_used)
+        self.assertEqual(token_usage.flush(), 0)
+
+    @override_settings(ACCOUNT_TOKEN_LAST_USED_INTERVAL=0)
+    def test_usage_is_flushed_after_the_response(self):
+        self.client.get(reverse("images_api:my_image"), **self.headers)
+
+        self.token.refresh_from_db()
+        self.assertIsNotNone(self.token.last_used)
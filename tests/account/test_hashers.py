@@ -0,0 +1,111 @@
+from unittest import mock
+
+from account.hashers import FastPasswordHasher, ScryptPasswordHasher, TunedPBKDF2PasswordHasher
+from account.models import AuthToken
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hashers, identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+
+# Small costs, the tests check the parameters are applied rather than how long they take.
+CHEAP_COSTS = dict(ACCOUNT_SCRYPT_N=2 ** 4, ACCOUNT_SCRYPT_R=1, ACCOUNT_SCRYPT_P=1, ACCOUNT_PBKDF2_ITERATIONS=10)
+
+
+@override_settings(**CHEAP_COSTS)
+class ScryptPasswordHasherTests(SimpleTestCase):
+    def setUp(self):
+        self.hasher = ScryptPasswordHasher()
+
+    def test_encode_and_verify(self):
+        encoded = self.hasher.encode("secret", self.hasher.salt())
+
+        self.assertRegex(encoded, r"^scrypt\$16\$\w+\$1\$1\$")
+        self.assertTrue(self.hasher.verify("secret", encoded))
+        self.assertFalse(self.hasher.verify("wrong", encoded))
+        self.assertFalse(self.hasher.must_update(encoded))
+
+    def test_must_update_when_the_cost_changes(self):
+        encoded = self.hasher.encode("secret", self.hasher.salt())
+
+        with override_settings(ACCOUNT_SCRYPT_N=2 ** 5):
+            self.assertTrue(self.hasher.must_update(encoded))
+            # Existing hashes keep verifying with the parameters they were made with.
+            self.assertTrue(self.hasher.verify("secret", encoded))
+
+    def test_pbkdf2_iterations_are_configurable(self):
+        encoded = TunedPBKDF2PasswordHasher().encode("secret", "salt")
+
+        self.assertTrue(encoded.startswith("pbkdf2_sha256$10$"))
+
+
+class FastPasswordHasherTests(SimpleTestCase):
+    def test_only_allowed_with_debug_or_in_tests(self):
+        self.assertTrue(FastPasswordHasher().verify("secret", FastPasswordHasher().encode("secret", "salt")))
+
+        with mock.patch("account.hashers.testing", return_value=False):
+            with override_settings(DEBUG=True):
+                FastPasswordHasher()
+            with override_settings(DEBUG=False), self.assertRaises(ImproperlyConfigured):
+                FastPasswordHasher()
+            with override_settings(
+                DEBUG=False, PASSWORD_HASHERS=settings.ACCOUNT_PASSWORD_HASHING_PROFILES["fast"]
+            ), self.assertRaises(ImproperlyConfigured):
+                get_hashers()
+
+
+@override_settings(**CHEAP_COSTS)
+class HashingProfileTests(APITestCase):
+    def test_profiles_verify_each_others_hashes(self):
+        with override_settings(PASSWORD_HASHERS=settings.ACCOUNT_PASSWORD_HASHING_PROFILES["pbkdf2"]):
+            encoded = make_password("secret")
+
+        with override_settings(PASSWORD_HASHERS=settings.ACCOUNT_PASSWORD_HASHING_PROFILES["scrypt"]):
+            self.assertEqual(identify_hasher(make_password("secret")).algorithm, "scrypt")
+            self.assertTrue(check_password("secret", encoded))
+
+    def test_login_upgrades_hashes_to_the_configured_profile(self):
+        with override_settings(PASSWORD_HASHERS=settings.ACCOUNT_PASSWORD_HASHING_PROFILES["pbkdf2"]):
+            user = UserFactory.create()
+
+        with override_settings(PASSWORD_HASHERS=settings.ACCOUNT_PASSWORD_HASHING_PROFILES["scrypt"]):
+            response = self.client.post(
+                path=reverse("account_api:login"), data={"username": "shols", "password": "password"}
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith("scrypt$"))
+
+
+class RegistrationTransactionTests(APITestCase):
+    def register(self, username="levi"):
+        return self.client.post(path=reverse("account_api:register"), data={"username": username, "password": "x"})
+
+    def test_user_is_not_created_without_its_token(self):
+        with mock.patch.object(AuthToken.objects, "issue", side_effect=RuntimeError), self.assertRaises(RuntimeError):
+            self.register()
+
+        self.assertFalse(User.objects.exists())
+
+    def test_register_queries(self):
+        # The user and token inserts, in one transaction. Taken usernames are found by the insert itself.
+        with self.assertNumQueries(4):
+            response = self.register()
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()["token"], AuthToken.objects.get(user__username="levi").key)
+
+    def test_register_taken_username(self):
+        self.register()
+
+        response = self.register()
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"username": ["A user with that username already exists."]})
+        self.assertEqual(User.objects.count(), 1)
@@ -6,11 +6,9 @@ from django.test import TestCase
 
 class UserFactory(factory.django.DjangoModelFactory):
     username = 'shols'
-    password = make_password("password")
+    # Hashed when each user is built, with the hashing profile in use then.
+    password = factory.LazyFunction(lambda: make_password("password"))
 
     class Meta:
         model = User
-        django_get_or_create = (
-            'username',
-            'password',
-        )
+        django_get_or_create = ('username',)
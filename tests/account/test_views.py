@@ -1,7 +1,13 @@
+from datetime import timedelta
+from io import StringIO
+
+from account.models import AuthToken
 from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.test.utils import override_settings
 from django.urls import reverse
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase
 from tests.account.test_models import UserFactory
 from tests.testutils import CustomTestCase
@@ -22,13 +28,14 @@ class LoginViewTests(CustomTestCase, APITestCase):
         )
 
         # Check side effects
-        self.assertEqual(Token.objects.count(), 1)
-        auth_token = Token.objects.first()
+        self.assertEqual(AuthToken.objects.count(), 1)
+        auth_token = AuthToken.objects.first()
         self.assertEqual(auth_token.user, self.user)
 
         # Check response
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertListEqual(list(response.json().keys()), ["token"])
+        self.assertListEqual(list(response.json().keys()), ["token", "expires"])
+        self.assertEqual(response.json()["token"], auth_token.key)
 
     def test_user_login_error(self):
         """Make sure invalid credentials do NOT return an auth token."""
@@ -55,6 +62,69 @@ class LoginViewTests(CustomTestCase, APITestCase):
         self.assert_invalid_data_response(url=reverse("account_api:login"), invalid_data_dicts=invalid_data_dicts)
 
 
+    def test_login_reuses_fresh_token(self):
+        token = AuthToken.objects.get(user=self.user)
+
+        response = self.client.post(
+            path=reverse("account_api:login"), data={"username": "shols", "password": "password"}
+        )
+
+        self.assertEqual(response.json()["token"], token.key)
+
+    @override_settings(ACCOUNT_TOKEN_ROTATE_AFTER=3600)
+    def test_login_rotates_old_token(self):
+        old = AuthToken.objects.get(user=self.user)
+        AuthToken.objects.filter(key=old.key).update(created=timezone.now() - timedelta(hours=2))
+
+        response = self.client.post(
+            path=reverse("account_api:login"), data={"username": "shols", "password": "password"}
+        )
+
+        self.assertNotEqual(response.json()["token"], old.key)
+        # Other sessions keep working until their token expires.
+        self.assertTrue(AuthToken.objects.filter(key=old.key).exists())
+
+
+class RotateTokenViewTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.token = AuthToken.objects.get(user=self.user)
+        self.headers = {"HTTP_AUTHORIZATION": "Token {}".format(self.token.key)}
+
+    def test_rotate_token(self):
+        # Cache the token first, rotating must still revoke it.
+        self.client.get(reverse("images_api:my_image"), **self.headers)
+
+        response = self.client.post(reverse("account_api:rotate_token"), **self.headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        new_key = response.json()["token"]
+        self.assertNotEqual(new_key, self.token.key)
+        self.assertEqual(AuthToken.objects.get(user=self.user).key, new_key)
+        response = self.client.get(reverse("images_api:my_image"), **self.headers)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.get(reverse("images_api:my_image"), HTTP_AUTHORIZATION="Token {}".format(new_key))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_rotate_token_unauthenticated(self):
+        response = self.client.post(reverse("account_api:rotate_token"))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PurgeExpiredTokensTests(APITestCase):
+    def test_purge_expired_tokens(self):
+        user = UserFactory.create()
+        AuthToken.objects.update(expires=timezone.now() - timedelta(seconds=1))
+        valid = AuthToken.objects.issue(user)
+        for _ in range(4):
+            AuthToken.objects.create(user=user, expires=timezone.now() - timedelta(days=1))
+
+        call_command("purge_expired_tokens", batch_size=2, stdout=StringIO())
+
+        self.assertEqual(list(AuthToken.objects.all()), [valid])
+
+
 class RegisterUserViewTests(CustomTestCase, APITestCase):
     def test_register_success(self):
         """Test succesful creation of Officer"""
@@ -79,8 +149,8 @@ class RegisterUserViewTests(CustomTestCase, APITestCase):
         user = User.objects.get(username="levi")
 
         # Check side effects
-        self.assertEqual(Token.objects.count(), 1)
-        auth_token = Token.objects.first()
+        self.assertEqual(AuthToken.objects.count(), 1)
+        auth_token = AuthToken.objects.first()
         self.assertEqual(auth_token.user, user)
 
     def test_register_with_no_credentials_results_in_error(self):
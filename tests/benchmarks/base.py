@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import statistics
+import time
+import tracemalloc
+from typing import Callable, List, NamedTuple
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from images.models import ImageBlob, UserImage
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.benchmarks.budgets import load_budgets
+from tests.benchmarks.storage import InMemoryStorage
+from tests.images.test_models import UserImageFactory
+
+# Number of images seeded, e.g. 1000, 100000 or 1000000. A tenth of them belong to the benchmarked user.
+ROWS = int(os.environ.get("BENCHMARK_ROWS", 1000))
+# Number of timed requests per endpoint, after the warm-up ones.
+ITERATIONS = int(os.environ.get("BENCHMARK_ITERATIONS", 20))
+WARMUP = 2
+# Hold requests to their latency and CPU time budgets too, which depend on the machine and what else runs on it,
+# e.g. BENCHMARK_TIMING_BUDGETS=1 on a dedicated runner. Query and memory budgets are always checked.
+TIMING_BUDGETS = os.environ.get("BENCHMARK_TIMING_BUDGETS", "") not in ("", "0")
+TIMING_METRICS = {"p99_ms", "cpu_ms"}
+OTHER_USERS = 100
+BATCH_SIZE = 5000
+WORDS = ["holiday", "family", "beach", "sunset", "portrait", "mountain", "city", "forest", "party", "garden"]
+
+
+class Measurement(NamedTuple):
+    name: str
+    p50_ms: float
+    p99_ms: float
+    # Mean CPU time of the process per request, its inverse is the requests per second one core can serve.
+    cpu_ms: float
+    queries: int
+    peak_memory_kb: float
+
+
+@override_settings(
+    DEFAULT_FILE_STORAGE="tests.benchmarks.storage.InMemoryStorage",
+    CACHES={
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+        # Responses are not cached, unless a benchmark measures the cache itself.
+        "benchmark": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"},
+    },
+    IMAGES_RESPONSE_CACHE="benchmark",
+    IMAGES_DERIVATIVES_ASYNC=False,
+)
+class BenchmarkTestCase(APITestCase):
+    """
+    Seed ``ROWS`` images, then measure the latency, queries and memory of API requests against budgets. Timings are
+    always reported, but only checked with ``TIMING_BUDGETS``.
+
+    Each benchmark calls ``request(i)`` with a distinct ``i`` for every run, so requests which change data, such
+    as shares, can each use different rows.
+    """
+
+    budgets = load_budgets()
+    measurements: List[Measurement] = []
+    # Whether the benchmarks need the images seeded.
+    seed_images = True
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = UserFactory.create(username="benchmark")
+        User.objects.bulk_create(
+            UserFactory.build(username="benchmark{}".format(number)) for number in range(OTHER_USERS)
+        )
+        cls.other_users = list(User.objects.exclude(pk=cls.user.pk).order_by("pk"))
+        if not cls.seed_images:
+            return
+
+        for start in range(0, ROWS, BATCH_SIZE):
+            blobs, images = [], []
+            for number in range(start, min(start + BATCH_SIZE, ROWS)):
+                owner = cls.user if number % 10 == 0 else cls.other_users[number % OTHER_USERS]
+                name = "{}_{:07d}.png".format(WORDS[number % len(WORDS)], number)
+                blob = ImageBlob(
+                    digest=hashlib.sha256(name.encode()).hexdigest(), file="seed/" + name, size=1049, ref_count=1
+                )
+                blobs.append(blob)
+                images.append(UserImageFactory.build(owner=owner, image=blob.file.name, name=name, blob=blob))
+            ImageBlob.objects.bulk_create(blobs)
+            UserImage.objects.bulk_create(images)
+        cls.user_images = list(UserImage.objects.filter(owner=cls.user).order_by("name"))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        InMemoryStorage.clear()
+
+    def benchmark(self, name: str, request: Callable[[int], object], iterations: int = ITERATIONS) -> Measurement:
+        for number in range(WARMUP):
+            self.assertOk(request(number))
+
+        timings = []
+        cpu_start = time.process_time()
+        for number in range(WARMUP, WARMUP + iterations):
+            start = time.perf_counter()
+            response = request(number)
+            timings.append((time.perf_counter() - start) * 1000)
+            self.assertOk(response)
+        cpu_ms = (time.process_time() - cpu_start) * 1000 / iterations
+
+        # Queries and memory are measured apart, as tracing them slows the request down.
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                self.assertOk(request(WARMUP + iterations))
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        measurement = Measurement(
+            name=name,
+            p50_ms=statistics.median(timings),
+            p99_ms=statistics.quantiles(timings, n=100, method="inclusive")[98],
+            cpu_ms=cpu_ms,
+            queries=len(queries),
+            peak_memory_kb=peak / 1024,
+        )
+        self.record(measurement)
+        self.assertWithinBudget(measurement)
+        return measurement
+
+    def assertOk(self, response):
+        self.assertLess(response.status_code, 400, msg=getattr(response, "content", b"")[:500])
+
+    def assertWithinBudget(self, measurement: Measurement):
+        budget = self.budgets.get(measurement.name, {})
+        for metric, limit in budget.items():
+            if metric in TIMING_METRICS and not TIMING_BUDGETS:
+                continue
+            value = getattr(measurement, metric)
+            self.assertLessEqual(
+                value,
+                limit,
+                msg="{} exceeds its {} budget at {} rows: {:.1f} > {}".format(
+                    measurement.name, metric, ROWS, value, limit
+                ),
+            )
+
+    @classmethod
+    def record(cls, measurement: Measurement):
+        cls.measurements.append(measurement)
+        print(
+            "\n{m.name}: p50 {m.p50_ms:.1f}ms, p99 {m.p99_ms:.1f}ms, {m.cpu_ms:.1f}ms CPU ({per_core:.0f}/s per core), "
+            "{m.queries} queries, peak {m.peak_memory_kb:.0f}KiB ({rows} rows)".format(
+                m=measurement, per_core=1000 / measurement.cpu_ms if measurement.cpu_ms else float("inf"), rows=ROWS
+            )
+        )
+        report = os.environ.get("BENCHMARK_REPORT")
+        if report:
+            with open(report, "w") as file:
+                json.dump({"rows": ROWS, "results": [m._asdict() for m in cls.measurements]}, file, indent=2)
@@ -0,0 +1,34 @@
+import json
+import os
+from typing import Dict
+
+# What each endpoint may cost per request: database queries, 99th percentile latency and mean CPU time in
+# milliseconds and peak memory allocated by Python in KiB. Query counts must not grow with the number of rows,
+# latencies are sized for the default scale and only checked with $BENCHMARK_TIMING_BUDGETS. Override any of them
+# with a JSON file of the same shape named by $BENCHMARK_BUDGETS.
+DEFAULT_BUDGETS = {
+    "register": {"queries": 4, "p99_ms": 1000, "peak_memory_kb": 512},
+    # Registration with each password hashing profile's default cost, which is meant to take most of it.
+    "register_default": {"queries": 4, "cpu_ms": 2000},
+    "register_scrypt": {"queries": 4, "cpu_ms": 1000},
+    "register_argon2": {"queries": 4, "cpu_ms": 1000},
+    "login": {"queries": 2, "p99_ms": 1000, "peak_memory_kb": 512},
+    "list_images": {"queries": 4, "p99_ms": 250, "peak_memory_kb": 1024},
+    "list_images_projected": {"queries": 2, "p99_ms": 250, "peak_memory_kb": 512},
+    "list_images_deep_page": {"queries": 4, "p99_ms": 250, "peak_memory_kb": 1024},
+    "list_images_not_modified": {"queries": 1, "p99_ms": 50, "peak_memory_kb": 128},
+    "search_images": {"queries": 5, "p99_ms": 500, "peak_memory_kb": 512},
+    "share_image": {"queries": 8, "p99_ms": 250, "peak_memory_kb": 256},
+    "share_images_batch": {"queries": 14, "p99_ms": 500, "peak_memory_kb": 1024},
+    "add_images": {"queries": 15, "p99_ms": 500, "peak_memory_kb": 1024},
+}
+
+
+def load_budgets() -> Dict[str, Dict[str, float]]:
+    budgets = {name: dict(budget) for name, budget in DEFAULT_BUDGETS.items()}
+    path = os.environ.get("BENCHMARK_BUDGETS")
+    if path:
+        with open(path) as file:
+            for name, budget in json.load(file).items():
+                budgets.setdefault(name, {}).update(budget)
+    return budgets
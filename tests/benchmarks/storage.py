@@ -0,0 +1,49 @@
+import threading
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import Storage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class InMemoryStorage(Storage):
+    """
+    A storage keeping files in a process-wide dict, so benchmarks measure the application rather than disk I/O.
+
+    It has no local path, so uploads are spooled to a temporary file then saved, where S3 storages have them
+    streamed by ``StorageWriter`` as they arrive: the upload benchmarks leave out the cost of the transfer itself.
+    """
+
+    files = {}
+    lock = threading.Lock()
+
+    def _open(self, name, mode="rb"):
+        with self.lock:
+            return ContentFile(self.files[name], name=name)
+
+    def _save(self, name, content):
+        buffer = BytesIO()
+        for chunk in content.chunks():
+            buffer.write(chunk)
+        with self.lock:
+            self.files[name] = buffer.getvalue()
+        return name
+
+    def delete(self, name):
+        with self.lock:
+            self.files.pop(name, None)
+
+    def exists(self, name):
+        return name in self.files
+
+    def size(self, name):
+        return len(self.files[name])
+
+    def url(self, name):
+        return "/media/{}".format(name)
+
+    @classmethod
+    def clear(cls):
+        with cls.lock:
+            cls.files.clear()
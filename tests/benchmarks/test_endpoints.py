@@ -0,0 +1,118 @@
+import importlib.util
+
+from django.conf import settings
+from django.test.utils import override_settings
+from django.urls import reverse
+from tests.benchmarks.base import ITERATIONS, OTHER_USERS, WARMUP, BenchmarkTestCase
+from tests.testutils import TestUtils
+
+
+class AccountBenchmarks(BenchmarkTestCase):
+    seed_images = False
+
+    def register(self, prefix):
+        return lambda number: self.client.post(
+            path=reverse("account_api:register"),
+            data={"username": "{}{}".format(prefix, number), "password": "password", "password2": "password"},
+        )
+
+    def test_register(self):
+        # With the tests' fast hashing, so this measures everything but the hashing.
+        self.benchmark("register", self.register("registered"), iterations=min(ITERATIONS, 10))
+
+    def test_register_hashing_profiles(self):
+        """Registrations per second per core with each production hashing profile, as configured."""
+        for profile in ("default", "scrypt", "argon2"):
+            if profile == "argon2" and importlib.util.find_spec("argon2") is None:
+                continue
+            hashers = settings.ACCOUNT_PASSWORD_HASHING_PROFILES[profile]
+            with self.subTest(profile=profile), override_settings(PASSWORD_HASHERS=hashers):
+                self.benchmark("register_" + profile, self.register(profile), iterations=min(ITERATIONS, 3))
+
+    def test_login(self):
+        self.benchmark(
+            "login",
+            lambda number: self.client.post(
+                path=reverse("account_api:login"), data={"username": "benchmark", "password": "password"}
+            ),
+            iterations=min(ITERATIONS, 10),
+        )
+
+
+class ImageBenchmarks(BenchmarkTestCase):
+    def setUp(self):
+        self.headers = TestUtils.generate_user_auth_headers(self.user)
+
+    def get(self, name, data=None, **extra):
+        return self.client.get(path=reverse(name), data=data, **self.headers, **extra)
+
+    def test_list_images(self):
+        self.benchmark("list_images", lambda number: self.get("images_api:my_image"))
+
+    def test_list_images_projected(self):
+        self.benchmark(
+            "list_images_projected", lambda number: self.get("images_api:my_image", {"fields": "name,size"})
+        )
+
+    def test_list_images_deep_page(self):
+        # The cursor of a page far down the list, keyset pagination should make it as cheap as the first one.
+        response = self.get("images_api:my_image", {"page_size": 200})
+        for _ in range(min(len(self.user_images) // 200 - 1, 20)):
+            response = self.client.get(path=response.json()["next"], **self.headers)
+        next_page = response.json()["next"] or reverse("images_api:my_image")
+
+        self.benchmark(
+            "list_images_deep_page", lambda number: self.client.get(path=next_page, **self.headers)
+        )
+
+    @override_settings(IMAGES_RESPONSE_CACHE="default")
+    def test_list_images_not_modified(self):
+        etag = self.get("images_api:my_image")["ETag"]
+
+        self.benchmark(
+            "list_images_not_modified", lambda number: self.get("images_api:my_image", HTTP_IF_NONE_MATCH=etag)
+        )
+
+    def test_search_images(self):
+        name = self.user_images[len(self.user_images) // 2].name
+        self.benchmark("search_images", lambda number: self.get("images_api:search_image", {"name": name[:-4]}))
+
+    def test_share_image(self):
+        # Every run shares an image to another user, so none of them conflict.
+        self.benchmark(
+            "share_image",
+            lambda number: self.client.post(
+                path=reverse("images_api:share_image"),
+                data={
+                    "target_user": self.other_users[number % OTHER_USERS].username,
+                    "image_name": self.user_images[number // OTHER_USERS].name,
+                },
+                **self.headers,
+            ),
+        )
+
+    def test_share_images_batch(self):
+        # 5 images to 2 users per run, every run to different users.
+        self.assertLessEqual(2 * (WARMUP + ITERATIONS + 1), OTHER_USERS)
+        self.benchmark(
+            "share_images_batch",
+            lambda number: self.client.post(
+                path=reverse("images_api:share_images"),
+                data={
+                    "image_names": [image.name for image in self.user_images[:5]],
+                    "target_users": [user.username for user in self.other_users[2 * number : 2 * number + 2]],
+                },
+                format="json",
+                **self.headers,
+            ),
+        )
+
+    def test_add_images(self):
+        self.benchmark(
+            "add_images",
+            lambda number: self.client.post(
+                path=reverse("images_api:add_image"),
+                data={"image": [TestUtils.create_unique_image_file("upload{}.png".format(i)) for i in range(5)]},
+                **self.headers,
+            ),
+        )
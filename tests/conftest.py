@@ -0,0 +1,26 @@
+import pytest
+from account.authentication import token_cache, token_usage
+from django.conf import settings
+from django.core.cache import caches
+from django.test.utils import override_settings
+from imagerepo.throttling import local_buckets
+from images.storage import storage_metrics
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Cached responses would otherwise leak between tests, as the test database reuses primary keys."""
+    for cache in caches.all():
+        cache.clear()
+    token_cache.clear()
+    token_usage.reset()
+    local_buckets.clear()
+    storage_metrics.reset()
+    yield
+
+
+@pytest.fixture(autouse=True, scope="session")
+def fast_password_hashing():
+    """Hashing passwords at their production cost would take most of the tests' time."""
+    with override_settings(PASSWORD_HASHERS=settings.ACCOUNT_PASSWORD_HASHING_PROFILES["fast"]):
+        yield
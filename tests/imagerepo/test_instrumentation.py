@@ -0,0 +1,114 @@
+import json
+from tempfile import TemporaryDirectory
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from imagerepo.instrumentation import RequestRecord, metrics, timed
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+def server_timing(response):
+    """The metrics of a Server-Timing header, as ``{name: {"dur": ..., "desc": ...}}``."""
+    parsed = {}
+    for metric in response["Server-Timing"].split(", "):
+        name, *params = metric.split(";")
+        parsed[name] = dict(param.split("=", 1) for param in params)
+    return parsed
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+class InstrumentationMiddlewareTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.headers = TestUtils.generate_user_auth_headers(self.user)
+        metrics.reset()
+
+    def tearDown(self):
+        metrics.reset()
+
+    def test_add_image_timings(self):
+        """An upload is split into parsing, validation, storage calls, queries and serialization."""
+        with self.assertLogs("imagerepo.instrumentation", "INFO") as logs:
+            response = self.client.post(
+                path=reverse("images_api:add_image"),
+                data={"image": TestUtils.create_temp_file("timed.png")},
+                **self.headers,
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        timings = server_timing(response)
+        for name in ("total", "db", "storage", "parse", "validate", "serialize", "render"):
+            self.assertIn(name, timings)
+            self.assertGreaterEqual(float(timings[name]["dur"]), 0)
+        self.assertRegex(timings["db"]["desc"], r'^"\d+ queries"$')
+
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["route"], "images_api:add_image")
+        self.assertEqual(record["method"], "POST")
+        self.assertEqual(record["status"], status.HTTP_201_CREATED)
+        self.assertGreater(record["queries"], 0)
+        self.assertGreater(record["storage_calls"], 0)
+        self.assertEqual(logs.records[0].request_record, record)
+
+    def test_list_images_timings(self):
+        UserImageFactory.create(owner=self.user, image=TestUtils.create_temp_file("listed.png"))
+
+        response = self.client.get(path=reverse("images_api:my_image"), **self.headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        timings = server_timing(response)
+        self.assertIn("serialize", timings)
+        self.assertNotIn("storage", timings)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0.0)
+    def test_requests_not_sampled(self):
+        response = self.client.get(path=reverse("images_api:my_image"), **self.headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(metrics.snapshot(), {})
+
+    def test_metrics(self):
+        staff = UserFactory.create(username="staff", is_staff=True)
+        for _ in range(3):
+            self.client.get(path=reverse("images_api:my_image"), **self.headers)
+
+        response = self.client.get(path=reverse("metrics"), **TestUtils.generate_user_auth_headers(staff))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["sample_rate"], 1.0)
+        histograms = response.data["routes"]["images_api:my_image"]
+        self.assertEqual(histograms["duration_ms"]["count"], 3)
+        self.assertEqual(histograms["duration_ms"]["buckets"][-1], {"le": "+Inf", "count": 3})
+        self.assertIsNotNone(histograms["duration_ms"]["p99"])
+        self.assertEqual(histograms["queries"]["count"], 3)
+        self.assertIn("serialize_ms", histograms)
+
+    def test_metrics_require_staff(self):
+        response = self.client.get(path=reverse("metrics"), **self.headers)
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class RequestRecordTests(SimpleTestCase):
+    def test_timed_outside_a_sampled_request(self):
+        """Hooks do nothing when the request is not sampled."""
+        with timed("storage"):
+            value = 1
+        self.assertEqual(value, 1)
+
+    def test_record(self):
+        record = RequestRecord()
+        record.add("storage", 0.002)
+        record.add("storage", 0.001)
+        record.total = 0.01
+
+        self.assertEqual(record.server_timing(), 'total;dur=10.0, storage;dur=3.0;desc="2 calls"')
+        self.assertEqual(record.as_dict(), {"duration_ms": 10.0, "queries": 0, "storage_ms": 3.0, "storage_calls": 2})
@@ -0,0 +1,104 @@
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from imagerepo.throttling import CacheBuckets, LocalBuckets, parse_rate, take_token
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+class TokenBucketTests(SimpleTestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate("60/min"), (60, 60))
+        self.assertEqual(parse_rate("5/s"), (5, 1))
+        self.assertEqual(parse_rate("1000/day"), (1000, 86400))
+
+    def test_bursts_then_refills_evenly(self):
+        bucket = None
+        for _ in range(3):
+            bucket, wait = take_token(bucket, capacity=3, refill_rate=0.5, now=100.0)
+            self.assertEqual(wait, 0)
+
+        bucket, wait = take_token(bucket, capacity=3, refill_rate=0.5, now=100.0)
+        self.assertEqual(wait, 2.0)
+        bucket, wait = take_token(bucket, capacity=3, refill_rate=0.5, now=101.0)
+        self.assertEqual(wait, 1.0)
+        bucket, wait = take_token(bucket, capacity=3, refill_rate=0.5, now=102.0)
+        self.assertEqual(wait, 0)
+
+    def test_refills_up_to_its_capacity(self):
+        bucket, _ = take_token(None, capacity=3, refill_rate=1, now=0.0)
+
+        self.assertEqual(take_token(bucket, capacity=3, refill_rate=1, now=1000.0), ((2, 1000.0), 0))
+
+    def test_backends(self):
+        for buckets in [LocalBuckets(), CacheBuckets()]:
+            with self.subTest(buckets=type(buckets).__name__):
+                self.assertEqual(buckets.take("a", 1, 1, now=10.0), 0)
+                self.assertEqual(buckets.take("a", 1, 1, now=10.5), 0.5)
+                self.assertEqual(buckets.take("b", 1, 1, now=10.5), 0)
+
+    @override_settings(THROTTLE_LOCAL_SIZE=2)
+    def test_local_buckets_are_bounded(self):
+        buckets = LocalBuckets()
+        for key in ["a", "b", "c"]:
+            buckets.take(key, 1, 1, now=0.0)
+
+        # The least recently used bucket was dropped, so it is full again.
+        self.assertEqual(buckets.take("a", 1, 1, now=0.0), 0)
+        self.assertEqual(buckets.take("c", 1, 1, now=0.0), 1)
+
+
+def rates(**scopes):
+    return override_settings(REST_FRAMEWORK=dict(settings.REST_FRAMEWORK, DEFAULT_THROTTLE_RATES=scopes))
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class TokenBucketThrottleTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.other = UserFactory.create(username="other")
+        self.image = UserImageFactory.create(owner=self.user)
+
+    def share(self, user):
+        return self.client.post(
+            path=reverse("images_api:share_image"),
+            data={"image_name": "missing.png", "target_user": "other"},
+            **TestUtils.generate_user_auth_headers(user),
+        )
+
+    def test_requests_over_the_rate_are_throttled(self):
+        for backend in ["local", "cache"]:
+            with self.subTest(backend=backend), override_settings(THROTTLE_BACKEND=backend), rates(share_image="2/min"):
+                self.assertEqual(self.share(self.user).status_code, status.HTTP_404_NOT_FOUND)
+                self.assertEqual(self.share(self.user).status_code, status.HTTP_404_NOT_FOUND)
+
+                response = self.share(self.user)
+
+                self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+                self.assertIn(response["Retry-After"], {"29", "30"})
+                # Each user has their own bucket.
+                self.assertEqual(self.share(self.other).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_endpoints_have_their_own_buckets(self):
+        with rates(share_image="1/min", my_image="1/min"):
+            self.share(self.user)
+            response = self.client.get(
+                path=reverse("images_api:my_image"), **TestUtils.generate_user_auth_headers(self.user)
+            )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_endpoints_without_a_rate_are_not_throttled(self):
+        with rates(share_image="1/min"):
+            for _ in range(3):
+                response = self.client.get(
+                    path=reverse("images_api:my_image"), **TestUtils.generate_user_auth_headers(self.user)
+                )
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
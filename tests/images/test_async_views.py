@@ -0,0 +1,157 @@
+import asyncio
+import io
+import json
+import zipfile
+from tempfile import TemporaryDirectory
+
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from django.test.utils import override_settings
+from django.urls import include, path, reverse
+from images.async_views import AsyncAPIView
+from images.models import UserImage
+from imagerepo.handlers import ASGIHandler
+from images.urls import async_urlpatterns, export_urlpatterns, file_urlpatterns, stats_urlpatterns
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images import test_views
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+urlpatterns = [
+    path("api/auth/", include(("account.urls", "account"), namespace="account_api")),
+    path(
+        "api/images/",
+        include(
+            (async_urlpatterns + file_urlpatterns + stats_urlpatterns + export_urlpatterns, "images"),
+            namespace="images_api",
+        ),
+    ),
+]
+
+
+# The view tests, run against the async views. Each gets its own media root, as the files they store would
+# otherwise be renamed by those the view tests store.
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name, ROOT_URLCONF=__name__)
+class AsyncAddImageViewTests(test_views.AddImageViewTests):
+    pass
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name, ROOT_URLCONF=__name__)
+class AsyncShareImageViewTests(test_views.ShareImageViewTests):
+    pass
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name, ROOT_URLCONF=__name__)
+class AsyncBulkShareImageViewTests(test_views.BulkShareImageViewTests):
+    pass
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name, ROOT_URLCONF=__name__)
+class AsyncSearchImageViewTests(test_views.SearchImageViewTests):
+    pass
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name, ROOT_URLCONF=__name__)
+class AsyncListImageViewTests(test_views.ListImageViewTests):
+    pass
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+@override_settings(ROOT_URLCONF=__name__)
+class AsyncViewsTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.headers = TestUtils.generate_user_auth_headers(self.user)
+
+    def test_views_are_coroutines(self):
+        for pattern in async_urlpatterns:
+            self.assertTrue(asyncio.iscoroutinefunction(pattern.callback), msg=pattern.name)
+            self.assertTrue(issubclass(pattern.callback.cls, AsyncAPIView), msg=pattern.name)
+
+    def test_unauthenticated(self):
+        response = self.client.get(path=reverse("images_api:my_image"))
+
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_method_not_allowed(self):
+        response = self.client.put(path=reverse("images_api:my_image"), **self.headers)
+
+        self.assertEqual(response.status_code, status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=1.0)
+    async def test_concurrent_uploads(self):
+        """Several uploads are served at once by the ASGI application, each storing its files concurrently."""
+        application = ASGIHandler()
+
+        async def upload(number):
+            files = [TestUtils.create_unique_image_file("async{}_{}.png".format(number, i)) for i in range(3)]
+            body = encode_multipart(BOUNDARY, {"image": files})
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "POST",
+                "scheme": "http",
+                "server": ("testserver", 80),
+                "path": reverse("images_api:add_image"),
+                "query_string": b"",
+                "headers": [
+                    (b"host", b"testserver"),
+                    (b"authorization", self.headers["HTTP_AUTHORIZATION"].encode()),
+                    (b"content-type", MULTIPART_CONTENT.encode()),
+                    (b"content-length", str(len(body)).encode()),
+                ],
+            }
+            communicator = ApplicationCommunicator(application, scope)
+            await communicator.send_input({"type": "http.request", "body": body})
+            start = await communicator.receive_output(timeout=10)
+            response = await communicator.receive_output(timeout=10)
+            return start["status"], dict(start["headers"]), json.loads(response["body"])
+
+        responses = await asyncio.gather(*(upload(number) for number in range(4)))
+
+        for response_status, headers, data in responses:
+            self.assertEqual(response_status, status.HTTP_201_CREATED, msg=data)
+            self.assertEqual(len(data), 3)
+            # Queries and storage calls made from other threads are timed for the request.
+            self.assertRegex(headers[b"Server-Timing"].decode(), r"db;dur=[\d.]+;desc=\"\d+ queries\"")
+            self.assertIn("storage;", headers[b"Server-Timing"].decode())
+        self.assertEqual(await sync_to_async(UserImage.objects.filter(owner=self.user).count)(), 12)
+
+    async def test_export(self):
+        """The archive is generated from the database and storage as it is sent, off the event loop."""
+        for i in range(3):
+            await sync_to_async(UserImageFactory.create)(
+                owner=self.user, image=TestUtils.create_unique_image_file("export{}.png".format(i))
+            )
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "path": reverse("images_api:export_images"),
+            "query_string": b"",
+            "headers": [(b"host", b"testserver"), (b"authorization", self.headers["HTTP_AUTHORIZATION"].encode())],
+        }
+        communicator = ApplicationCommunicator(ASGIHandler(), scope)
+        await communicator.send_input({"type": "http.request", "body": b""})
+
+        start = await communicator.receive_output(timeout=10)
+        body = b""
+        while True:
+            message = await communicator.receive_output(timeout=10)
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        self.assertEqual(start["status"], status.HTTP_200_OK)
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(len(archive.namelist()), 4)
+        self.assertEqual(len(json.loads(archive.read("manifest.json"))), 3)
@@ -0,0 +1,107 @@
+from tempfile import TemporaryDirectory
+
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ResponseCacheTests(APITestCase):
+    def setUp(self):
+        self.user_1 = UserFactory.create(username="user1")
+        self.user_2 = UserFactory.create(username="user2")
+        self.image = UserImageFactory.create(owner=self.user_1, image=TestUtils.create_temp_file("cached.png"))
+        self.user_1_headers = TestUtils.generate_user_auth_headers(self.user_1)
+        self.user_2_headers = TestUtils.generate_user_auth_headers(self.user_2)
+
+    def list_images(self, headers, **extra):
+        return self.client.get(path=reverse("images_api:my_image"), **headers, **extra)
+
+    def search_images(self, headers, name="cached", **extra):
+        return self.client.get(path=reverse("images_api:search_image"), data={"name": name}, **headers, **extra)
+
+    def list_names(self, headers):
+        return [image["name"] for image in self.list_images(headers).json()["results"]]
+
+    def test_cached_list_does_not_query_images(self):
+        first = self.list_images(self.user_1_headers)
+
+        # The token was cached by the first request too.
+        with self.assertNumQueries(0):
+            second = self.list_images(self.user_1_headers)
+
+        self.assertEqual(second.status_code, status.HTTP_200_OK)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second["ETag"], first["ETag"])
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.list_images(self.user_1_headers)["ETag"]
+
+        response = self.list_images(self.user_1_headers, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+
+    def test_responses_are_cached_per_user_and_query(self):
+        user_1_etag = self.list_images(self.user_1_headers)["ETag"]
+
+        self.assertNotEqual(self.list_images(self.user_2_headers)["ETag"], user_1_etag)
+        self.assertEqual(self.list_names(self.user_2_headers), [])
+        response = self.client.get(
+            path=reverse("images_api:my_image"), data={"fields": "name"}, **self.user_1_headers
+        )
+        self.assertEqual(response.json()["results"], [{"name": self.image.name}])
+
+    def test_adding_an_image_invalidates_the_list(self):
+        etag = self.list_images(self.user_1_headers)["ETag"]
+
+        new_image = UserImageFactory.create(owner=self.user_1, image=TestUtils.create_unique_image_file("new.png"))
+
+        self.assertEqual(
+            self.list_images(self.user_1_headers, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK
+        )
+        self.assertEqual(self.list_names(self.user_1_headers), [new_image.name, self.image.name])
+
+    def test_deleting_an_image_invalidates_the_list(self):
+        self.list_images(self.user_1_headers)
+
+        self.image.delete()
+
+        self.assertEqual(self.list_names(self.user_1_headers), [])
+
+    def test_sharing_an_image_invalidates_both_lists(self):
+        self.list_images(self.user_1_headers)
+        self.list_images(self.user_2_headers)
+
+        response = self.client.post(
+            path=reverse("images_api:share_image"),
+            data={"target_user": "user2", "image_name": self.image.name},
+            **self.user_1_headers,
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.assertEqual(self.list_names(self.user_2_headers), [self.image.name])
+        self.assertEqual(self.list_images(self.user_1_headers).json()["results"][0]["times_shared"], 1)
+
+    def test_other_users_public_images_invalidate_search(self):
+        self.assertEqual(len(self.search_images(self.user_2_headers).json()["results"]), 1)
+
+        other_image = UserImageFactory.create(
+            owner=self.user_1, image=TestUtils.create_unique_image_file("cached_too.png")
+        )
+        self.assertEqual(len(self.search_images(self.user_2_headers).json()["results"]), 2)
+
+        other_image.delete()
+        self.assertEqual(len(self.search_images(self.user_2_headers).json()["results"]), 1)
+
+    def test_errors_are_not_cached(self):
+        response = self.client.get(path=reverse("images_api:search_image"), **self.user_1_headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(response.has_header("ETag"))
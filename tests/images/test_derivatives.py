@@ -0,0 +1,137 @@
+import threading
+import uuid
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.urls import reverse
+from images.derivatives import _generated, generate_derivatives
+from images.models import ImageBlob, ImageDerivative, UserImage
+from images.url_signing import signed_url
+from PIL import Image
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from rest_framework.test import APITestCase
+from tests.testutils import TestUtils
+
+DERIVATIVES = {
+    "thumbnail": {"format": "WEBP", "size": (4, 4)},
+    "webp": {"format": "WEBP"},
+    "unsupported": {"format": "NOT-A-FORMAT"},
+}
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+@override_settings(IMAGES_DERIVATIVES=DERIVATIVES, IMAGES_DERIVATIVES_ASYNC=False)
+class DerivativeTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+
+    def test_derivatives_are_generated_for_new_images(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user_image = UserImageFactory.create(
+                owner=self.user, image=TestUtils.create_unique_image_file("new.png", size=(16, 8))
+            )
+
+        derivatives = {derivative.kind: derivative for derivative in user_image.blob.derivatives.all()}
+        # Formats Pillow cannot write are skipped.
+        self.assertEqual(set(derivatives), {"thumbnail", "webp"})
+        self.assertEqual((derivatives["thumbnail"].width, derivatives["thumbnail"].height), (4, 2))
+        self.assertEqual((derivatives["webp"].width, derivatives["webp"].height), (16, 8))
+        with derivatives["thumbnail"].file.open("rb") as file, Image.open(file) as thumbnail:
+            self.assertEqual(thumbnail.format, "WEBP")
+
+    def test_derivative_urls_are_listed(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user_image = UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("url.png"))
+
+        response = self.client.get(
+            path=reverse("images_api:my_image"),
+            data={"fields": "name,derivatives"},
+            **TestUtils.generate_user_auth_headers(self.user),
+        )
+
+        self.assertEqual(
+            response.json()["results"][0]["derivatives"],
+            {
+                "thumbnail": signed_url("derivatives/{}/thumbnail.webp".format(user_image.blob.digest)),
+                "webp": signed_url("derivatives/{}/webp.webp".format(user_image.blob.digest)),
+            },
+        )
+
+    def test_derivatives_are_generated_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user_image = UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("once.png"))
+
+        self.assertEqual(generate_derivatives(user_image.blob_id), [])
+        self.assertEqual(ImageDerivative.objects.count(), 2)
+
+    def test_derivatives_are_deleted_with_their_blob(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            user_image = UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("gone.png"))
+        names = [derivative.file.name for derivative in user_image.blob.derivatives.all()]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            user_image.delete()
+
+        self.assertFalse(ImageDerivative.objects.exists())
+        for name in names:
+            self.assertFalse(default_storage.exists(name))
+
+    def test_generate_derivatives_command_backfills_existing_images(self):
+        # An image stored before blobs existed.
+        name = default_storage.save("legacy.png", TestUtils.create_unique_image_file("legacy.png"))
+        UserImage.objects.bulk_create([UserImage(owner=self.user, image=name, size=default_storage.size(name))])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("generate_derivatives", workers=0, stdout=StringIO())
+
+        user_image = UserImage.objects.get()
+        self.assertIsNotNone(user_image.blob)
+        self.assertEqual(user_image.blob.ref_count, 1)
+        # Moved to a name derived from its contents, like uploads.
+        self.assertEqual(user_image.image.name, user_image.blob.file.name)
+        self.assertTrue(user_image.image.name.startswith("blobs/{}".format(user_image.blob.digest)))
+        self.assertFalse(default_storage.exists(name))
+        self.assertEqual(ImageBlob.objects.get().derivatives.count(), 2)
+
+    @override_settings(IMAGES_DERIVATIVES_ASYNC=True)
+    def test_failures_in_the_background_are_logged_and_retried(self):
+        future = Future()
+        executor = mock.Mock(**{"submit.return_value": future})
+        with mock.patch("images.derivatives.get_executor", return_value=executor):
+            with self.captureOnCommitCallbacks(execute=True):
+                user_image = UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("f.png"))
+
+        with self.assertLogs("images.derivatives", "ERROR") as logs:
+            future.set_exception(BrokenProcessPool("A worker process died."))
+
+        self.assertIn(str(user_image.blob_id), logs.output[0])
+        blob = ImageBlob.objects.get()
+        self.assertIsNotNone(blob.derivatives_failed_at)
+        self.assertFalse(blob.derivatives.exists())
+
+        call_command("generate_derivatives", "--failed", workers=0, stdout=StringIO())
+
+        blob.refresh_from_db()
+        self.assertIsNone(blob.derivatives_failed_at)
+        self.assertEqual(blob.derivatives.count(), 2)
+
+    def test_failures_close_the_connection_of_the_pools_thread(self):
+        future = Future()
+        future.set_exception(BrokenProcessPool("A worker process died."))
+
+        blob_id = str(uuid.uuid4())
+
+        with mock.patch("images.derivatives.connection") as connection, self.assertLogs("images.derivatives", "ERROR"):
+            _generated(blob_id, threading.get_ident(), future)
+            connection.close.assert_not_called()
+            # As called by the pool's thread.
+            _generated(blob_id, threading.get_ident() + 1, future)
+            connection.close.assert_called_once()
@@ -0,0 +1,238 @@
+import hashlib
+from tempfile import TemporaryDirectory
+from urllib.parse import parse_qs, urlparse
+
+from botocore.stub import Stubber
+from django.core.files.storage import default_storage
+from django.test.utils import override_settings
+from django.urls import reverse
+from images.direct_uploads import DirectUploads, DirectUploadTicket, S3DirectUploads
+from images.models import ImageBlob, UserImage
+from rest_framework import status
+from rest_framework.test import APITestCase
+from storages.backends.s3boto3 import S3Boto3Storage
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+def describe(file, name=None):
+    """What the client declares about a file it is about to upload."""
+    file.seek(0)
+    contents = file.read()
+    file.seek(0)
+    return {
+        "name": name or file.name,
+        "size": len(contents),
+        "content_type": "image/png",
+        "sha256": hashlib.sha256(contents).hexdigest(),
+    }
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class DirectUploadViewTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.headers = TestUtils.generate_user_auth_headers(self.user)
+
+    def presign(self, files, **headers):
+        return self.client.post(
+            path=reverse("images_api:direct_upload"),
+            data={"files": files},
+            format="json",
+            **(headers or self.headers),
+        )
+
+    def upload(self, result, contents):
+        return self.client.generic(
+            result["upload"]["method"],
+            result["upload"]["url"],
+            contents,
+            content_type=result["upload"]["headers"]["Content-Type"],
+        )
+
+    def confirm(self, upload_ids, **data):
+        return self.client.post(
+            path=reverse("images_api:confirm_direct_upload"),
+            data={"upload_ids": upload_ids, **data},
+            format="json",
+            **self.headers,
+        )
+
+    def test_upload_and_confirm(self):
+        file = TestUtils.create_unique_image_file("direct.png")
+        contents = file.read()
+
+        response = self.presign([describe(file)])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        result = response.json()[0]
+        self.assertEqual(result["status"], status.HTTP_200_OK)
+        self.assertTrue(result["upload"]["url"].startswith("http://testserver/"))
+        # Nothing is stored until the client uploads the file.
+        self.assertEqual(UserImage.objects.count(), 0)
+
+        self.assertEqual(self.upload(result, contents).status_code, status.HTTP_200_OK)
+        response = self.confirm([result["upload_id"]], private=True)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED, msg=response.content)
+        self.assertEqual(response.json()[0]["name"], "direct.png")
+        image = UserImage.objects.get(owner=self.user)
+        self.assertTrue(image.private)
+        self.assertEqual(image.blob.digest, hashlib.sha256(contents).hexdigest())
+        # Moved out of direct/, where unconfirmed uploads expire.
+        self.assertTrue(image.blob.file.name.startswith("blobs/{}".format(image.blob.digest)))
+        self.assertEqual(image.blob.file.read(), contents)
+        self.assertFalse(default_storage.exists(DirectUploadTicket.load(result["upload_id"], self.user).key))
+
+    def test_confirm_without_uploading(self):
+        result = self.presign([describe(TestUtils.create_unique_image_file("lazy.png"))]).json()[0]
+
+        response = self.confirm([result["upload_id"]])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[0]["errors"], {"image": ["The file was not uploaded."]})
+        self.assertEqual(UserImage.objects.count(), 0)
+
+    def test_upload_not_matching_declared_digest(self):
+        declared = TestUtils.create_unique_image_file("declared.png")
+        result = self.presign([describe(declared)]).json()[0]
+
+        response = self.upload(result, TestUtils.create_unique_image_file("other.png").read())
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.confirm([result["upload_id"]]).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_with_other_content_type(self):
+        file = TestUtils.create_unique_image_file("typed.png")
+        result = self.presign([describe(file)]).json()[0]
+        result["upload"]["headers"]["Content-Type"] = "image/gif"
+
+        self.assertEqual(self.upload(result, file.read()).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_upload_link(self):
+        response = self.client.put(
+            reverse("images_api:direct_upload_emulation", args=["forged"]), b"data", content_type="image/png"
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_confirm_upload_of_another_user(self):
+        other = UserFactory.create(username="other")
+        file = TestUtils.create_unique_image_file("theirs.png")
+        result = self.presign([describe(file)], **TestUtils.generate_user_auth_headers(other)).json()[0]
+        self.upload(result, file.read())
+
+        response = self.confirm([result["upload_id"], "forged"])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            {
+                "upload_ids": {
+                    "0": ["This upload is invalid or has expired."],
+                    "1": ["This upload is invalid or has expired."],
+                }
+            },
+        )
+
+    def test_presign_validates_files(self):
+        file = describe(TestUtils.create_unique_image_file("image.png"), name="document.pdf")
+
+        response = self.presign([file, dict(file, name="image.png", sha256="not a digest", size=0)])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        errors = response.json()["files"]
+        self.assertIn("non_field_errors", errors[0])
+        self.assertEqual(set(errors[1]), {"sha256", "size"})
+
+    @override_settings(IMAGES_DIRECT_UPLOAD_BATCH_MAX=1)
+    def test_presign_too_many_files(self):
+        files = [describe(TestUtils.create_unique_image_file("many{}.png".format(i))) for i in range(2)]
+
+        response = self.presign(files)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_presign_images_already_owned(self):
+        owned = TestUtils.create_unique_image_file("owned.png")
+        declared = describe(owned)
+        UserImageFactory.create(owner=self.user, image=owned)
+        new = describe(TestUtils.create_unique_image_file("new.png"))
+
+        response = self.presign([declared, new, dict(new, name="again.png")])
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result["status"] for result in response.json()],
+            [status.HTTP_409_CONFLICT, status.HTTP_200_OK, status.HTTP_409_CONFLICT],
+        )
+
+    def test_confirm_contents_already_stored(self):
+        """An upload of contents stored for another user shares their blob, and the uploaded copy is removed."""
+        file = TestUtils.create_unique_image_file("shared.png")
+        contents, declared = file.read(), describe(file, name="mine.png")
+        existing = UserImageFactory.create(owner=UserFactory.create(username="first"), image=file)
+
+        result = self.presign([declared]).json()[0]
+        self.upload(result, contents)
+        key = DirectUploadTicket.load(result["upload_id"], self.user).key
+        self.assertTrue(default_storage.exists(key))
+
+        response = self.confirm([result["upload_id"]])
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(UserImage.objects.get(owner=self.user).blob, existing.blob)
+        self.assertEqual(ImageBlob.objects.count(), 1)
+        self.assertFalse(default_storage.exists(key))
+
+    @override_settings(DEFAULT_FILE_STORAGE="tests.benchmarks.storage.InMemoryStorage")
+    def test_storage_without_direct_uploads(self):
+        response = self.presign([describe(TestUtils.create_unique_image_file("memory.png"))])
+
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+
+# The base64 SHA-256 checksum S3 works with, for a hex digest of "ab" * 32.
+CHECKSUM = "q6urq6urq6urq6urq6urq6urq6urq6urq6urq6urq6s="
+
+
+@override_settings(AWS_ACCESS_KEY_ID="key", AWS_SECRET_ACCESS_KEY="secret", AWS_STORAGE_BUCKET_NAME="bucket")
+class S3DirectUploadsTests(APITestCase):
+    def setUp(self):
+        self.uploads = DirectUploads.for_storage(S3Boto3Storage(location="media"))
+        self.stubber = Stubber(self.uploads.client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        self.ticket = DirectUploadTicket.issue(UserFactory.create(), "s3.png", 1049, "image/png", "ab" * 32)
+
+    def test_for_storage(self):
+        self.assertIsInstance(self.uploads, S3DirectUploads)
+
+    def test_presign(self):
+        upload = self.uploads.presign(self.ticket)
+
+        url = urlparse(upload["url"])
+        self.assertEqual(url.path, "/media/" + self.ticket.key)
+        signed_headers = parse_qs(url.query)["X-Amz-SignedHeaders"][0].split(";")
+        # S3 rejects uploads which do not match the declared type, size and digest.
+        self.assertIn("content-type", signed_headers)
+        self.assertIn("content-length", signed_headers)
+        self.assertIn("x-amz-checksum-sha256", signed_headers)
+        self.assertEqual(upload["headers"]["x-amz-checksum-sha256"], CHECKSUM)
+
+    def test_head(self):
+        self.stubber.add_response(
+            "head_object",
+            {"ContentLength": 1049, "ContentType": "image/png", "ChecksumSHA256": CHECKSUM},
+            {"Bucket": "bucket", "Key": "media/" + self.ticket.key, "ChecksumMode": "ENABLED"},
+        )
+
+        stored = self.uploads.head(self.ticket.key)
+
+        self.assertEqual((stored.size, stored.sha256, stored.content_type), (1049, "ab" * 32, "image/png"))
+
+    def test_head_not_uploaded(self):
+        self.stubber.add_client_error("head_object", service_error_code="404", http_status_code=404)
+
+        self.assertIsNone(self.uploads.head(self.ticket.key))
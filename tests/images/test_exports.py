@@ -0,0 +1,106 @@
+import io
+import json
+import zipfile
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.files.storage import default_storage
+from django.test.utils import override_settings
+from django.urls import reverse
+from images.exports import ImageExport
+from images.url_signing import signed_url
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ExportImagesViewTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.images = [
+            UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("image{}.png".format(i)))
+            for i in range(3)
+        ]
+        self.images[1].private = True
+        self.images[1].save()
+        # Someone else's images are not exported.
+        UserImageFactory.create(owner=UserFactory.create(username="other"))
+
+    def export(self):
+        return self.client.get(
+            path=reverse("images_api:export_images"), **TestUtils.generate_user_auth_headers(self.user)
+        )
+
+    def test_export(self):
+        response = self.export()
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/zip")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="images-shols.zip"')
+
+        archive = zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content)))
+        self.assertIsNone(archive.testzip())
+        # Named as the user named them, rather than as their files are stored.
+        paths = ["images/image{}.png".format(i) for i in range(3)]
+        self.assertEqual(archive.namelist(), ["manifest.json"] + paths)
+        for image, path in zip(self.images, paths):
+            with default_storage.open(image.image.name) as file:
+                self.assertEqual(archive.read(path), file.read())
+
+        manifest = json.loads(archive.read("manifest.json"))
+        self.assertEqual([item["file"] for item in manifest], paths)
+        self.assertEqual([item["name"] for item in manifest], ["image0.png", "image1.png", "image2.png"])
+        self.assertEqual([item["private"] for item in manifest], [False, True, False])
+        self.assertEqual(manifest[1]["image"], "http://testserver" + signed_url(self.images[1].image.name))
+        self.assertEqual(manifest[0]["owner"], "shols")
+
+    def test_files_missing_from_storage_are_skipped(self):
+        default_storage.delete(self.images[0].image.name)
+
+        with self.assertLogs("images.exports", "WARNING"):
+            archive = zipfile.ZipFile(io.BytesIO(b"".join(self.export().streaming_content)))
+
+        self.assertEqual(len(archive.namelist()), 3)
+        self.assertEqual(len(json.loads(archive.read("manifest.json"))), 3)
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ImageExportTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        for i in range(5):
+            UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("image{}.png".format(i)))
+
+    def test_pages(self):
+        with mock.patch.object(ImageExport, "page_size", 2):
+            pages = list(ImageExport(self.user).pages())
+
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual(len({image.pk for page in pages for image in page}), 5)
+
+    def test_files_are_fetched_at_most_the_prefetch_window_ahead(self):
+        export = ImageExport(self.user, prefetch=2)
+        fetched = []
+
+        def fetch(image):
+            fetched.append(image)
+            return b"contents"
+
+        with mock.patch.object(export, "fetch", side_effect=fetch):
+            chunks = iter(export)
+            # The manifest, written from the database alone.
+            next(chunks)
+            self.assertEqual(fetched, [])
+
+            # The first file, written once the second was requested.
+            next(chunks)
+            self.assertEqual(len(fetched), 2)
+
+            chunks.close()
+        self.assertLessEqual(len(fetched), 3)
@@ -0,0 +1,66 @@
+import io
+
+from django.test import SimpleTestCase
+from images.headers import ImageHeaderParser, ImageInfo, read_image_info
+from PIL import Image
+
+
+def encode_image(format, size=(40, 30), mode="RGB", **options) -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+class ImageHeaderParserTests(SimpleTestCase):
+    def assertInfo(self, data, expected):
+        self.assertEqual(read_image_info(io.BytesIO(data)), expected)
+
+        # Fed a byte at a time, as a streamed upload could be.
+        parser = ImageHeaderParser()
+        for position in range(len(data)):
+            parser.feed(data[position : position + 1])
+        self.assertEqual(parser.close(), expected)
+
+    def test_png(self):
+        self.assertInfo(encode_image("PNG"), ImageInfo("image/png", 40, 30))
+
+    def test_gif(self):
+        self.assertInfo(encode_image("GIF", mode="P"), ImageInfo("image/gif", 40, 30))
+
+    def test_gif_shorter_than_the_longest_header(self):
+        # A whole 1x1 GIF: header, logical screen, image descriptor, image data and trailer.
+        data = b"GIF89a\x01\x00\x01\x00\x00\x00\x00,\x00\x00\x00\x00\x01\x00\x01\x00\x00\x02\x01\x00\x00;"
+
+        self.assertLess(len(data), 30)
+        self.assertInfo(data, ImageInfo("image/gif", 1, 1))
+
+    def test_jpeg(self):
+        self.assertInfo(encode_image("JPEG"), ImageInfo("image/jpeg", 40, 30))
+
+    def test_jpeg_with_large_segments_before_the_frame_header(self):
+        exif = Image.Exif()
+        exif[0x010E] = "x" * 60000
+        data = encode_image("JPEG", size=(300, 200), exif=exif.tobytes(), icc_profile=b"\0" * 20000)
+
+        self.assertInfo(data, ImageInfo("image/jpeg", 300, 200))
+
+    def test_webp(self):
+        self.assertInfo(encode_image("WEBP"), ImageInfo("image/webp", 40, 30))
+        self.assertInfo(encode_image("WEBP", lossless=True), ImageInfo("image/webp", 40, 30))
+        self.assertInfo(encode_image("WEBP", mode="RGBA"), ImageInfo("image/webp", 40, 30))
+
+    def test_not_an_image(self):
+        self.assertInfo(b"definitely not an image, just some text", None)
+        self.assertInfo(b"", None)
+
+    def test_truncated_image(self):
+        self.assertInfo(encode_image("JPEG")[:10], None)
+        self.assertInfo(encode_image("PNG")[:20], None)
+        self.assertInfo(encode_image("WEBP")[:20], None)
+
+    def test_file_position_is_restored(self):
+        file = io.BytesIO(encode_image("PNG"))
+        file.seek(5)
+        read_image_info(file)
+
+        self.assertEqual(file.tell(), 5)
@@ -0,0 +1,106 @@
+import hashlib
+from io import StringIO
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.urls import reverse
+from images.models import UserImage
+from images.shares import BulkImageShare
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+METADATA = ("width", "height", "content_type", "digest")
+
+
+def contents_digest(name):
+    with default_storage.open(name, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def no_storage_calls():
+    """Record the storage calls which would each be a request to S3."""
+    return mock.patch.multiple(
+        FileSystemStorage, size=mock.DEFAULT, exists=mock.DEFAULT, open=mock.DEFAULT, url=mock.DEFAULT
+    )
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ImageMetadataTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.other = UserFactory.create(username="other")
+
+    def metadata(self, image):
+        image.refresh_from_db()
+        return tuple(getattr(image, field) for field in METADATA)
+
+    def test_uploads_are_described(self):
+        response = self.client.post(
+            path=reverse("images_api:add_image"),
+            data={"image": TestUtils.create_unique_image_file("wide.png", size=(12, 5))},
+            **TestUtils.generate_user_auth_headers(self.user),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()[0]["width"], 12)
+        image = UserImage.objects.get()
+        self.assertEqual(self.metadata(image), (12, 5, "image/png", contents_digest(image.image.name)))
+
+    def test_saved_images_are_described(self):
+        image = UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("a.png", (3, 4)))
+
+        self.assertEqual(self.metadata(image), (3, 4, "image/png", contents_digest(image.image.name)))
+
+    def test_shares_copy_the_description_without_storage_calls(self):
+        image = UserImageFactory.create(owner=self.user)
+        # An image stored before blobs existed, whose size was only known to storage.
+        name = default_storage.save("legacy.png", TestUtils.create_temp_file("legacy.png"))
+        legacy = UserImage(owner=self.user, image=name, name="legacy.png", size=1049, width=17, height=14)
+        UserImage.objects.bulk_create([legacy])
+        third = UserFactory.create(username="third")
+
+        with no_storage_calls() as calls:
+            UserImage.objects.share(legacy, self.other.pk)
+            BulkImageShare(owner=self.user, image_names=["legacy.png"], target_users=["third"]).run()
+            BulkImageShare(owner=self.user, image_names=[image.name], target_users=["other"]).run()
+
+        for call in calls.values():
+            call.assert_not_called()
+        copies = UserImage.objects.filter(owner__in=[self.other, third])
+        self.assertEqual(
+            sorted((copy.owner_id, copy.name, copy.size, copy.width, copy.height) for copy in copies),
+            [
+                (self.other.pk, "file.png", 1049, 17, 14),
+                (self.other.pk, "legacy.png", 1049, 17, 14),
+                (third.pk, "legacy.png", 1049, 17, 14),
+            ],
+        )
+
+    def test_backfill(self):
+        image = UserImageFactory.create(owner=self.user, image=TestUtils.create_unique_image_file("a.png", (3, 4)))
+        UserImage.objects.share(image, self.other.pk)
+        legacy_file = TestUtils.create_unique_image_file("legacy.png", (6, 2))
+        legacy_name = default_storage.save("legacy.png", legacy_file)
+        legacy = UserImage(owner=self.user, image=legacy_name, name="legacy.png", size=legacy_file.size)
+        UserImage.objects.bulk_create([legacy])
+        missing = UserImage(owner=self.other, image="missing.png", name="missing.png", size=1)
+        UserImage.objects.bulk_create([missing])
+        UserImage.objects.update(width=None, height=None, content_type="")
+        out, err = StringIO(), StringIO()
+
+        call_command("backfill_image_metadata", batch_size=2, workers=2, stdout=out, stderr=err)
+
+        self.assertIn("Described 2 files, 1 could not be read.", out.getvalue())
+        self.assertIn("Could not read missing.png", err.getvalue())
+        digest = contents_digest(image.image.name)
+        for copy in UserImage.objects.filter(image=image.image.name):
+            self.assertEqual(self.metadata(copy), (3, 4, "image/png", digest))
+        self.assertEqual(self.metadata(legacy), (6, 2, "image/png", contents_digest(legacy_name)))
+        self.assertEqual(self.metadata(missing), (None, None, "", ""))
@@ -1,9 +1,10 @@
 from tempfile import TemporaryDirectory
 
 import factory
+from django.db import IntegrityError
 from django.test import TestCase
 from django.test.utils import override_settings
-from images.models import UserImage
+from images.models import ImageBlob, ImageTrigram, UserImage
 from tests.account.test_models import UserFactory
 from tests.testutils import TestUtils
 
@@ -30,3 +31,77 @@ class UserImageModelTests(TestCase):
 
     def test__str__(self):
         self.assertEqual(str(self.user_image), "ImageName: file.png - Owner: shols")
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class UserImageSearchTests(TestCase):
+    def setUp(self):
+        self.user_image = UserImageFactory.create(image=TestUtils.create_temp_file("Summer_Holiday.PNG"))
+
+    def test_search_name_is_normalized(self):
+        # The storage may add a suffix to the name, e.g. Summer_Holiday_x1Y2z3.PNG
+        self.assertRegex(self.user_image.search_name, r"^summer holiday( \w+)? png$")
+        self.assertTrue(ImageTrigram.objects.filter(image=self.user_image, trigram="hol").exists())
+
+    def test_search_matches_anywhere_in_the_name(self):
+        for query in ["holiday", "MER_HOL", "Summer Holiday"]:
+            self.assertEqual(list(UserImage.objects.search(query)), [self.user_image], msg=query)
+
+    def test_short_search_matches_the_start_of_the_name(self):
+        self.assertEqual(list(UserImage.objects.search("su")), [self.user_image])
+        self.assertEqual(list(UserImage.objects.search("ho")), [])
+
+    def test_search_requires_trigrams_in_order(self):
+        # Every trigram of "holsum" is not in the name, and "day summer" has them all but out of order.
+        self.assertEqual(list(UserImage.objects.search("holsum")), [])
+        self.assertEqual(list(UserImage.objects.search("day summer")), [])
+
+    def test_deleting_an_image_removes_it_from_the_index(self):
+        self.user_image.delete()
+        self.assertFalse(ImageTrigram.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ImageBlobTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.other_user = UserFactory.create(username="other")
+        self.user_image = UserImageFactory.create(owner=self.user, image=TestUtils.create_temp_file("blob.png"))
+
+    def test_identical_uploads_share_one_blob(self):
+        duplicate = UserImageFactory.create(owner=self.other_user, image=TestUtils.create_temp_file("copy.png"))
+
+        self.assertEqual(ImageBlob.objects.count(), 1)
+        self.assertEqual(duplicate.blob, self.user_image.blob)
+        self.assertEqual(duplicate.image.name, self.user_image.image.name)
+        # The duplicate keeps the name it was uploaded with.
+        self.assertEqual(duplicate.name, "copy.png")
+        self.assertEqual(duplicate.size, 1049)
+
+        self.user_image.blob.refresh_from_db()
+        self.assertEqual(self.user_image.blob.ref_count, 2)
+
+    def test_owner_cannot_hold_the_same_image_twice(self):
+        with self.assertRaises(IntegrityError):
+            UserImageFactory.create(owner=self.user, image=TestUtils.create_temp_file("copy.png"))
+
+        self.user_image.blob.refresh_from_db()
+        self.assertEqual(self.user_image.blob.ref_count, 1)
+
+    def test_blob_is_deleted_with_its_last_reference(self):
+        blob = self.user_image.blob
+        storage = blob.file.storage
+        duplicate = UserImageFactory.create(owner=self.other_user, image=TestUtils.create_temp_file("copy.png"))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user_image.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 1)
+        self.assertTrue(storage.exists(blob.file.name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            duplicate.delete()
+        self.assertFalse(ImageBlob.objects.exists())
+        self.assertFalse(storage.exists(blob.file.name))
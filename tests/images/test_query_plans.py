@@ -0,0 +1,96 @@
+from tempfile import TemporaryDirectory
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class QueryPlanTests(APITestCase):
+    """Ensure the queries of every images endpoint are answered from indexes rather than by scanning tables."""
+
+    def setUp(self):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest("Query plans are only checked on SQLite and PostgreSQL.")
+        self.user_1 = UserFactory.create()
+        self.user_2 = UserFactory.create(username="user2")
+        self.images = [
+            UserImageFactory.create(owner=self.user_1, image=TestUtils.create_unique_image_file(f"plan{i}.png"))
+            for i in range(3)
+        ]
+        UserImageFactory.create(owner=self.user_2, image=TestUtils.create_unique_image_file("other_plan.png"))
+        self.headers = TestUtils.generate_user_auth_headers(self.user_1)
+
+    def explain(self, sql: str) -> str:
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                return "\n".join(row[3] for row in cursor.fetchall())
+            # Tables this small would be scanned whatever the indexes, unless scans are ruled out.
+            cursor.execute("SET LOCAL enable_seqscan = off")
+            cursor.execute("EXPLAIN " + sql)
+            return "\n".join(row[0] for row in cursor.fetchall())
+
+    def assertQueriesUseIndexes(self, queries):
+        selects = [query["sql"] for query in queries if query["sql"].startswith("SELECT") and "images_" in query["sql"]]
+        self.assertTrue(selects)
+        for sql in selects:
+            plan = self.explain(sql)
+            if connection.vendor == "sqlite":
+                full_scans = [line for line in plan.splitlines() if line.startswith("SCAN")]
+            else:
+                full_scans = [line for line in plan.splitlines() if "Seq Scan" in line]
+            self.assertEqual(full_scans, [], msg="{}\n{}".format(sql, plan))
+
+    def request(self, method, name, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(
+                path=reverse(name), data=data, format="json" if method == "post" else None, **self.headers
+            )
+        self.assertLess(response.status_code, status.HTTP_400_BAD_REQUEST, msg=response.content)
+        return queries
+
+    def test_list_images(self):
+        self.assertQueriesUseIndexes(self.request("get", "images_api:my_image", {"page_size": 2}))
+
+    def test_list_images_does_not_sort(self):
+        """The owner's images are read from the index in the order they are listed."""
+        queries = self.request("get", "images_api:my_image", {"fields": "name"})
+        if connection.vendor != "sqlite":
+            self.skipTest("Sorting is only checked on SQLite.")
+
+        listing = next(query["sql"] for query in queries if query["sql"].startswith('SELECT "images_userimage"'))
+        self.assertNotIn("TEMP B-TREE FOR ORDER BY", self.explain(listing))
+
+    def test_search_images(self):
+        self.assertQueriesUseIndexes(self.request("get", "images_api:search_image", {"name": "plan"}))
+
+    def test_share_image(self):
+        queries = self.request(
+            "post", "images_api:share_image", {"target_user": "user2", "image_name": self.images[0].name}
+        )
+        self.assertQueriesUseIndexes(queries)
+
+    def test_share_images_in_a_batch(self):
+        queries = self.request(
+            "post",
+            "images_api:share_images",
+            {"target_users": ["user2"], "image_names": [image.name for image in self.images]},
+        )
+        self.assertQueriesUseIndexes(queries)
+
+    def test_add_images(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                path=reverse("images_api:add_image"),
+                data={"image": [TestUtils.create_unique_image_file("new_plan.png"), TestUtils.create_temp_file("a.png")]},
+                **self.headers,
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertQueriesUseIndexes(queries)
@@ -0,0 +1,139 @@
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from images.models import ImageUsage, UserImage
+from rest_framework import status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_direct_uploads import describe
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+def usage(user):
+    return ImageUsage.objects.filter(owner=user).values_list("bytes", "images").first()
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ImageUsageTests(TestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.other = UserFactory.create(username="other")
+
+    def test_usage_follows_added_shared_and_deleted_images(self):
+        image = UserImageFactory.create(owner=self.user)
+        self.assertEqual(usage(self.user), (1049, 1))
+        self.assertIsNone(usage(self.other))
+
+        copy = UserImage.objects.share(image, self.other.pk)
+        self.assertEqual(usage(self.other), (1049, 1))
+
+        copy.delete()
+        self.assertEqual(usage(self.other), (0, 0))
+        self.assertEqual(usage(self.user), (1049, 1))
+
+    def test_bulk_created_images_are_counted_in_one_query(self):
+        images = [
+            UserImage(owner=owner, image="{}.png".format(owner.pk), name="{}.png".format(owner.pk), size=10)
+            for owner in [self.user, self.user, self.other]
+        ]
+        ImageUsage.objects.create(owner=self.other, bytes=5, images=1)
+
+        with self.assertNumQueries(1):
+            ImageUsage.objects.add(images)
+
+        self.assertEqual(usage(self.user), (20, 2))
+        self.assertEqual(usage(self.other), (15, 2))
+
+    def test_deleting_the_owner_deletes_the_usage(self):
+        UserImageFactory.create(owner=self.user)
+
+        self.user.delete()
+
+        self.assertFalse(ImageUsage.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+@override_settings(IMAGES_STORAGE_QUOTA=3000)
+class StorageQuotaTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.headers = TestUtils.generate_user_auth_headers(self.user)
+
+    def add(self, *files):
+        return self.client.post(path=reverse("images_api:add_image"), data={"image": list(files)}, **self.headers)
+
+    def test_files_over_the_quota_are_rejected_when_confirmed(self):
+        """Uploads are checked again once confirmed, against the usage at that time."""
+        files = [TestUtils.create_unique_image_file("first.png"), TestUtils.create_temp_file("second.png")]
+        declared = [describe(file) for file in files]
+        results = self.client.post(
+            path=reverse("images_api:direct_upload"), data={"files": declared}, format="json", **self.headers
+        ).json()
+        for result, file in zip(results, files):
+            file.seek(0)
+            self.client.generic(
+                "PUT", result["upload"]["url"], file.read(), content_type=result["upload"]["headers"]["Content-Type"]
+            )
+        # Images added since the files were described leave room for the first file only.
+        ImageUsage.objects.create(owner=self.user, bytes=3000 - declared[0]["size"] - 1000, images=1)
+
+        response = self.client.post(
+            path=reverse("images_api:confirm_direct_upload"),
+            data={"upload_ids": [result["upload_id"] for result in results]},
+            format="json",
+            **self.headers,
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result["status"] for result in response.json()],
+            [status.HTTP_201_CREATED, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE],
+        )
+        self.assertEqual(
+            response.json()[1]["errors"], {"image": ["This image would take you over your storage quota."]}
+        )
+        self.assertEqual(usage(self.user), (3000 - 1000, 2))
+
+    def test_upload_over_the_quota_is_rejected_before_it_is_read(self):
+        ImageUsage.objects.create(owner=self.user, bytes=2500, images=1)
+
+        with mock.patch.object(MultiPartParser, "parse") as parse:
+            response = self.add(TestUtils.create_temp_file("test.png"))
+
+        self.assertEqual(response.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(response.json(), {"detail": "This upload would take you over your storage quota."})
+        parse.assert_not_called()
+        self.assertFalse(UserImage.objects.exists())
+
+    def test_direct_uploads_are_checked_against_their_declared_size(self):
+        ImageUsage.objects.create(owner=self.user, bytes=1000, images=1)
+        files = [
+            describe(TestUtils.create_temp_file("first.png")),
+            describe(TestUtils.create_unique_image_file("second.png", (64, 64))),
+        ]
+        files[1]["size"] = 1000
+
+        response = self.client.post(
+            path=reverse("images_api:direct_upload"), data={"files": files}, format="json", **self.headers
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result["status"] for result in response.json()],
+            [status.HTTP_200_OK, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE],
+        )
+
+    @override_settings(IMAGES_STORAGE_QUOTA=0)
+    def test_no_quota(self):
+        ImageUsage.objects.create(owner=self.user, bytes=10 ** 12, images=1)
+
+        response = self.add(TestUtils.create_temp_file("test.png"))
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
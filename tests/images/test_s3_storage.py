@@ -0,0 +1,200 @@
+import threading
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
+
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError
+from botocore.stub import Stubber
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from images.storage import PooledS3Storage, StorageWriter, copy_stored_file, storage_metrics
+from storages.backends.s3boto3 import S3Boto3Storage
+
+
+@override_settings(AWS_STORAGE_BUCKET_NAME="images", AWS_S3_REGION_NAME="eu-west-3", AWS_S3_ENDPOINT_URL=None)
+class PooledS3StorageTests(SimpleTestCase):
+    def storage(self, **kwargs):
+        return PooledS3Storage(access_key="key", secret_key="secret", **kwargs)
+
+    def stub(self, storage):
+        stubber = Stubber(storage.client)
+        stubber.activate()
+        self.addCleanup(stubber.deactivate)
+        return stubber
+
+    @override_settings(IMAGES_S3_MAX_POOL_CONNECTIONS=32, IMAGES_S3_RETRY_MODE="adaptive", IMAGES_S3_MAX_ATTEMPTS=7)
+    def test_client_configuration(self):
+        config = self.storage().client.meta.config
+
+        self.assertEqual(config.max_pool_connections, 32)
+        self.assertEqual(config.retries, {"mode": "adaptive", "total_max_attempts": 7})
+        self.assertEqual(config.s3, {"addressing_style": None})
+
+    def test_client_is_shared_by_threads_and_storages(self):
+        storage = self.storage()
+        clients = []
+
+        def connect():
+            clients.append(storage.connection.meta.client)
+
+        threads = [threading.Thread(target=connect) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(clients), 4)
+        self.assertTrue(all(client is storage.client for client in clients))
+        self.assertIs(self.storage().client, storage.client)
+        # Storages configured differently do not share their client.
+        self.assertIsNot(self.storage(max_attempts=2).client, storage.client)
+
+    def test_operations_are_timed(self):
+        storage = self.storage()
+        stubber = self.stub(storage)
+        stubber.add_response("head_object", {}, {"Bucket": "images", "Key": "cat.png"})
+        stubber.add_client_error("head_object", http_status_code=404)
+
+        self.assertTrue(storage.exists("cat.png"))
+        self.assertFalse(storage.exists("dog.png"))
+
+        self.assertEqual(storage_metrics.snapshot()["HeadObject"]["duration_ms"]["count"], 2)
+
+    def test_uploads_use_the_transfer_settings(self):
+        storage = self.storage(multipart_threshold=1024, multipart_chunksize=2048, max_concurrency=2)
+        # The name is free.
+        self.stub(storage).add_client_error("head_object", http_status_code=404)
+
+        with mock.patch.object(storage.bucket, "Object") as obj:
+            self.assertEqual(storage.save("cat.png", ContentFile(b"meow")), "cat.png")
+
+        obj.assert_called_once_with("cat.png")
+        upload = obj.return_value.upload_fileobj
+        config = upload.call_args.kwargs["Config"]
+        self.assertIsInstance(config, TransferConfig)
+        self.assertEqual((config.multipart_threshold, config.multipart_chunksize), (1024, 2048))
+        self.assertEqual(config.max_request_concurrency, 2)
+        self.assertEqual(upload.call_args.kwargs["ExtraArgs"], {"ContentType": "image/png", "ACL": "private"})
+
+    def test_small_streamed_writes_are_stored_in_one_request(self):
+        storage = self.storage(multipart_threshold=8)
+        stubber = self.stub(storage)
+        stubber.add_response(
+            "put_object",
+            {},
+            {"Bucket": "images", "Key": "cat.png", "Body": b"meow", "ContentType": "image/png", "ACL": "private"},
+        )
+
+        with storage.open("cat.png", "wb") as file:
+            file.write(b"me")
+            file.write(b"ow")
+
+        stubber.assert_no_pending_responses()
+
+    def test_streamed_writes_use_the_transfer_settings(self):
+        storage = self.storage(multipart_threshold=4, multipart_chunksize=6, max_concurrency=2)
+        stubber = self.stub(storage)
+        stubber.add_response(
+            "create_multipart_upload",
+            {"UploadId": "upload"},
+            {"Bucket": "images", "Key": "cat.png", "ContentType": "image/png", "ACL": "private"},
+        )
+        parts = [{"ETag": '"{}"'.format(number), "PartNumber": number} for number in (1, 2, 3)]
+        stubber.add_response(
+            "complete_multipart_upload",
+            {},
+            {"Bucket": "images", "Key": "cat.png", "UploadId": "upload", "MultipartUpload": {"Parts": parts}},
+        )
+        bodies = {}
+        threads = set()
+
+        def upload_part(PartNumber, Body, **kwargs):
+            bodies[PartNumber] = Body
+            threads.add(threading.current_thread())
+            return {"ETag": '"{}"'.format(PartNumber)}
+
+        with mock.patch.object(storage.client, "upload_part", side_effect=upload_part):
+            with storage.open("cat.png", "wb") as file:
+                for chunk in (b"mew", b"mew", b"mew", b"mew", b"mew"):
+                    file.write(chunk)
+
+        stubber.assert_no_pending_responses()
+        # The first part is sent once the file outgrows the threshold, the others once they fill up.
+        self.assertEqual(bodies, {1: b"mewmew", 2: b"mewmew", 3: b"mew"})
+        self.assertNotIn(threading.current_thread(), threads)
+
+    def test_aborted_streamed_writes_leave_nothing_behind(self):
+        storage = self.storage(multipart_threshold=4)
+        stubber = self.stub(storage)
+        stubber.add_client_error("head_object", http_status_code=404)
+        stubber.add_response("create_multipart_upload", {"UploadId": "upload"}, expected_params=None)
+        stubber.add_response(
+            "abort_multipart_upload", {}, {"Bucket": "images", "Key": "cat.png", "UploadId": "upload"}
+        )
+
+        with mock.patch.object(storage.client, "upload_part", return_value={"ETag": '"1"'}) as upload_part:
+            writer = StorageWriter(storage, "cat.png")
+            for _ in range(3):
+                writer.write(b"meow")
+            writer.abort()
+
+        stubber.assert_no_pending_responses()
+        upload_part.assert_called()
+
+    def test_files_are_copied_within_the_bucket(self):
+        storage = self.storage()
+        stubber = self.stub(storage)
+        # The name is free.
+        stubber.add_client_error("head_object", http_status_code=404)
+        stubber.add_response(
+            "copy_object",
+            {},
+            {
+                "Bucket": "images",
+                "Key": "blobs/abc.png",
+                "CopySource": {"Bucket": "images", "Key": "upload.png"},
+                "MetadataDirective": "REPLACE",
+                "ContentType": "image/png",
+                "ACL": "private",
+            },
+        )
+
+        self.assertEqual(copy_stored_file(storage, "upload.png", "blobs/abc.png"), "blobs/abc.png")
+        stubber.assert_no_pending_responses()
+
+    def test_failed_operations_are_timed(self):
+        storage = self.storage()
+        stubber = self.stub(storage)
+        stubber.add_client_error("delete_object", service_error_code="SlowDown", http_status_code=503)
+
+        with self.assertRaises(ClientError):
+            storage.delete("cat.png")
+
+        self.assertEqual(storage_metrics.snapshot()["DeleteObject"]["duration_ms"]["count"], 1)
+
+    def test_unsigned_urls_are_not_signed_first(self):
+        for location in ("", "media"):
+            storage = self.storage(location=location, querystring_auth=False)
+            # The bucket's URL is found out once.
+            storage.url("first.png")
+            for name in ("cat.png", "a b/c+d!(1).png", "ümlaut~.png"):
+                expected = S3Boto3Storage(
+                    access_key="key", secret_key="secret", location=location, querystring_auth=False
+                ).url(name)
+                with mock.patch.object(storage.client, "generate_presigned_url") as sign:
+                    self.assertEqual(storage.url(name), expected)
+                sign.assert_not_called()
+
+    def test_stored_files_are_private(self):
+        """A private image may share its stored file with public ones, so no storage URL is a plain public one."""
+        storage = self.storage()
+
+        url = urlsplit(storage.url("private.png"))
+
+        self.assertEqual(url.path, "/private.png")
+        query = parse_qs(url.query)
+        self.assertIn("X-Amz-Signature", query)
+        self.assertEqual(query["X-Amz-Expires"], [str(2 * settings.IMAGES_URL_SIGNING_WINDOW)])
+        self.assertEqual(storage._get_write_parameters("private.png")["ACL"], "private")
@@ -0,0 +1,91 @@
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+from django.urls import reverse
+from images.models import ImageUsage, UserImage
+from images.shares import BulkImageShare
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+EMPTY = {"images": 0, "public_images": 0, "private_images": 0, "bytes": 0, "times_shared": 0}
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ImageStatsTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.other = UserFactory.create(username="other")
+        self.public = UserImageFactory.create(owner=self.user)
+        self.private = UserImageFactory.create(
+            owner=self.user, image=TestUtils.create_unique_image_file("secret.png"), private=True
+        )
+
+    def stats(self, user, **params):
+        TestUtils.authenticate_in_advance(user)
+        return self.client.get(
+            path=reverse("images_api:image_stats"), data=params, **TestUtils.generate_user_auth_headers(user)
+        )
+
+    def test_stats_follow_the_images(self):
+        BulkImageShare(owner=self.user, image_names=[self.public.name], target_users=["other"]).run()
+        UserImage.objects.share(self.private, UserFactory.create(username="third").pk)
+
+        headers = TestUtils.generate_user_auth_headers(self.user)
+        TestUtils.authenticate_in_advance(self.user)
+        # The statistics are read by primary key, however many images the user has.
+        with self.assertNumQueries(1):
+            response = self.client.get(path=reverse("images_api:image_stats"), **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.json(),
+            {
+                "images": 2,
+                "public_images": 1,
+                "private_images": 1,
+                "bytes": self.public.size + self.private.size,
+                "times_shared": 2,
+            },
+        )
+        self.assertEqual(self.stats(self.other).json(), dict(EMPTY, images=1, public_images=1, bytes=1049))
+
+        self.private.delete()
+        self.assertEqual(
+            self.stats(self.user).json(), dict(EMPTY, images=1, public_images=1, bytes=1049, times_shared=1)
+        )
+
+    def test_user_without_images(self):
+        self.assertEqual(self.stats(UserFactory.create(username="new")).json(), EMPTY)
+
+    def test_stats_of_other_users_are_for_staff_only(self):
+        self.assertEqual(self.stats(self.other, username="shols").status_code, status.HTTP_403_FORBIDDEN)
+
+        self.other.is_staff = True
+        self.other.save()
+
+        self.assertEqual(self.stats(self.other, username="shols").json()["images"], 2)
+        self.assertEqual(self.stats(self.other, username="nobody").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_reconcile(self):
+        ImageUsage.objects.filter(owner=self.user).update(bytes=1, images=7, times_shared=3)
+        ImageUsage.objects.create(owner=self.other, images=2)
+        expected = {
+            "images": 2,
+            "public_images": 1,
+            "private_images": 1,
+            "bytes": self.public.size + self.private.size,
+            "times_shared": 0,
+        }
+        out = StringIO()
+
+        call_command("reconcile_image_usage", batch_size=1, stdout=out)
+
+        self.assertIn("Recounted the images of 2 users, 2 were corrected.", out.getvalue())
+        self.assertEqual(self.stats(self.user).json(), expected)
+        self.assertEqual(self.stats(self.other).json(), EMPTY)
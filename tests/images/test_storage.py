@@ -0,0 +1,138 @@
+import hashlib
+import os
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from botocore.stub import Stubber
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+from django.urls import reverse
+from images.direct_uploads import DirectUploads, FileSystemDirectUploads
+from images.storage import PooledS3Storage, ReadThroughCacheStorage
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+class ReadThroughCacheStorageTests(SimpleTestCase):
+    def setUp(self):
+        media, cache = TemporaryDirectory(), TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(cache.cleanup)
+        self.backend = FileSystemStorage(location=media.name, base_url="/media/")
+        self.storage = ReadThroughCacheStorage(backend=self.backend, location=cache.name, max_size=1000)
+
+    def read(self, name):
+        with self.storage.open(name) as file:
+            return file.read()
+
+    def cached(self):
+        return sorted(
+            entry for directory in os.scandir(self.storage.location) for entry in os.listdir(directory.path)
+        )
+
+    def save_blob(self, contents):
+        return self.storage.save("blobs/{}.png".format(hashlib.sha256(contents).hexdigest()), ContentFile(contents))
+
+    def test_reads_are_served_from_the_cache_once_read(self):
+        name = self.save_blob(b"meow")
+
+        with mock.patch.object(self.backend, "open", wraps=self.backend.open) as backend_open:
+            self.assertEqual(self.read(name), b"meow")
+            self.assertEqual(self.read(name), b"meow")
+            self.assertEqual(self.read(name), b"meow")
+
+        backend_open.assert_called_once()
+        self.assertEqual(self.storage.cache_stats(), {"hits": 2, "misses": 1, "size": 4, "max_size": 1000})
+        self.assertTrue(os.path.exists(self.storage.cache_path(name)))
+
+    def test_copies_of_a_blob_share_an_entry(self):
+        name = self.save_blob(b"meow")
+        copy = self.storage.save(name, ContentFile(b"meow"))
+        self.read(name)
+
+        self.assertNotEqual(copy, name)
+        self.assertEqual(self.read(copy), b"meow")
+        self.assertEqual(self.storage.cache_stats()["hits"], 1)
+
+    def test_other_files_are_read_every_time(self):
+        name = self.storage.save("cat.png", ContentFile(b"meow"))
+        self.read(name)
+        # Deleted and stored again by another host, this one reading it next.
+        self.backend.delete(name)
+        self.assertEqual(self.backend.save("cat.png", ContentFile(b"purr purr")), name)
+
+        self.assertEqual(self.read(name), b"purr purr")
+        self.assertIsNone(self.storage.cache_path(name))
+        self.assertEqual(self.cached(), [])
+
+    def test_s3_hits_make_no_requests(self):
+        backend = PooledS3Storage(access_key="key", secret_key="secret", bucket_name="images")
+        storage = ReadThroughCacheStorage(backend=backend, location=self.storage.location)
+        name = self.save_blob(b"meow")
+        self.read(name)
+
+        with Stubber(backend.client) as stubber, storage.open(name) as file:
+            self.assertEqual(file.read(), b"meow")
+        stubber.assert_no_pending_responses()
+
+    def test_least_recently_used_entries_are_evicted(self):
+        names = [self.save_blob(bytes([i]) * 100) for i in range(10)]
+        for i, name in enumerate(names):
+            self.read(name)
+            os.utime(self.storage.cache_path(name), (i, i))
+        # Used again, so it is kept.
+        os.utime(self.storage.cache_path(names[0]), (100, 100))
+
+        self.read(self.save_blob(bytes([10]) * 100))
+
+        remaining = {name for name in names if os.path.exists(self.storage.cache_path(name))}
+        self.assertEqual(remaining, {names[0]} | set(names[3:]))
+        self.assertEqual(self.storage.cache_stats()["size"], 900)
+
+    def test_large_files_are_not_cached(self):
+        name = self.save_blob(bytes(101))
+
+        self.assertEqual(self.read(name), bytes(101))
+        self.assertEqual(self.cached(), [])
+
+    def test_failed_reads_leave_nothing_behind(self):
+        name = self.save_blob(b"meow")
+
+        with mock.patch.object(ContentFile, "chunks", side_effect=OSError), mock.patch.object(
+            self.backend, "open", return_value=ContentFile(b"meow")
+        ):
+            with self.assertRaises(OSError):
+                self.read(name)
+
+        self.assertEqual(self.cached(), [])
+
+    def test_anything_else_is_the_backends(self):
+        name = self.storage.save("cat.png", ContentFile(b"meow"))
+
+        self.assertEqual(name, "cat.png")
+        self.assertEqual(self.storage.url(name), "/media/cat.png")
+        self.assertEqual(self.storage.path(name), self.backend.path(name))
+        self.assertEqual(self.storage.base_location, self.backend.base_location)
+        self.assertIsInstance(DirectUploads.for_storage(self.storage), FileSystemDirectUploads)
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="images.storage.ReadThroughCacheStorage")
+@override_settings(IMAGES_STORAGE_CACHE_BACKEND="django.core.files.storage.FileSystemStorage")
+@override_settings(IMAGES_STORAGE_CACHE_DIR=TemporaryDirectory().name)
+class ReadThroughCacheStorageIntegrationTests(APITestCase):
+    def test_exports_read_the_cache(self):
+        user = UserFactory.create()
+        UserImageFactory.create(owner=user, image=TestUtils.create_unique_image_file("cat.png"))
+        headers = TestUtils.generate_user_auth_headers(user)
+
+        for _ in range(2):
+            response = self.client.get(path=reverse("images_api:export_images"), **headers)
+            b"".join(response.streaming_content)
+
+        self.assertEqual(default_storage.cache_stats()["hits"], 1)
+        self.assertEqual(default_storage.cache_stats()["misses"], 1)
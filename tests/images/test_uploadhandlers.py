@@ -0,0 +1,52 @@
+import hashlib
+from tempfile import TemporaryDirectory
+
+from django.core.files.storage import FileSystemStorage
+from django.test import SimpleTestCase
+from images.headers import ImageInfo
+from images.uploadhandlers import StoredUploadedFile, StreamingImageUploadHandler
+
+
+class StreamingImageUploadHandlerTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.storage = FileSystemStorage(location=self.directory.name)
+        self.handler = StreamingImageUploadHandler(storage=self.storage)
+        self.contents = open("tests/test_image.png", "rb").read()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def upload(self, chunk_size=100):
+        self.handler.new_file("image", "streamed.png", "image/png", len(self.contents))
+        for start in range(0, len(self.contents), chunk_size):
+            self.assertIsNone(self.handler.receive_data_chunk(self.contents[start : start + chunk_size], start))
+
+    def test_file_is_streamed_to_storage(self):
+        self.upload()
+        uploaded = self.handler.file_complete(len(self.contents))
+
+        self.assertIsInstance(uploaded, StoredUploadedFile)
+        self.assertEqual(uploaded.name, "streamed.png")
+        self.assertEqual(uploaded.storage_name, "streamed.png")
+        self.assertEqual(uploaded.size, len(self.contents))
+        self.assertEqual(uploaded.sha256, hashlib.sha256(self.contents).hexdigest())
+        self.assertEqual(uploaded.image_info, ImageInfo("image/png", 17, 14))
+        with self.storage.open("streamed.png") as stored:
+            self.assertEqual(stored.read(), self.contents)
+
+        # Reading the upload fetches it back from storage.
+        self.assertEqual(uploaded.read(), self.contents)
+        uploaded.close()
+
+    def test_interrupted_upload_is_removed_from_storage(self):
+        self.upload()
+        self.handler.upload_interrupted()
+
+        self.assertFalse(self.storage.exists("streamed.png"))
+
+    def test_discarded_upload_is_removed_from_storage(self):
+        self.upload()
+        self.handler.file_complete(len(self.contents)).discard()
+
+        self.assertFalse(self.storage.exists("streamed.png"))
@@ -0,0 +1,103 @@
+from tempfile import TemporaryDirectory
+from urllib.parse import parse_qs, urlparse
+
+from django.db import connection
+from django.test import SimpleTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from images import url_signing
+from rest_framework import status
+from rest_framework.test import APITestCase
+from tests.account.test_models import UserFactory
+from tests.images.test_models import UserImageFactory
+from tests.testutils import TestUtils
+
+
+@override_settings(IMAGES_URL_SIGNING_WINDOW=3600, IMAGES_URL_SIGNING_KEY="key", IMAGES_SIGNED_URL_BASE="")
+class URLSigningTests(SimpleTestCase):
+    def test_urls_are_stable_within_a_window(self):
+        self.assertEqual(url_signing.sign("a.png", now=7200), url_signing.sign("a.png", now=10799))
+        self.assertNotEqual(url_signing.sign("a.png", now=7200), url_signing.sign("a.png", now=10800))
+        self.assertEqual(url_signing.sign("a.png", now=7200)["expires"], "14400")
+
+    def test_verify(self):
+        params = url_signing.sign("a.png", now=7200)
+
+        self.assertTrue(url_signing.verify("a.png", params["expires"], params["signature"], now=14399))
+        self.assertFalse(url_signing.verify("a.png", params["expires"], params["signature"], now=14400))
+        self.assertFalse(url_signing.verify("b.png", params["expires"], params["signature"], now=7200))
+        self.assertFalse(url_signing.verify("a.png", "21600", params["signature"], now=7200))
+        self.assertFalse(url_signing.verify("a.png", "soon", params["signature"], now=7200))
+        self.assertFalse(url_signing.verify("a.png", params["expires"], None, now=7200))
+
+    def test_verify_rejects_far_expiries(self):
+        """A leaked key could mint long-lived URLs, but a valid signature alone does not extend their life."""
+        expires = 7200 + 3 * 3600
+
+        signature = url_signing.signature("a.png", expires)
+
+        self.assertFalse(url_signing.verify("a.png", expires, signature, now=7200))
+
+    def test_key_rotation_invalidates_urls(self):
+        params = url_signing.sign("a.png", now=7200)
+
+        with override_settings(IMAGES_URL_SIGNING_KEY="rotated"):
+            self.assertFalse(url_signing.verify("a.png", params["expires"], params["signature"], now=7200))
+
+    @override_settings(IMAGES_URL_SIGNING_KEY="")
+    def test_key_derived_from_secret_key(self):
+        params = url_signing.sign("a.png", now=7200)
+
+        self.assertTrue(url_signing.verify("a.png", params["expires"], params["signature"], now=7200))
+        with override_settings(SECRET_KEY="other"):
+            self.assertFalse(url_signing.verify("a.png", params["expires"], params["signature"], now=7200))
+
+    @override_settings(IMAGES_SIGNED_URL_BASE="https://cdn.example.com/images/")
+    def test_signed_url_on_cdn(self):
+        url = urlparse(url_signing.signed_url("direct/a b.png", now=7200))
+
+        self.assertEqual((url.netloc, url.path), ("cdn.example.com", "/images/direct/a%20b.png"))
+        self.assertEqual(parse_qs(url.query)["expires"], ["14400"])
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class SignedFileViewTests(APITestCase):
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.image = UserImageFactory.create(
+            owner=self.user, image=TestUtils.create_unique_image_file("secret.png"), private=True
+        )
+
+    def test_private_image_url_is_signed(self):
+        response = self.client.get(reverse("images_api:my_image"), **TestUtils.generate_user_auth_headers(self.user))
+
+        url = urlparse(response.json()["results"][0]["image"])
+        self.assertEqual(url.path, reverse("images_api:signed_file", args=[self.image.image.name]))
+        self.assertEqual(set(parse_qs(url.query)), {"expires", "signature"})
+
+    def test_serve_signed_file(self):
+        self.image.image.seek(0)
+        contents = self.image.image.read()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url_signing.signed_url(self.image.image.name))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), contents)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertIn("public", response["Cache-Control"])
+        self.assertEqual(len(queries), 0)
+
+    def test_serve_with_invalid_signature(self):
+        url = urlparse(url_signing.signed_url(self.image.image.name))
+        params = parse_qs(url.query)
+
+        response = self.client.get(url.path, {"expires": params["expires"][0], "signature": "forged"})
+
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_serve_signed_missing_file(self):
+        response = self.client.get(url_signing.signed_url("missing.png"))
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
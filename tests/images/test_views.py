@@ -1,9 +1,14 @@
+import hashlib
 from tempfile import TemporaryDirectory
 
 from django.contrib.auth.models import User
-from django.test.utils import override_settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.urls import reverse
-from images.models import UserImage
+from images.models import ImageBlob, UserImage, numbered_name
+from images.url_signing import signed_url
 from rest_framework import status
 from rest_framework.test import APITestCase
 from tests.account.test_models import UserFactory
@@ -36,6 +41,10 @@ class AddImageViewTests(CustomTestCase, APITestCase):
 
         # Image was created
         self.assertEqual(UserImage.objects.count(), 1)
+        # The file is stored under a name derived from its contents, the upload streamed to storage is removed.
+        digest = hashlib.sha256(TestUtils.create_temp_file("test.png").read()).hexdigest()
+        self.assertRegex(UserImage.objects.get().image.name, r"^blobs/{}(_\w+)?\.png$".format(digest))
+        self.assertFalse(default_storage.exists("test.png"))
 
         # Check response
         self.assertEqual(
@@ -44,9 +53,13 @@ class AddImageViewTests(CustomTestCase, APITestCase):
                 {
                     "owner": "shols",
                     "name": "test.png",
-                    "image": "/media/test.png",
+                    "image": signed_url(UserImage.objects.get().image.name),
                     "times_shared": 0,
                     "size": 1049,
+                    "width": 17,
+                    "height": 14,
+                    "content_type": "image/png",
+                    "derivatives": {},
                 }
             ],
         )
@@ -69,8 +82,137 @@ class AddImageViewTests(CustomTestCase, APITestCase):
         # Verify response status
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
-        # Image was not created.
+        # Image was not created, and the streamed upload was removed from storage.
         self.assertEqual(UserImage.objects.count(), 0)
+        self.assertFalse(default_storage.exists("test.gif"))
+
+    def test_add_file_which_is_not_an_image_results_in_failure(self):
+        """Ensure files are recognized as images by their contents, not their extension."""
+        response = self.client.post(
+            path=reverse("images_api:add_image"),
+            data={"image": SimpleUploadedFile("fake.png", b"definitely not an image", content_type="image/png")},
+            **TestUtils.generate_user_auth_headers(self.user),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(UserImage.objects.count(), 0)
+        self.assertFalse(default_storage.exists("fake.png"))
+
+    @override_settings(IMAGES_MAX_PIXELS=100)
+    def test_add_image_with_too_many_pixels_results_in_failure(self):
+        response = self.client.post(
+            path=reverse("images_api:add_image"),
+            data={"image": TestUtils.create_unique_image_file("huge.png", size=(20, 20))},
+            **TestUtils.generate_user_auth_headers(self.user),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            response.json(),
+            [{"file": "huge.png", "status": 400, "errors": {"image": ["The image may have at most 100 pixels."]}}],
+        )
+        self.assertEqual(UserImage.objects.count(), 0)
+        self.assertFalse(default_storage.exists("huge.png"))
+
+    def test_add_images_in_a_batch(self):
+        """Add several images in one request, the number of queries does not grow with the batch."""
+        TestUtils.authenticate_in_advance(self.user)
+        with CaptureQueriesContext(connection) as small_batch:
+            response = self.client.post(
+                path=reverse("images_api:add_image"),
+                data={"image": [TestUtils.create_unique_image_file(f"small{i}.png") for i in range(2)]},
+                **TestUtils.generate_user_auth_headers(self.user),
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        with CaptureQueriesContext(connection) as large_batch:
+            response = self.client.post(
+                path=reverse("images_api:add_image"),
+                data={"image": [TestUtils.create_unique_image_file(f"large{i}.png") for i in range(6)]},
+                **TestUtils.generate_user_auth_headers(self.user),
+            )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        self.assertEqual(len(large_batch), len(small_batch))
+        self.assertEqual(UserImage.objects.count(), 8)
+        self.assertEqual(ImageBlob.objects.count(), 8)
+        self.assertEqual([image["name"] for image in response.json()], [f"large{i}.png" for i in range(6)])
+
+    def test_add_images_with_some_invalid_files_reports_each_file(self):
+        """Valid images of a batch are added, and the result of every file is reported."""
+        response = self.client.post(
+            path=reverse("images_api:add_image"),
+            data={
+                "image": [
+                    TestUtils.create_unique_image_file("valid.png"),
+                    TestUtils.create_temp_file("invalid.gif"),
+                ]
+            },
+            **TestUtils.generate_user_auth_headers(self.user),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(UserImage.objects.count(), 1)
+
+        valid, invalid = response.json()
+        self.assertEqual(valid["file"], "valid.png")
+        self.assertEqual(valid["status"], status.HTTP_201_CREATED)
+        self.assertEqual(valid["image"]["name"], "valid.png")
+        self.assertEqual(invalid["file"], "invalid.gif")
+        self.assertEqual(invalid["status"], status.HTTP_400_BAD_REQUEST)
+        self.assertIn("image", invalid["errors"])
+
+    def test_add_duplicate_image_is_stored_once(self):
+        """Uploading the same contents twice stores a single file, which tells nothing of the first upload."""
+        responses = []
+        for user, name in [(self.user, "first_secret.png"), (UserFactory.create(username="user2"), "second.png")]:
+            response = self.client.post(
+                path=reverse("images_api:add_image"),
+                data={"image": TestUtils.create_temp_file(name), "private": True},
+                **TestUtils.generate_user_auth_headers(user),
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            responses.append(response.json()[0])
+
+        self.assertEqual(UserImage.objects.count(), 2)
+        blob = ImageBlob.objects.get()
+        self.assertRegex(blob.file.name, r"^blobs/{}(_\w+)?\.png$".format(blob.digest))
+        # Both uploads were streamed to storage, then removed once stored as the blob or found to be a duplicate.
+        self.assertFalse(default_storage.exists("first_secret.png"))
+        self.assertFalse(default_storage.exists("second.png"))
+        self.assertEqual(responses[1]["name"], "second.png")
+        # Signed URLs to the same file, whoever uploaded it first.
+        self.assertEqual(responses[0]["image"], responses[1]["image"])
+        self.assertNotIn("secret", responses[1]["image"])
+
+    def test_add_image_the_user_already_has_results_in_conflict(self):
+        """A user holds each image once, whether it was uploaded before or earlier in the same batch."""
+        self.client.post(
+            path=reverse("images_api:add_image"),
+            data={"image": TestUtils.create_temp_file("first.png")},
+            **TestUtils.generate_user_auth_headers(self.user),
+        )
+
+        response = self.client.post(
+            path=reverse("images_api:add_image"),
+            data={
+                "image": [
+                    TestUtils.create_temp_file("again.png"),
+                    TestUtils.create_unique_image_file("new.png"),
+                    TestUtils.create_unique_image_file("new.png"),
+                ]
+            },
+            **TestUtils.generate_user_auth_headers(self.user),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [result["status"] for result in response.json()],
+            [status.HTTP_409_CONFLICT, status.HTTP_201_CREATED, status.HTTP_201_CREATED],
+        )
+        self.assertEqual(response.json()[0]["errors"], {"image": ["You already have this image."]})
+        self.assertEqual(UserImage.objects.count(), 3)
+        self.assertFalse(default_storage.exists("again.png"))
 
 
 @override_settings(MEDIA_ROOT=TemporaryDirectory().name)
@@ -89,12 +231,16 @@ class ShareImageViewTests(CustomTestCase, APITestCase):
         # user_2 has no image named file.png
         self.assertFalse(UserImage.objects.filter(image=self.user_1_image.image.name, owner=self.user_2).exists())
 
-        # Create the image.
-        response = self.client.post(
-            path=reverse("images_api:share_image"),
-            data={"image_name": self.user_1_image.image.name, "target_user": "user2"},
-            **TestUtils.generate_user_auth_headers(self.user_1),
-        )
+        # Create the image. Authentication, one lookup of both the image and the target user, then a single
+        # savepoint inserting the copy and its index entries, incrementing the blob's and the image's counters, and
+        # the statistics of both users in one upsert.
+        headers = TestUtils.generate_user_auth_headers(self.user_1)
+        with self.assertNumQueries(9):
+            response = self.client.post(
+                path=reverse("images_api:share_image"),
+                data={"image_name": self.user_1_image.name, "target_user": "user2"},
+                **headers,
+            )
 
         # Verify response status
         self.assertEqual(response.status_code, status.HTTP_200_OK)
@@ -105,7 +251,7 @@ class ShareImageViewTests(CustomTestCase, APITestCase):
         # Check response
         self.assertEqual(
             response.json(),
-            {"message": f"{self.user_1_image.image.name} has been succesfully shared to user2"},
+            {"message": f"{self.user_1_image.name} has been succesfully shared to user2"},
         )
 
         # Get updated instance from database.
@@ -114,6 +260,40 @@ class ShareImageViewTests(CustomTestCase, APITestCase):
         # Confirm times_shared of user_1_image was updated. from 0 to 1.
         self.assertEqual(self.user_1_image.times_shared, 1)
 
+        # The shared image refers to the same stored file.
+        self.user_1_image.blob.refresh_from_db()
+        self.assertEqual(self.user_1_image.blob.ref_count, 2)
+
+    def test_share_image_twice_results_in_error(self):
+        """Sharing an image the target user already has is rejected, and not counted."""
+        headers = TestUtils.generate_user_auth_headers(self.user_1)
+        data = {"image_name": self.user_1_image.name, "target_user": "user2"}
+        self.client.post(path=reverse("images_api:share_image"), data=data, **headers)
+
+        # The token was cached by the first request. One lookup of both the image and the target user, then the
+        # insert of the copy fails within its savepoint, before anything else is written, and a lookup tells it
+        # failed on the image rather than its name.
+        with self.assertNumQueries(6):
+            response = self.client.post(path=reverse("images_api:share_image"), data=data, **headers)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"message": "Sorry, but this user already has this image. Try another one."})
+        self.assertEqual(UserImage.objects.filter(owner=self.user_2).count(), 1)
+        self.user_1_image.refresh_from_db()
+        self.assertEqual(self.user_1_image.times_shared, 1)
+        self.user_1_image.blob.refresh_from_db()
+        self.assertEqual(self.user_1_image.blob.ref_count, 2)
+
+    def test_share_image_to_unknown_user_results_in_error(self):
+        response = self.client.post(
+            path=reverse("images_api:share_image"),
+            data={"image_name": self.user_1_image.name, "target_user": "nobody"},
+            **TestUtils.generate_user_auth_headers(self.user_1),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(UserImage.objects.count(), 1)
+
     def test_share_another_users_image_error(self):
         """Ensure attempt to share an image created by another user rsults in error."""
 
@@ -126,7 +306,7 @@ class ShareImageViewTests(CustomTestCase, APITestCase):
         # Create the image.
         response = self.client.post(
             path=reverse("images_api:share_image"),
-            data={"image_name": self.user_1_image.image.name, "target_user": "user3"},
+            data={"image_name": self.user_1_image.name, "target_user": "user3"},
             **TestUtils.generate_user_auth_headers(self.user_2),  # Here we try to share it using user2 credentials
         )
 
@@ -167,6 +347,176 @@ class ShareImageViewTests(CustomTestCase, APITestCase):
         )
 
 
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class BulkShareImageViewTests(CustomTestCase, APITestCase):
+    def setUp(self):
+        self.maxDiff = None
+        self.owner = UserFactory.create()
+        self.targets = [UserFactory.create(username=f"target{i}") for i in range(3)]
+        self.images = [
+            UserImageFactory.create(owner=self.owner, image=TestUtils.create_unique_image_file(f"team{i}.png"))
+            for i in range(3)
+        ]
+
+    def share(self, image_names, target_users):
+        return self.client.post(
+            path=reverse("images_api:share_images"),
+            data={"image_names": image_names, "target_users": target_users},
+            format="json",
+            **TestUtils.generate_user_auth_headers(self.owner),
+        )
+
+    def test_share_images_to_users(self):
+        """Every image is shared to every user."""
+        response = self.share([image.name for image in self.images[:2]], ["target0", "target1"])
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()), 4)
+        self.assertEqual({result["status"] for result in response.json()}, {status.HTTP_200_OK})
+        for target in self.targets[:2]:
+            self.assertCountEqual(
+                UserImage.objects.filter(owner=target).values_list("name", flat=True),
+                [image.name for image in self.images[:2]],
+            )
+        for image in self.images[:2]:
+            image.refresh_from_db()
+            image.blob.refresh_from_db()
+            self.assertEqual(image.times_shared, 2)
+            self.assertEqual(image.blob.ref_count, 3)
+
+    def test_share_images_queries_do_not_grow_with_the_batch(self):
+        TestUtils.authenticate_in_advance(self.owner)
+        with CaptureQueriesContext(connection) as single:
+            self.share([self.images[0].name], ["target0"])
+        with CaptureQueriesContext(connection) as batch:
+            self.share([image.name for image in self.images[1:]], ["target0", "target1", "target2"])
+
+        self.assertEqual(len(batch), len(single))
+        self.assertEqual(UserImage.objects.exclude(owner=self.owner).count(), 7)
+
+    def test_share_images_reports_each_pair(self):
+        """Pairs which cannot be shared are reported, the others are still shared."""
+        self.share([self.images[0].name], ["target0"])
+
+        response = self.share([self.images[0].name, "missing.png"], ["target0", "target1", "nobody", "shols"])
+
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(
+            [(result["image_name"], result["target_user"], result["status"]) for result in response.json()],
+            [
+                (self.images[0].name, "target0", status.HTTP_409_CONFLICT),
+                (self.images[0].name, "target1", status.HTTP_200_OK),
+                (self.images[0].name, "nobody", status.HTTP_404_NOT_FOUND),
+                (self.images[0].name, "shols", status.HTTP_400_BAD_REQUEST),
+                ("missing.png", "target0", status.HTTP_404_NOT_FOUND),
+                ("missing.png", "target1", status.HTTP_404_NOT_FOUND),
+                ("missing.png", "nobody", status.HTTP_404_NOT_FOUND),
+                ("missing.png", "shols", status.HTTP_404_NOT_FOUND),
+            ],
+        )
+        self.images[0].refresh_from_db()
+        self.assertEqual(self.images[0].times_shared, 2)
+
+    def test_share_images_when_none_can_be_shared_results_in_error(self):
+        response = self.share(["missing.png"], ["target0"])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()[0]["message"], "You have no image named missing.png.")
+
+    @override_settings(IMAGES_SHARE_BATCH_MAX_PAIRS=4)
+    def test_share_too_many_images_results_in_error(self):
+        response = self.share([image.name for image in self.images], ["target0", "target1"])
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"non_field_errors": ["At most 4 images can be shared in one request."]})
+        self.assertEqual(UserImage.objects.count(), 3)
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ImageNameTests(CustomTestCase, APITestCase):
+    """Images are shared by name, so an owner's image names are unique."""
+
+    def setUp(self):
+        self.owner = UserFactory.create()
+        self.other = UserFactory.create(username="other")
+        self.target = UserFactory.create(username="target")
+
+    def upload(self, user, file):
+        response = self.client.post(
+            path=reverse("images_api:add_image"), data={"image": file}, **TestUtils.generate_user_auth_headers(user)
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.json()[0]["name"]
+
+    def names(self, user):
+        return sorted(UserImage.objects.filter(owner=user).values_list("name", flat=True))
+
+    def test_uploads_of_a_taken_name_are_numbered(self):
+        contents = TestUtils.create_unique_image_file("x.png").read()
+        self.upload(self.other, SimpleUploadedFile("x.png", contents, content_type="image/png"))
+        # Stored as the other user's file, but named as uploaded.
+        self.assertEqual(
+            self.upload(self.owner, SimpleUploadedFile("y.png", contents, content_type="image/png")), "y.png"
+        )
+
+        self.assertEqual(self.upload(self.owner, TestUtils.create_unique_image_file("y.png")), "y (2).png")
+        self.assertEqual(self.names(self.owner), ["y (2).png", "y.png"])
+
+        response = self.client.post(
+            path=reverse("images_api:share_image"),
+            data={"image_name": "y.png", "target_user": "target"},
+            **TestUtils.generate_user_auth_headers(self.owner),
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        shared = UserImage.objects.get(owner=self.target)
+        self.assertEqual(shared.name, "y.png")
+        self.assertEqual(shared.image.name, UserImage.objects.get(owner=self.other).image.name)
+
+    def test_saved_images_of_a_taken_name_are_numbered(self):
+        contents = TestUtils.create_unique_image_file("cat.png").read()
+        UserImage(owner=self.other, image=SimpleUploadedFile("cat.png", contents)).save()
+        UserImage(owner=self.owner, image=SimpleUploadedFile("dog.png", contents)).save()
+
+        UserImage(owner=self.owner, image=TestUtils.create_unique_image_file("dog.png")).save()
+
+        self.assertEqual(self.names(self.owner), ["dog (2).png", "dog.png"])
+
+    def test_shares_of_a_taken_name_are_numbered(self):
+        first = UserImageFactory.create(owner=self.owner, image=TestUtils.create_unique_image_file("a.png"))
+        second = UserImageFactory.create(owner=self.owner, image=TestUtils.create_unique_image_file("b.png"))
+        # Other images the target users gave the same names.
+        UserImage.objects.bulk_create(
+            [
+                UserImage(owner=user, image="{}-{}".format(user.username, name), name=name, size=1)
+                for user in (self.other, self.target)
+                for name in (first.name, second.name)
+            ]
+        )
+        headers = TestUtils.generate_user_auth_headers(self.owner)
+
+        response = self.client.post(
+            path=reverse("images_api:share_image"), data={"image_name": first.name, "target_user": "other"}, **headers
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.post(
+            path=reverse("images_api:share_images"),
+            data={"image_names": [first.name, second.name], "target_users": ["target"]},
+            format="json",
+            **headers,
+        )
+        self.assertEqual({result["status"] for result in response.json()}, {status.HTTP_200_OK})
+
+        self.assertEqual(
+            UserImage.objects.get(owner=self.other, image=first.image.name).name, numbered_name(first.name, 2)
+        )
+        shared = UserImage.objects.filter(owner=self.target, blob__isnull=False).order_by("name")
+        self.assertEqual(
+            [image.name for image in shared], [numbered_name(first.name, 2), numbered_name(second.name, 2)]
+        )
+
+
 @override_settings(MEDIA_ROOT=TemporaryDirectory().name)
 @override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
 class SearchImageViewTests(CustomTestCase, APITestCase):
@@ -178,13 +528,13 @@ class SearchImageViewTests(CustomTestCase, APITestCase):
         self.user_1_image_private = UserImageFactory.create(
             owner=self.user_1,
             private=True,
-            image=TestUtils.create_temp_file("file2.png"),
+            image=TestUtils.create_unique_image_file("file2.png"),
         )
         self.user_2_image_public = UserImageFactory.create(
             owner=self.user_2, image=TestUtils.create_temp_file("file3.png")
         )
         self.user_2_image_public_2 = UserImageFactory.create(
-            owner=self.user_2, image=TestUtils.create_temp_file("unique_name.png")
+            owner=self.user_2, image=TestUtils.create_unique_image_file("unique_name.png")
         )
 
     def test_search_images_success(self):
@@ -204,33 +554,77 @@ class SearchImageViewTests(CustomTestCase, APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Check response
-        self.assertEqual(
-            response.json(),
+        self.assertEqual(response.json()["count"], 3)
+        self.assertCountEqual(
+            response.json()["results"],
             [
                 {
                     "owner": "shols",
-                    "name": f"{self.user_1_image_public.image.name}",
-                    "image": f"/media/{self.user_1_image_public.image.name}",
+                    "name": f"{self.user_1_image_public.name}",
+                    "image": signed_url(self.user_1_image_public.image.name),
                     "times_shared": 0,
                     "size": 1049,
+                    "width": 17,
+                    "height": 14,
+                    "content_type": "image/png",
+                    "derivatives": {},
                 },
                 {
                     "owner": "shols",
-                    "name": f"{self.user_1_image_private.image.name}",
-                    "image": f"/media/{self.user_1_image_private.image.name}",
+                    "name": f"{self.user_1_image_private.name}",
+                    "image": signed_url(self.user_1_image_private.image.name),
                     "times_shared": 0,
-                    "size": 1049,
+                    "size": self.user_1_image_private.size,
+                    "width": 8,
+                    "height": 8,
+                    "content_type": "image/png",
+                    "derivatives": {},
                 },
                 {
                     "owner": "user2",
-                    "name": f"{self.user_2_image_public.image.name}",
-                    "image": f"/media/{self.user_2_image_public.image.name}",
+                    "name": f"{self.user_2_image_public.name}",
+                    "image": signed_url(self.user_2_image_public.image.name),
                     "times_shared": 0,
                     "size": 1049,
+                    "width": 17,
+                    "height": 14,
+                    "content_type": "image/png",
+                    "derivatives": {},
                 },
             ],
         )
 
+    def test_search_images_ranks_closest_names_first(self):
+        """Names that start with the query rank above names that merely contain it."""
+        contains_unique = UserImageFactory.create(
+            owner=self.user_2, image=TestUtils.create_unique_image_file("a_unique.png")
+        )
+
+        response = self.client.get(
+            path=reverse("images_api:search_image"),
+            data={"name": "unique"},
+            **TestUtils.generate_user_auth_headers(self.user_1),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [image["name"] for image in response.json()["results"]],
+            [self.user_2_image_public_2.name, contains_unique.name],
+        )
+
+    def test_search_images_paginates(self):
+        """Search results are split into pages."""
+        response = self.client.get(
+            path=reverse("images_api:search_image"),
+            data={"name": "file", "page_size": 2},
+            **TestUtils.generate_user_auth_headers(self.user_1),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()["count"], 3)
+        self.assertEqual(len(response.json()["results"]), 2)
+        self.assertIsNotNone(response.json()["next"])
+
     def test_private_images_do_not_show_when_searched_if_not_owned_by_the_user(self):
         """Search for images."""
 
@@ -249,4 +643,86 @@ class SearchImageViewTests(CustomTestCase, APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
         # Check response
-        self.assertEqual(response.json(), [])
+        self.assertEqual(response.json()["results"], [])
+
+
+@override_settings(MEDIA_ROOT=TemporaryDirectory().name)
+@override_settings(DEFAULT_FILE_STORAGE="django.core.files.storage.FileSystemStorage")
+class ListImageViewTests(CustomTestCase, APITestCase):
+    def setUp(self):
+        self.maxDiff = None
+        self.user_1 = UserFactory.create()
+        self.user_2 = UserFactory.create(username="user2")
+        self.user_1_images = [
+            UserImageFactory.create(owner=self.user_1, image=TestUtils.create_unique_image_file(f"list{i}.png"))
+            for i in range(5)
+        ]
+        UserImageFactory.create(owner=self.user_2, image=TestUtils.create_temp_file("other.png"))
+
+    def test_list_images_paginates_with_cursor(self):
+        """Walk every page of a user's images using the returned cursor."""
+        names = []
+        url = reverse("images_api:my_image")
+        data = {"page_size": 2}
+
+        while url:
+            response = self.client.get(
+                path=url,
+                data=data,
+                **TestUtils.generate_user_auth_headers(self.user_1),
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            body = response.json()
+            self.assertLessEqual(len(body["results"]), 2)
+            names.extend(image["name"] for image in body["results"])
+            url, data = body["next"], None
+
+        # Every image owned by user_1 is returned exactly once, newest first, and none of user_2's.
+        expected = UserImage.objects.filter(owner=self.user_1).order_by("-datetime_created", "-id")
+        self.assertEqual(names, [image.name for image in expected])
+
+    def test_list_images_with_field_projection(self):
+        """Only the requested fields are returned."""
+        response = self.client.get(
+            path=reverse("images_api:my_image"),
+            data={"fields": "name,size"},
+            **TestUtils.generate_user_auth_headers(self.user_1),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.json()["results"]), 5)
+        for image in response.json()["results"]:
+            self.assertEqual(set(image), {"name", "size"})
+
+    def test_list_images_includes_file_metadata(self):
+        """The dimensions and type recorded at upload are listed, and can be projected."""
+        headers = TestUtils.generate_user_auth_headers(self.user_1)
+        listed = self.client.get(path=reverse("images_api:my_image"), **headers).json()["results"]
+        projected = self.client.get(
+            path=reverse("images_api:my_image"), data={"fields": "width,height,content_type"}, **headers
+        ).json()["results"]
+
+        for image in listed:
+            self.assertEqual((image["width"], image["height"], image["content_type"]), (8, 8, "image/png"))
+        self.assertEqual(projected, [{"width": 8, "height": 8, "content_type": "image/png"}] * 5)
+
+    def test_list_images_with_unknown_field_results_in_error(self):
+        """Ensure unknown projected fields are rejected."""
+        response = self.client.get(
+            path=reverse("images_api:my_image"),
+            data={"fields": "name,password"},
+            **TestUtils.generate_user_auth_headers(self.user_1),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {"fields": ["Unknown field(s): password."]})
+
+    def test_list_images_with_invalid_cursor_results_in_error(self):
+        """Ensure a tampered cursor is rejected."""
+        response = self.client.get(
+            path=reverse("images_api:my_image"),
+            data={"cursor": "not-a-cursor"},
+            **TestUtils.generate_user_auth_headers(self.user_1),
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,11 +1,18 @@
 from __future__ import annotations
 
+import io
+import itertools
 from typing import Any, Sequence
 
+from account.authentication import token_cache
+from account.models import AuthToken
 from django.contrib.auth.models import User
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
-from rest_framework.authtoken.models import Token
+from PIL import Image
+
+
+_image_numbers = itertools.count()
 
 
 class CustomTestCase(TestCase):
@@ -88,9 +95,22 @@ class TestUtils:
     @staticmethod
     def generate_user_auth_headers(user: User) -> dict[str, str]:
         """Generate the authentication headers for a logged in partner."""
-        token, _ = Token.objects.get_or_create(user=user)
-        return {"HTTP_AUTHORIZATION": "Token {}".format(token)}
+        token = AuthToken.objects.for_login(user)
+        return {"HTTP_AUTHORIZATION": "Token {}".format(token.key)}
+
+    @staticmethod
+    def authenticate_in_advance(user: User) -> None:
+        """Cache the user's token, as a previous request would, so the next requests do not look it up."""
+        token_cache.set(AuthToken.objects.for_login(user))
 
     @staticmethod
     def create_temp_file(image_name: str):
         return SimpleUploadedFile(f"{image_name}", open('tests/test_image.png', 'rb').read(), content_type="image/png")
+
+    @staticmethod
+    def create_unique_image_file(image_name: str, size: tuple[int, int] = (8, 8)):
+        """Create a PNG upload whose contents differ from every other file, unlike ``create_temp_file``."""
+        number = next(_image_numbers)
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (number >> 16 & 255, number >> 8 & 255, number & 255)).save(buffer, format="PNG")
+        return SimpleUploadedFile(image_name, buffer.getvalue(), content_type="image/png")